@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks
+~~~~~~~~~~
+
+Offline benchmarks of pywebcopy.
+
+A synthetic website of a configurable shape is generated, served from
+the loopback interface and saved with `save_webpage` and `save_website`.
+The json reports are comparable across commits, thus slowdowns of the
+core, elements and parsers modules show up before a release.
+
+usage::
+    $ python -m benchmarks --pages 50 --assets 10 --output report.json
+    $ python -m benchmarks --pages 50 --assets 10 --compare report.json
+
+"""
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+from .run import main
+
+
+sys.exit(main())
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks.micro
+~~~~~~~~~~~~~~~~
+
+Micro benchmarks of the hot paths which run for every link of every
+page: the mapping of urls to files, the relative paths between files,
+the parsing of html and the rewriting of stylesheets.
+
+The inputs are the fixed files in `tests/fixtures`, thus the timings of
+two commits are of the same work. Every benchmark reports the time of a
+single operation, i.e. one url, one pair of paths, one document or one
+stylesheet.
+
+usage::
+    $ python -m benchmarks.micro --output before.json
+    $ git checkout my-branch
+    $ python -m benchmarks.micro --compare before.json
+    $ python -m benchmarks.micro -k css
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+import warnings
+from collections import OrderedDict
+from io import BytesIO
+
+from .run import _commit, _median
+
+
+__all__ = ['BENCHMARKS', 'FIXTURES', 'run_micro', 'compare', 'main']
+
+
+#: Folder of the fixed inputs of the benchmarks
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures')
+
+#: Url of the page all the fixture links are relative to
+BASE_URL = 'http://example.com/dir/page.html'
+BASE_PATH = os.path.join(os.sep, 'tmp', 'pywebcopy-micro', 'example.com')
+
+#: Name of a benchmark -> callable which returns a two-tuple of the
+#: function to time and the number of operations of one call of it
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def fixture(name):
+    """Contents of a fixture file in bytes."""
+    with open(os.path.join(FIXTURES, name), 'rb') as fh:
+        return fh.read()
+
+
+def fixture_urls():
+    return fixture('urls.txt').decode('utf-8').splitlines()
+
+
+@benchmark('urls.URLTransformer.url')
+def _url():
+    from pywebcopy.urls import URLTransformer
+    urls = fixture_urls()
+
+    def run():
+        for u in urls:
+            URLTransformer(u, BASE_URL, BASE_PATH).url
+    return run, len(urls)
+
+
+@benchmark('urls.URLTransformer.file_path')
+def _file_path():
+    from pywebcopy.urls import URLTransformer
+    urls = fixture_urls()
+
+    def run():
+        for u in urls:
+            URLTransformer(u, BASE_URL, BASE_PATH).file_path
+    return run, len(urls)
+
+
+@benchmark('urls.url2path')
+def _url2path():
+    from pywebcopy.urls import URLTransformer, url2path
+    # url2path gets the absolute urls, as the transformer does
+    urls = [URLTransformer(u, BASE_URL, BASE_PATH).url for u in fixture_urls()]
+
+    def run():
+        for u in urls:
+            url2path(u, BASE_URL, BASE_PATH)
+    return run, len(urls)
+
+
+def _path_pairs():
+    from pywebcopy.urls import URLTransformer
+    start = URLTransformer(BASE_URL, BASE_URL, BASE_PATH).file_path
+    return [(URLTransformer(u, BASE_URL, BASE_PATH).file_path, start) for u in fixture_urls()]
+
+
+@benchmark('urls.relate')
+def _relate():
+    from pywebcopy.urls import relate
+    pairs = _path_pairs()
+
+    def run():
+        for target, start in pairs:
+            relate(target, start)
+    return run, len(pairs)
+
+
+@benchmark('parsers.cached_path2url_relate')
+def _cached_relate():
+    from pywebcopy.parsers import cached_path2url_relate
+    pairs = _path_pairs()
+
+    def run():
+        # every call starts from an empty cache, so that they do the same work
+        cached_path2url_relate.cache_clear()
+        for target, start in pairs:
+            cached_path2url_relate(target, start)
+    return run, len(pairs)
+
+
+def _parse(name):
+    from pywebcopy.parsers import BaseIncrementalParser
+    from pywebcopy.urls import URLTransformer
+    html = fixture(name)
+
+    class Parser(BaseIncrementalParser):
+        utx = URLTransformer(BASE_URL, BASE_URL, BASE_PATH)
+
+        def get_source(self):
+            return BytesIO(html)
+
+    def run():
+        with warnings.catch_warnings():
+            # the global configuration is not needed for parsing
+            warnings.simplefilter('ignore')
+            parser = Parser('utf-8')
+        parser.__parse__()
+    return run, 1
+
+
+for _size in ('small', 'medium', 'large'):
+    benchmark('parsers.__parse__[%s]' % _size)(
+        lambda name='page_%s.html' % _size: _parse(name))
+
+
+def _resolve(url):
+    return b'../assets/' + url.rsplit(b'/', 1)[-1]
+
+
+@benchmark('css.rewrite_css')
+def _rewrite_css():
+    from pywebcopy.css import rewrite_css
+    css = fixture('stylesheet_large.css')
+
+    def run():
+        rewrite_css(css, _resolve)
+    return run, 1
+
+
+@benchmark('globals.CSS_URLS_RE+CSS_IMPORTS_RE')
+def _legacy_css():
+    # the two passes of the regexes which stylesheets were rewritten
+    # with before `rewrite_css`, kept as a baseline for it
+    from pywebcopy.globals import CSS_IMPORTS_RE, CSS_URLS_RE
+    css = fixture('stylesheet_large.css')
+
+    def repl(match):
+        url = match.group(1)
+        return match.group(0).replace(url, _resolve(url))
+
+    def run():
+        CSS_IMPORTS_RE.sub(repl, CSS_URLS_RE.sub(repl, css))
+    return run, 1
+
+
+def time_benchmark(name, repeat=5, min_time=0.2):
+    """Times a benchmark with `timeit`.
+
+    :param str name: name of the benchmark, see `BENCHMARKS`
+    :param int repeat: timed rounds, the best and the median of them are reported
+    :param float min_time: least seconds of a round, the number of calls
+        of a round is raised until it takes that long
+    :rtype: dict
+    """
+    func, ops = BENCHMARKS[name]()
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    rounds = [t / number / ops for t in timer.repeat(repeat, number)]
+    return {
+        'ops': ops,
+        'calls': number,
+        'per_op_us': round(min(rounds) * 1e6, 3),
+        'median_us': round(_median(rounds) * 1e6, 3),
+    }
+
+
+def run_micro(names=None, repeat=5, min_time=0.2):
+    """Times the benchmarks.
+
+    :param names: names of the benchmarks to time, all of them if None
+    :param int repeat: timed rounds per benchmark
+    :param float min_time: least seconds of a round
+    :rtype: dict
+    :returns: the report
+    """
+    results = OrderedDict()
+    for name in names or BENCHMARKS:
+        results[name] = time_benchmark(name, repeat, min_time)
+    return {
+        'commit': _commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=0.1):
+    """Compares the per operation timings of two reports.
+
+    :param dict old: earlier report
+    :param dict new: later report
+    :param float threshold: relative slowdown counted as a regression
+    :rtype: tuple
+    :returns: two-tuple of the lines of the comparison and
+        whether any of them is a regression
+    """
+    lines, regressed = [], False
+    for name, after in new.get('results', {}).items():
+        before = old.get('results', {}).get(name)
+        if not before or not before.get('per_op_us'):
+            continue
+        ratio = after['per_op_us'] / before['per_op_us']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag, regressed = '  REGRESSION', True
+        lines.append('%-40s %12.3f -> %12.3f us  (%+.1f%%)%s' % (
+            name, before['per_op_us'], after['per_op_us'], (ratio - 1) * 100, flag))
+    return lines, regressed
+
+
+def _format(report):
+    lines = ['commit %s' % report['commit']]
+    for name, r in report['results'].items():
+        lines.append('%-40s %12.3f us/op  (median %.3f, %d ops x %d calls)' % (
+            name, r['per_op_us'], r['median_us'], r['ops'], r['calls']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.micro', description=__doc__.split('\n\n')[1])
+    parser.add_argument('-k', dest='keyword', action='append', default=[],
+                        help='only run the benchmarks whose name contains this, repeatable')
+    parser.add_argument('--repeat', type=int, default=5, help='timed rounds per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='least seconds of a round')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    parser.add_argument('--output', help='file to write the json report to, stdout by default')
+    parser.add_argument('--compare', metavar='REPORT', help='earlier json report to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown counted as a regression')
+    args = parser.parse_args(argv)
+
+    names = [n for n in BENCHMARKS if not args.keyword or any(k in n for k in args.keyword)]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+    if not names:
+        parser.error('no benchmark matches %s' % ', '.join(args.keyword))
+
+    report = run_micro(names, args.repeat, args.min_time)
+
+    print(_format(report), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as fh:
+            lines, regressed = compare(json.load(fh), report, args.threshold)
+        print('\n'.join(lines), file=sys.stderr)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks.run
+~~~~~~~~~~~~~~
+
+Runs `save_webpage` and `save_website` against a generated website
+served from the loopback interface and reports the pages per second,
+megabytes per second, peak resident memory and wall time as json.
+
+Every run happens in a fresh interpreter, so that the configuration,
+the caches and the peak memory of a run do not leak into the next one.
+
+usage::
+    $ python -m benchmarks.run --pages 100 --page-size 64 --output before.json
+    $ git checkout my-branch
+    $ python -m benchmarks.run --pages 100 --page-size 64 --compare before.json
+
+"""
+
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from .server import SiteServer
+from .site import SiteShape, generate_site
+
+
+__all__ = ['run_benchmarks', 'compare', 'main']
+
+
+MODES = ('page', 'site')
+
+#: Settings of every run, the network is local and robots.txt is missing
+DEFAULT_SETTINGS = {'bypass_robots': True, 'zip_project_folder': False, 'over_write': True}
+
+
+def _peak_rss():
+    """Peak resident memory of the process in bytes, None if unknown."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _saved(folder):
+    pages, files, size = 0, 0, 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if name.endswith('.log') or name.startswith('.'):
+                continue
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+            if name.endswith('.html'):
+                pages += 1
+    return pages, files, size
+
+
+def measure(mode, url, settings):
+    """Saves the page or the website at the url and measures it,
+    in the calling process.
+
+    :param str mode: 'page' for `save_webpage`, 'site' for `save_website`
+    :param str url: url of the generated website
+    :param dict settings: configuration keys of the run
+    :rtype: dict
+    """
+    import pywebcopy.api as api
+    from pywebcopy.scheduler import SCHEDULER
+    from pywebcopy.workers import POOL
+
+    # the saved page is not opened in a browser
+    api.open_new_tab = lambda path: None
+
+    folder = tempfile.mkdtemp(prefix='pywebcopy-bench-')
+    try:
+        cpu, start = time.process_time(), time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if mode == 'page':
+                api.save_webpage(url, folder, project_name='bench', **settings)
+            else:
+                api.save_website(url, folder, project_name='bench', **settings)
+            SCHEDULER.join()
+            POOL.join()
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        pages, files, size = _saved(folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return {
+        'wall_time': wall,
+        'cpu_time': cpu,
+        'pages': pages,
+        'files': files,
+        'bytes': size,
+        'peak_rss': _peak_rss(),
+    }
+
+
+def _run_isolated(mode, url, settings, verbose=False):
+    job = json.dumps({'mode': mode, 'url': url, 'settings': settings})
+    proc = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.run', '--worker', job],
+        stdout=subprocess.PIPE, stderr=None if verbose else subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True,
+    )
+    return json.loads(proc.stdout.decode('utf-8').strip().splitlines()[-1])
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def _summary(runs):
+    wall = _median([r['wall_time'] for r in runs])
+    last = runs[-1]
+    peaks = [r['peak_rss'] for r in runs if r['peak_rss'] is not None]
+    return {
+        'wall_time': round(wall, 4),
+        'cpu_time': round(_median([r['cpu_time'] for r in runs]), 4),
+        'pages': last['pages'],
+        'files': last['files'],
+        'bytes': last['bytes'],
+        'pages_per_sec': round(last['pages'] / wall, 2) if wall else None,
+        'mb_per_sec': round(last['bytes'] / wall / (1 << 20), 3) if wall else None,
+        'peak_rss_mb': round(max(peaks) / (1 << 20), 1) if peaks else None,
+        'runs': runs,
+    }
+
+
+def _commit():
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        out = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=here,
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.decode('utf-8').strip()
+
+
+def run_benchmarks(shape=None, modes=MODES, repeat=3, latency=0.0, settings=None,
+                   site_folder=None, verbose=False):
+    """Generates the website, serves it and runs every mode `repeat` times.
+
+    :param SiteShape shape: shape of the generated website
+    :param modes: modes to run, see `measure`
+    :param int repeat: runs per mode, the median of their wall times is reported
+    :param float latency: seconds every response of the server is delayed by
+    :param dict settings: configuration keys of the runs
+    :param str site_folder: folder of the generated website, a temporary one if None
+    :param bool verbose: whether to show the log output of the runs
+    :rtype: dict
+    :returns: the report
+    """
+    shape = shape or SiteShape()
+    run_settings = dict(DEFAULT_SETTINGS)
+    run_settings.update(settings or {})
+
+    temporary = site_folder is None
+    if temporary:
+        site_folder = tempfile.mkdtemp(prefix='pywebcopy-site-')
+    try:
+        manifest = generate_site(site_folder, shape)
+        results = {}
+        with SiteServer(site_folder, latency) as server:
+            for mode in modes:
+                runs = [_run_isolated(mode, server.url, run_settings, verbose)
+                        for _ in range(repeat)]
+                results[mode] = _summary(runs)
+    finally:
+        if temporary:
+            shutil.rmtree(site_folder, ignore_errors=True)
+
+    return {
+        'commit': _commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'shape': shape._asdict(),
+        'site': {'pages': manifest['pages'], 'files': manifest['files'], 'bytes': manifest['bytes']},
+        'latency': latency,
+        'settings': run_settings,
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=0.1):
+    """Compares two reports of the same site.
+
+    :param dict old: earlier report
+    :param dict new: later report
+    :param float threshold: relative slowdown or growth counted as a regression
+    :rtype: tuple
+    :returns: two-tuple of the lines of the comparison and
+        whether any of them is a regression
+    """
+    lines, regressed = [], False
+    if any(old.get(key) != new.get(key) for key in ('shape', 'settings', 'latency')):
+        lines.append('warning: the reports are of different sites or settings')
+
+    for mode in MODES:
+        if mode not in old.get('results', {}) or mode not in new.get('results', {}):
+            continue
+        before, after = old['results'][mode], new['results'][mode]
+        for key in ('wall_time', 'peak_rss_mb'):
+            if not before.get(key) or after.get(key) is None:
+                continue
+            ratio = after[key] / before[key]
+            flag = ''
+            if ratio > 1 + threshold:
+                flag, regressed = '  REGRESSION', True
+            lines.append('%-4s %-12s %10.3f -> %10.3f  (%+.1f%%)%s' % (
+                mode, key, before[key], after[key], (ratio - 1) * 100, flag))
+    return lines, regressed
+
+
+def _format(report):
+    lines = ['commit %s, %d pages, %d files, %.1f MB' % (
+        report['commit'], report['site']['pages'], report['site']['files'],
+        report['site']['bytes'] / float(1 << 20))]
+    for mode, r in sorted(report['results'].items()):
+        lines.append('%-4s %8.3fs wall %8.3fs cpu %8.2f pages/s %8.3f MB/s  peak rss %s MB' % (
+            mode, r['wall_time'], r['cpu_time'], r['pages_per_sec'] or 0,
+            r['mb_per_sec'] or 0, r['peak_rss_mb']))
+    return '\n'.join(lines)
+
+
+def _setting(text):
+    key, _, value = text.partition('=')
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return key.strip(), value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description=__doc__.split('\n\n')[1])
+    parser.add_argument('--pages', type=int, default=50, help='pages of the website')
+    parser.add_argument('--assets', type=int, default=10, help='images and scripts per page')
+    parser.add_argument('--css-depth', type=int, default=2, help='length of the @import chain per page')
+    parser.add_argument('--page-size', type=int, default=32, help='size of a page in KB')
+    parser.add_argument('--asset-size', type=int, default=4, help='size of an asset in KB')
+    parser.add_argument('--links', type=int, default=4, help='links from a page to other pages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', choices=MODES + ('all',), default='all')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per mode')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of every response in seconds')
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='KEY=VALUE',
+                        help='configuration key of the runs, repeatable')
+    parser.add_argument('--site-folder', help='keep the generated website in this folder')
+    parser.add_argument('--output', help='file to write the json report to, stdout by default')
+    parser.add_argument('--compare', metavar='REPORT', help='earlier json report to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown counted as a regression')
+    parser.add_argument('--verbose', action='store_true', help='show the log output of the runs')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        job = json.loads(args.worker)
+        print(json.dumps(measure(job['mode'], job['url'], job['settings'])))
+        return 0
+
+    shape = SiteShape(args.pages, args.assets, args.css_depth, args.page_size * 1024,
+                      args.asset_size * 1024, args.links, args.seed)
+    modes = MODES if args.mode == 'all' else (args.mode,)
+    report = run_benchmarks(shape, modes, args.repeat, args.latency,
+                            dict(_setting(s) for s in args.settings),
+                            args.site_folder, args.verbose)
+
+    print(_format(report), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as fh:
+            lines, regressed = compare(json.load(fh), report, args.threshold)
+        print('\n'.join(lines), file=sys.stderr)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
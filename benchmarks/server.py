@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks.server
+~~~~~~~~~~~~~~~~~
+
+Local http server of a generated website.
+
+The server runs in a thread of the benchmark runner and not in the
+process being measured, thus it does not take a share of its cpu time
+or memory.
+
+usage::
+    >>> from benchmarks.server import SiteServer
+    >>> with SiteServer('/tmp/bench-site', latency=0.01) as server:
+    ...     print(server.url)
+    http://127.0.0.1:53211/
+
+"""
+
+import functools
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+__all__ = ['SiteServer']
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    #: Seconds every response is delayed by
+    latency = 0.0
+
+    def send_head(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleHTTPRequestHandler.send_head(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class SiteServer(object):
+    """Serves the files of a folder on a free port of the loopback interface.
+
+    :param str folder: folder to serve
+    :param float latency: seconds every response is delayed by, to get
+        closer to the timing of a real server
+    """
+
+    def __init__(self, folder, latency=0.0):
+        self.folder = folder
+        self.latency = latency
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self._server.server_port
+
+    def start(self):
+        handler = type('Handler', (_Handler,), {'latency': self.latency})
+        self._server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), functools.partial(handler, directory=self.folder))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='site-server')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks.site
+~~~~~~~~~~~~~~~
+
+Generator of synthetic websites of a configurable shape.
+
+The generated site only depends on its shape and the seed, thus the
+same site is benchmarked at every commit.
+
+usage::
+    >>> from benchmarks.site import SiteShape, generate_site
+    >>> shape = SiteShape(pages=20, assets=8, css_depth=3, page_size=64 * 1024)
+    >>> manifest = generate_site('/tmp/bench-site', shape)
+    >>> manifest['pages'], manifest['files']
+    (20, 220)
+
+"""
+
+import json
+import os
+import random
+from collections import namedtuple
+
+
+__all__ = ['SiteShape', 'generate_site']
+
+
+SiteShape = namedtuple('SiteShape', 'pages assets css_depth page_size asset_size links seed')
+SiteShape.__new__.__defaults__ = (50, 10, 2, 32 * 1024, 4 * 1024, 4, 0)
+SiteShape.__doc__ = """Shape of a synthetic website.
+
+:param int pages: number of html pages, all reachable from index.html
+:param int assets: number of images and scripts linked by every page
+:param int css_depth: length of the chain of @import of the stylesheet of a page
+:param int page_size: approximate size in bytes of every html page
+:param int asset_size: size in bytes of every image and script
+:param int links: number of links from every page to other pages
+:param int seed: seed of the random text and links
+"""
+
+
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+          'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam').split()
+
+#: Smallest valid png, padded up to the asset size
+_PNG = (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06'
+        b'\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01'
+        b'\x00\x05\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82')
+
+
+def _page_name(i):
+    return 'index.html' if i == 0 else 'page%d.html' % i
+
+
+def _write(path, data):
+    folder = os.path.dirname(path)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path, 'wb') as fh:
+        fh.write(data)
+    return len(data)
+
+
+def _paragraph(rnd, size):
+    words, length = [], 0
+    while length < size:
+        word = rnd.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def _stylesheets(folder, shape, i):
+    """Chain of stylesheets of a page, each imports the next one and
+    uses one of the images of the page as a background."""
+    written = 0
+    for depth in range(shape.css_depth):
+        rules = []
+        if depth + 1 < shape.css_depth:
+            rules.append('@import "p%d-%d.css";' % (i, depth + 1))
+        rules.append('.c%d { background: url("../img/p%d-%d.png") no-repeat; }'
+                     % (depth, i, depth % max(shape.assets, 1)))
+        rules.append('body { margin: %dpx; }' % depth)
+        written += _write(os.path.join(folder, 'css', 'p%d-%d.css' % (i, depth)),
+                          '\n'.join(rules).encode('utf-8'))
+    return written
+
+
+def _page(rnd, shape, i):
+    head = ['<!DOCTYPE html>', '<html lang="en">', '<head>',
+            '<meta charset="utf-8">', '<title>Page %d</title>' % i]
+    if shape.css_depth:
+        head.append('<link rel="stylesheet" href="css/p%d-0.css">' % i)
+    head.append('</head>')
+
+    body = ['<body>', '<div class="nav">']
+    # a tree of pages, so that every page is reachable from the index,
+    # plus random links to make the crawl meet known pages
+    children = [c for c in (2 * i + 1, 2 * i + 2) if c < shape.pages]
+    others = [rnd.randrange(shape.pages) for _ in range(max(shape.links - len(children), 0))]
+    for target in children + others:
+        body.append('<a href="%s">page %d</a>' % (_page_name(target), target))
+    body.append('</div>')
+
+    for a in range(shape.assets):
+        if a % 2:
+            body.append('<script src="js/p%d-%d.js"></script>' % (i, a))
+        else:
+            body.append('<img src="img/p%d-%d.png" alt="image %d">' % (i, a, a))
+
+    size = sum(len(line) for line in head + body)
+    n = 0
+    while size < shape.page_size:
+        text = '<div class="c%d"><p>%s</p></div>' % (n % 4, _paragraph(rnd, 400))
+        body.append(text)
+        size += len(text)
+        n += 1
+    body.extend(['</body>', '</html>'])
+    return '\n'.join(head + body).encode('utf-8')
+
+
+def generate_site(folder, shape=None):
+    """Writes a synthetic website to the folder.
+
+    A `manifest.json` describing the site is written along with it,
+    and the site is not generated again if the manifest matches.
+
+    :param str folder: folder to write the site to
+    :param SiteShape shape: shape of the site
+    :rtype: dict
+    :returns: the manifest of the site
+    """
+    shape = shape or SiteShape()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    try:
+        with open(manifest_path) as fh:
+            manifest = json.load(fh)
+        if manifest['shape'] == shape._asdict():
+            return manifest
+    except (IOError, ValueError, KeyError):
+        pass
+
+    rnd = random.Random(shape.seed)
+    files, size = 0, 0
+    for i in range(shape.pages):
+        size += _write(os.path.join(folder, _page_name(i)), _page(rnd, shape, i))
+        size += _stylesheets(folder, shape, i)
+        files += shape.css_depth
+        for a in range(shape.assets):
+            if a % 2:
+                data = ('var p%d_%d = "%s";\n' % (i, a, 'x' * shape.asset_size)).encode('utf-8')
+                path = os.path.join(folder, 'js', 'p%d-%d.js' % (i, a))
+            else:
+                data = _PNG + rnd.getrandbits(8 * shape.asset_size).to_bytes(shape.asset_size, 'little')
+                path = os.path.join(folder, 'img', 'p%d-%d.png' % (i, a))
+            size += _write(path, data)
+            files += 1
+
+    manifest = {'shape': shape._asdict(), 'pages': shape.pages, 'files': files, 'bytes': size}
+    _write(manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
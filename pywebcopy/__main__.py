@@ -28,6 +28,8 @@ USAGE = textwrap.dedent("""\
             -t                                                  # runs all available tests
             -p  http://example.com/ -d /downloads/              # Save this webPage at /downloads/ folder
             -c  http://example.com/ -d /downloads/              # Save this webSite at /downloads/ folder      
+            --profile                                           # profile the save with cProfile
+            --trace-memory                                      # trace the allocations of the save
         """)
 
 
@@ -37,6 +39,11 @@ def print_usage():
 
 args = sys.argv[1:]
 
+# Profiling switches can be anywhere in the arguments
+switches = {'--profile': 'profile', '--trace-memory': 'trace_memory'}
+kwargs = dict((switches[a], True) for a in args if a in switches)
+args = [a for a in args if a not in switches]
+
 if not args or args[0] not in ('-p', '-c', '-t'):
     print_usage()
     sys.exit(1)
@@ -51,11 +58,11 @@ if args[0] == '-p':
 
     if len(args) == 2:
         print("Saving {!r} in {!r}".format(args[1], os.getcwd()))
-        save_webpage(args[1], os.getcwd())
+        save_webpage(args[1], os.getcwd(), **kwargs)
 
     elif len(args) == 4 and args[2] == '-d':
         print("Saving {!r} in {!r}".format(args[1], args[3]))
-        save_webpage(args[1], args[3])
+        save_webpage(args[1], args[3], **kwargs)
 
     else:
         print_usage()
@@ -68,11 +75,11 @@ elif args[0] == '-c':
 
     if len(args) == 2:
         print("Saving {!r} in {!r}".format(args[1], os.getcwd()))
-        save_website(args[1], os.getcwd())
+        save_website(args[1], os.getcwd(), **kwargs)
 
     elif len(args) == 4 and args[2] == '-d':
         print("Saving {!r} in {!r}".format(args[1], args[3]))
-        save_website(args[1], args[3])
+        save_website(args[1], args[3], **kwargs)
 
     else:
         print_usage()
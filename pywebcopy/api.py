@@ -11,10 +11,15 @@ from __future__ import print_function
 from webbrowser import open_new_tab
 
 from . import LOGGER, config
+from .content_store import CONTENT_STORE
 from .core import zip_project
 from .crawler import Crawler
+from .metrics import METRICS
 from .parsers import deregister_tag_handler
+from .profiling import PROFILER
+from .scheduler import SCHEDULER
 from .webpage import WebPage
+from .workers import POOL
 
 
 def webpage():
@@ -23,6 +28,47 @@ def webpage():
     return WebPage()
 
 
+def dump_metrics():
+    """Writes the metrics of the crawl as `metrics.json` and `metrics.prom`
+    once every download is done, if config['metrics'] is set. They are
+    written to the folder set in config['metrics'], or to the project
+    folder if it is just True.
+
+    :rtype: tuple
+    :returns: paths of the written files, None if disabled
+    """
+    setting = config.get('metrics')
+    if not setting:
+        return None
+
+    SCHEDULER.join()
+    POOL.join()
+    folder = setting if isinstance(setting, str) else config['project_folder']
+    paths = METRICS.dump(folder)
+    LOGGER.info("Metrics of the crawl are written to %s", ', '.join(paths))
+    return paths
+
+
+def start_profile():
+    """Starts profiling the run as set in config['profile'] and
+    config['trace_memory'], see `pywebcopy.profiling`."""
+    PROFILER.start(config['project_folder'], config.get('profile'), config.get('trace_memory'))
+
+
+def stop_profile():
+    """Waits for the downloads and writes the reports of the profiled run.
+
+    :rtype: list
+    :returns: paths of the written reports
+    """
+    if not PROFILER.enabled:
+        return []
+    with PROFILER.phase('downloads'):
+        SCHEDULER.join()
+        POOL.join()
+    return PROFILER.stop()
+
+
 def save_webpage(project_url, project_folder, html=None, project_name=None,
                  encoding=None, reset_config=False, **kwargs):
     """Easiest way to save any single webpage with images, css and js.
@@ -48,10 +94,13 @@ def save_webpage(project_url, project_folder, html=None, project_name=None,
     you are saving different webpages which are located on different servers.
     """
 
-    LOGGER.info("Starting copy of webpage at : %s" % project_url)
+    LOGGER.info("Starting copy of webpage at : %s", project_url)
     html = html
     #: Set up the global configuration
     config.setup_config(project_url, project_folder, project_name, **kwargs)
+    METRICS.reset()
+    CONTENT_STORE.clear()
+    start_profile()
 
     #: Remove the extra files downloading if requested
     if config.get('load_css', False):
@@ -62,26 +111,40 @@ def save_webpage(project_url, project_folder, html=None, project_name=None,
     if config.get('load_images', False):
         deregister_tag_handler('img')
 
-    #: Create a object of webpage
-    wp = webpage()
+    if config.get('engine') == 'asyncio':
+        from .async_engine import AsyncEngine
 
-    if html:
-        #: only set url in manual mode because its internally
-        #: set in the get() method
-        wp.set_source(html, encoding, project_url)
+        #: Fetches the page and its files on an event loop
+        #: and returns after all of them are saved
+        with PROFILER.phase('fetch'):
+            wp = AsyncEngine().save_webpage(project_url, html, encoding)
 
     else:
-        print("Fetching page")
-        wp.get(project_url)
-        print("Page fetched")
+        #: Create a object of webpage
+        wp = webpage()
 
-    # If encoding is specified then change it otherwise a default encoding is
-    # always internally set by the get() method
-    if encoding:
-        wp.encoding = encoding
+        if html:
+            #: only set url in manual mode because its internally
+            #: set in the get() method
+            wp.set_source(html, encoding, project_url)
 
-    # Instruct it to save the complete page
-    wp.save_complete()
+        else:
+            print("Fetching page")
+            with PROFILER.phase('fetch'):
+                wp.get(project_url)
+            print("Page fetched")
+
+        # If encoding is specified then change it otherwise a default encoding is
+        # always internally set by the get() method
+        if encoding:
+            wp.encoding = encoding
+
+        # Instruct it to save the complete page
+        with PROFILER.phase('save'):
+            wp.save_complete()
+
+    stop_profile()
+    dump_metrics()
 
     # Everything is done! Now archive the files and delete the folder afterwards.
     if config['zip_project_folder']:
@@ -121,12 +184,16 @@ def save_website(url, project_folder, project_name=None, **kwargs):
     :type project_name: str | None
     :param project_name: name of the project to distinguish it
     """
+    resume = kwargs.pop('resume', False)
     html = kwargs.pop('html', None)
     if html:
         raise Exception("Website mirroring is not possible from a html string."
                         " Did you mean to use save_webpage() instead?")
 
     config.setup_config(url, project_folder, project_name, **kwargs)
+    METRICS.reset()
+    CONTENT_STORE.clear()
+    start_profile()
 
     #: Remove the extra files downloading if requested
     if config.get('load_css', False):
@@ -140,9 +207,13 @@ def save_website(url, project_folder, project_name=None, **kwargs):
     #: Not assigning to a variable so that it would be easy for garbage
     #: collection
     c = Crawler(url)
-    c.run()
+    with PROFILER.phase('crawl'):
+        c.run(resume=resume)
     path = c.file_path
     del c
+    stop_profile()
+    dump_metrics()
+
     #: This function will zip the files downloaded from the server
     #: and will block until it is done
     if config['zip_project_folder']:
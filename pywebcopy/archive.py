@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.archive
+~~~~~~~~~~~~~~~~~
+
+Zip archive of the project which is written while the files are saved.
+
+The config['archive_mode'] decides how the archive is made:
+
+* 'folder' -- files are saved in the project folder which is zipped at the end
+* 'stream' -- files are saved in the project folder and appended to the
+  archive as soon as each of them is saved
+* 'direct' -- files are appended to the archive without being saved in
+  the project folder at all
+
+usage::
+    >>> from pywebcopy.archive import archive_sink
+    >>> sink = archive_sink()   # None in the 'folder' mode
+    >>> sink.add_file('/path/to/project/site/img/logo.png')
+    >>> sink.close()            # blocks until every file is archived
+
+"""
+
+import atexit
+import fnmatch
+import os
+import threading
+import zipfile
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from shutil import copyfileobj
+
+from six.moves.queue import Queue, Empty
+
+from . import LOGGER
+from .configs import config
+
+
+__all__ = ['ArchiveSink', 'archive_sink', 'compress_type_for', 'is_state_file',
+           'raw_members_supported']
+
+
+#: Files up to this size are compressed in parallel in memory,
+#: larger ones are streamed into the archive by the writer
+PARALLEL_LIMIT = 1024 * 1024
+
+#: Internal state files of a crawl in the project folder which are not archived,
+#: i.e. the crawl journal, the visited stores, the http cache and the robots cache
+STATE_FILES = ('*.part', '.crawl_journal.jsonl', '.*_visited.sqlite*',
+               '.http_cache.sqlite*', '.robots_cache.json*')
+
+
+def is_state_file(file_path):
+    """Tells whether the file is an internal state file of the crawl,
+    see `STATE_FILES` and config['robots_cache'].
+
+    :param str file_path: path of the file
+    :rtype: bool
+    """
+    name = os.path.basename(file_path)
+    if any(fnmatch.fnmatch(name, pattern) for pattern in STATE_FILES):
+        return True
+    robots_cache = config.get('robots_cache')
+    if not isinstance(robots_cache, str):
+        return False
+    robots_cache = os.path.abspath(robots_cache)
+    return os.path.abspath(file_path) in (robots_cache, robots_cache + '.part')
+
+
+def compress_type_for(name):
+    """Compression method of a file in the archive, files which are
+    compressed already (config['stored_file_exts']) are stored as is.
+
+    :param str name: name of the file
+    :rtype: int
+    """
+    ext = os.path.splitext(name)[1].lower()
+    if ext in (config.get('stored_file_exts') or ()):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _size_of(item):
+    if isinstance(item, str):
+        return os.path.getsize(item)
+    item.seek(0, os.SEEK_END)
+    size = item.tell()
+    item.seek(0)
+    return size
+
+
+#: Internals of `zipfile.ZipFile` which `ArchiveSink._write_member` relies on
+_ZIP_INTERNALS = ('_lock', '_seekable', 'start_dir', '_writecheck', '_didModify',
+                  'NameToInfo', 'filelist', 'fp')
+
+
+def raw_members_supported(zf):
+    """Tells whether members which are compressed already can be written
+    to the zip file. This needs internals of `zipfile` which may change in
+    any release, the files are compressed by the writer thread if not.
+
+    :param zipfile.ZipFile zf: zip file opened for writing
+    :rtype: bool
+    """
+    return (all(hasattr(zf, name) for name in _ZIP_INTERNALS) and
+            hasattr(zipfile.ZipInfo, 'FileHeader'))
+
+
+def _set_compress_level(info, level):
+    # public since python 3.13
+    if hasattr(zipfile.ZipInfo, 'compress_level'):
+        info.compress_level = level
+    else:
+        info._compresslevel = level
+
+
+def _member_info(arcname, item):
+    if isinstance(item, str):
+        return zipfile.ZipInfo.from_file(item, arcname)
+    info = zipfile.ZipInfo(arcname, datetime.now().timetuple()[:6])
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _compress(arcname, item, level):
+    """Deflates a small file in memory.
+
+    :returns: two-tuple of the ZipInfo and the raw member data
+    """
+    info = _member_info(arcname, item)
+    if isinstance(item, str):
+        with open(item, 'rb') as fh:
+            data = fh.read()
+    else:
+        try:
+            data = item.read()
+        finally:
+            item.close()
+
+    info.file_size = len(data)
+    info.CRC = zlib.crc32(data) & 0xffffffff
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    packed = compressor.compress(data) + compressor.flush()
+
+    # incompressible data is stored instead
+    if len(packed) < len(data):
+        info.compress_type = zipfile.ZIP_DEFLATED
+    else:
+        info.compress_type, packed = zipfile.ZIP_STORED, data
+    info.compress_size = len(packed)
+    return info, packed
+
+
+class ArchiveSink(object):
+    """Appends files to a zip archive from a single writer thread,
+    thus the workers which save the files never wait on each other.
+
+    Files which are compressed already are stored as is, see
+    `compress_type_for`. Small files of other types are deflated
+    in parallel by a pool of compressor threads (zlib releases the
+    GIL) and the writer copies the compressed members in the order
+    they were added.
+
+    The writer thread is started on demand and stops after being
+    idle for `idle_timeout` seconds.
+
+    :param str path: location of the zip archive
+    :param str root: folder which the names in the archive are relative to
+    :param bool direct: whether the files are written only to the archive
+    :param str mode: 'w' to create a new archive or 'a' to append to an existing one
+    :param float idle_timeout: seconds after which an idle writer stops
+    """
+
+    def __init__(self, path, root, direct=False, mode='w', idle_timeout=1.0):
+        self.path = path
+        self.root = root
+        self.direct = direct
+        self.idle_timeout = idle_timeout
+        self.closed = False
+
+        level = config.get('compression_level')
+        self.level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        workers = config.get('compression_workers') or os.cpu_count() or 1
+
+        self._zip = zipfile.ZipFile(path, mode, zipfile.ZIP_DEFLATED)
+        self._names = set(self._zip.namelist())
+        self._parallel = raw_members_supported(self._zip)
+        if not self._parallel:
+            LOGGER.info("Files are not compressed in parallel, the zipfile module "
+                        "of this python is not supported")
+        self._compressors = ThreadPoolExecutor(workers, 'pywebcopy-compressor')
+        self._queue = Queue(maxsize=64)
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<ArchiveSink: %s files=%d>' % (self.path, len(self._names))
+
+    def __contains__(self, file_path):
+        return self.arcname(file_path) in self._names
+
+    def arcname(self, file_path):
+        """Name of the file in the archive.
+
+        :param str file_path: path of the file in the project folder
+        :rtype: str
+        """
+        return os.path.relpath(file_path, self.root).replace(os.sep, '/')
+
+    def _put(self, arcname, item):
+        with self._lock:
+            if self.closed:
+                raise ValueError("Archive %s is already closed!" % self.path)
+            if arcname in self._names:
+                return False
+            self._names.add(arcname)
+
+        if (self._parallel and compress_type_for(arcname) == zipfile.ZIP_DEFLATED
+                and _size_of(item) <= PARALLEL_LIMIT):
+            item = self._compressors.submit(_compress, arcname, item, self.level)
+
+        # The bounded queue slows down the workers to
+        # the speed of the writer instead of piling up files
+        self._queue.put((arcname, item))
+
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop,
+                                                name='pywebcopy-archive')
+                self._writer.start()
+        return True
+
+    def add_file(self, file_path):
+        """Appends a saved file to the archive.
+
+        :param str file_path: path of the file in the project folder
+        :rtype: bool
+        :returns: False if a file with the same name is already archived
+        """
+        return self._put(self.arcname(file_path), file_path)
+
+    def add_stream(self, file_path, file_like_object):
+        """Appends the contents of a file like object to the archive under
+        the name of the file path. The object is closed once it is archived.
+
+        :param str file_path: path which the file would have in the project folder
+        :param file_like_object: contents of the file
+        :rtype: bool
+        :returns: False if a file with the same name is already archived
+        """
+        file_like_object.seek(0)
+        return self._put(self.arcname(file_path), file_like_object)
+
+    def add_leftovers(self):
+        """Appends the files of the project folder which were saved
+        without going through the sink, like the log file. The internal
+        state files of the crawl are left out."""
+        for dirn, _, files in os.walk(self.root):
+            for f in files:
+                path = os.path.join(dirn, f)
+                if not is_state_file(path):
+                    self.add_file(path)
+
+    def _write(self, arcname, item):
+        if isinstance(item, Future):
+            self._write_member(*item.result())
+            return
+
+        compress_type = compress_type_for(arcname)
+        if isinstance(item, str):
+            self._zip.write(item, arcname, compress_type, self.level)
+            return
+
+        try:
+            info = _member_info(arcname, item)
+            info.compress_type = compress_type
+            _set_compress_level(info, self.level)
+            info.file_size = _size_of(item)
+            with self._zip.open(info, 'w') as dst:
+                copyfileobj(item, dst)
+        finally:
+            item.close()
+
+    def _write_member(self, info, data):
+        """Writes a member which is compressed already, this mirrors
+        what `ZipFile.open(info, 'w')` does without compressing again.
+        Only used if `raw_members_supported`."""
+        zf = self._zip
+        with zf._lock:
+            if zf._seekable:
+                zf.fp.seek(zf.start_dir)
+            info.header_offset = zf.fp.tell()
+            zf._writecheck(info)
+            zf._didModify = True
+            zf.fp.write(info.FileHeader(False))
+            zf.fp.write(data)
+            zf.filelist.append(info)
+            zf.NameToInfo[info.filename] = info
+            zf.start_dir = zf.fp.tell()
+
+    def _write_loop(self):
+        while True:
+            try:
+                arcname, item = self._queue.get(timeout=self.idle_timeout)
+            except Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._writer = None
+                        return
+                continue
+
+            try:
+                self._write(arcname, item)
+            except Exception:
+                LOGGER.exception("Failed to add file %s to the archive %s", arcname, self.path)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Blocks until every added file is written to the archive."""
+        self._queue.join()
+
+    def close(self):
+        """Writes the remaining files and finishes the archive."""
+        if self.closed:
+            return
+        self.join()
+        with self._lock:
+            self.closed = True
+            self._compressors.shutdown()
+            self._zip.close()
+        LOGGER.info('Saved the Project as ZIP archive at %s', self.path)
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def archive_sink():
+    """Returns the archive sink of the current project, or None if the
+    project is not zipped or config['archive_mode'] is 'folder'.
+
+    :rtype: ArchiveSink
+    """
+    global _sink
+
+    mode = config.get('archive_mode') or 'folder'
+    if not config.get('zip_project_folder') or mode == 'folder':
+        return None
+    if mode not in ('stream', 'direct'):
+        raise ValueError("Unknown archive mode %r! Use 'folder', "
+                         "'stream' or 'direct'." % mode)
+
+    root = os.path.abspath(config['project_folder'])
+    path = root + '.zip'
+
+    with _sink_lock:
+        if _sink is not None and _sink.path == path and not _sink.closed:
+            return _sink
+
+        # An archive closed earlier by this process is appended to, a
+        # new project or an archive left by an earlier process is replaced
+        reopen = _sink is not None and _sink.path == path
+        if _sink is not None:
+            _sink.close()
+
+        if not os.path.exists(root):
+            os.makedirs(root)
+        _sink = ArchiveSink(path, root, direct=(mode == 'direct'),
+                            mode='a' if reopen else 'w')
+        return _sink
+
+
+@atexit.register
+def _close_at_exit():
+    # an archive which is not closed lacks its central directory
+    if _sink is not None:
+        _sink.close()
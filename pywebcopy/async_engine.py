@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.async_engine
+~~~~~~~~~~~~~~~~~~~~~~
+
+Alternative fetch engine which downloads pages and files
+concurrently on a single asyncio event loop.
+
+It drives the same parsing and link rewriting as the default
+threaded engine but needs the optional `aiohttp` package.
+
+usage::
+    >>> from pywebcopy import config
+    >>> from pywebcopy.async_engine import AsyncEngine
+    >>> config.setup_config(url, project_folder, project_name, engine='asyncio')
+    >>> AsyncEngine().save_website(url)
+
+"""
+
+import asyncio
+from functools import partial
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from time import monotonic
+
+from six.moves.urllib.parse import urlsplit
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from . import LOGGER, SESSION
+from .configs import config
+from .core import SPOOL_SIZE, file_exists
+from .crawler import PAGE_TAGS, Frontier
+from .elements import LinkTag
+from .exceptions import InvalidUrlError
+from .metrics import METRICS
+from .urls import URLTransformer
+from .visited import new_visited_store
+from .warc import warc_writer
+from .webpage import WebPage
+
+
+__all__ = ['AsyncEngine']
+
+
+class AsyncEngine(object):
+    """Fetches web pages and their linked files on one event loop.
+
+    Every fetch is a coroutine instead of a thread, which keeps the
+    overhead of a download low on sites with a lot of small files.
+    The number of simultaneous requests is capped by
+    config['async_concurrency'] and per host by
+    config['max_connections_per_host']. Requests to a host are also
+    spaced by the delay its robots.txt or config['crawl_delay'] asks for.
+
+    :param webpage_parser: WebPage class used for parsing the pages
+    :param int concurrency: maximum number of requests in flight
+    """
+
+    def __init__(self, webpage_parser=None, concurrency=None):
+        if aiohttp is None:
+            raise ImportError("The asyncio engine requires the `aiohttp` package. "
+                              "Install it using `pip install aiohttp`.")
+
+        self.webpage_parser = webpage_parser or WebPage
+        self.concurrency = concurrency or config.get('async_concurrency') or 100
+
+        self._session = None
+        self._semaphore = None
+        self._host_slots = {}
+        self._next_request = {}
+        self._tasks = set()
+        self._seen = None
+        self.frontier = None
+
+    def __repr__(self):
+        return '<AsyncEngine: concurrency=%d>' % self.concurrency
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _drain(self):
+        """Waits for every spawned task, including the ones spawned meanwhile."""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    async def fetch(self, url):
+        """Fetches the content of the url.
+
+        The body is read in chunks of config['chunk_size'] bytes into a
+        spooled file, and is given up once it exceeds config['max_file_size'].
+
+        :param str url: url of the resource
+        :returns: two-tuple of the response and a file like object with
+            its body, body is None on failure
+        """
+        await self._read_robots(url)
+        if not SESSION._can_access(url):
+            return None, None
+
+        host = urlsplit(url).netloc.lower()
+
+        async with self._host_slot(host):
+            await self._wait_for_turn(host, url)
+
+            async with self._semaphore:
+                started = monotonic()
+                try:
+                    async with self._session.get(url) as resp:
+                        # connecting is not told apart from waiting here
+                        headers = monotonic()
+                        METRICS.observe('ttfb', headers - started)
+                        body, size, truncated = await self._read_body(resp)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    LOGGER.error("Failed to access url at address %s", url)
+                    METRICS.failed(url)
+                    return None, None
+
+        # log downloaded file size
+        config['download_size'] += size
+        METRICS.responded(url, resp.status)
+        METRICS.received(url, size, monotonic() - headers)
+
+        if truncated:
+            LOGGER.error("File at %s exceeds the maximum size of %d bytes.",
+                         url, config['max_file_size'])
+
+        writer = warc_writer()
+        if writer is not None:
+            await asyncio.get_event_loop().run_in_executor(
+                None, writer.write_exchange, str(resp.url), resp.status, resp.reason,
+                resp.headers.items(), body, resp.request_info.headers.items(),
+                'GET', 'length' if truncated else None)
+
+        if resp.status >= 400:
+            LOGGER.error("Url %s returned an error response %d", url, resp.status)
+        if resp.status >= 400 or truncated:
+            body.close()
+            return resp, None
+        body.seek(0)
+        return resp, body
+
+    @staticmethod
+    async def _read_body(resp):
+        """Reads the body of the response in chunks into a spooled file,
+        at most config['max_file_size'] bytes of it.
+
+        :returns: three-tuple of the file, the number of bytes read and
+            whether the body exceeds config['max_file_size']
+        """
+        max_size = config.get('max_file_size')
+        body = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+        # nothing is downloaded if the length tells it is too large
+        if max_size and resp.content_length is not None and resp.content_length > max_size:
+            return body, 0, True
+
+        size = 0
+        async for chunk in resp.content.iter_chunked(config.get('chunk_size') or 65536):
+            size += len(chunk)
+            if max_size and size > max_size:
+                body.write(chunk[:len(chunk) - (size - max_size)])
+                return body, size, True
+            body.write(chunk)
+        return body, size, False
+
+    @staticmethod
+    async def _read_robots(url):
+        """Reads the robots.txt of the host of the url in a thread if it is
+        missing or expired, thus the checks of the url do not block the loop."""
+        robots = SESSION.robots
+        if robots is not None and not robots.fresh(url):
+            await asyncio.get_event_loop().run_in_executor(None, robots.rules, url)
+
+    def _host_slot(self, host):
+        slot = self._host_slots.get(host)
+        if slot is None:
+            limit = config.get('max_connections_per_host') or self.concurrency
+            slot = self._host_slots[host] = asyncio.Semaphore(limit)
+        return slot
+
+    async def _wait_for_turn(self, host, url):
+        """Reserves the next request slot of the host and sleeps until then."""
+        interval = SESSION.request_interval(url)
+        if not interval:
+            return
+
+        now = asyncio.get_event_loop().time()
+        start = max(now, self._next_request.get(host, 0))
+        self._next_request[host] = start + interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def submit_file(self, elem):
+        """Schedules the download of a file handler on the loop."""
+        self._spawn(self.save_file(elem))
+
+    async def save_file(self, elem):
+        """Downloads a file handler object and writes it to its file path.
+
+        :type elem: pywebcopy.elements.TagBase
+        """
+        if not self._seen.add(elem.url):
+            return
+
+        if file_exists(elem.file_path) and not config['over_write']:
+            LOGGER.info("File already exists at location: %r", elem.file_path)
+            return
+
+        resp, body = await self.fetch(elem.url)
+        if body is None:
+            return
+
+        # rewritten and written in a thread, the fetches in flight go on meanwhile
+        loop = asyncio.get_event_loop()
+        if isinstance(elem, LinkTag) and elem.file_name.endswith('.css'):
+            # Files linked in the stylesheet are scheduled on this loop too
+            elem.submit_linked_file = partial(loop.call_soon_threadsafe, self.submit_file)
+            elem.contents = body.read()
+            await loop.run_in_executor(None, elem.extract_css_urls)
+            body = BytesIO(elem.contents)
+
+        with body:
+            await loop.run_in_executor(None, elem.write_file, body)
+
+    @staticmethod
+    def _page_transformer(elem):
+        """Returns a transformer which resolves the links of the page
+        against its own url but keeps the file path the linking page
+        was rewritten to."""
+        utx = URLTransformer(url=elem.url, base_url=elem.url,
+                             base_path=elem.base_path,
+                             default_fn=elem.default_filename)
+        utx.default_fileext = elem.default_fileext
+        utx.check_fileext = elem.check_fileext
+        return utx
+
+    async def save_page(self, url, source=None, encoding=None, elem=None, crawl=False, depth=0):
+        """Fetches, parses and saves a web page and schedules its files.
+
+        :param str url: url of the web page
+        :param source: file like object with the html, fetched from url if None
+        :param str encoding: explicit encoding of the html
+        :param elem: handler of the anchor which linked to this page, if any
+        :param bool crawl: whether to follow the links to other pages
+        :param int depth: link distance of the page from the first page
+        :rtype: WebPage
+        :returns: saved web page object or None if it could not be fetched
+        """
+        if not self._seen.add(url):
+            return
+
+        if source is None:
+            resp, body = await self.fetch(url)
+            if body is None:
+                return
+            source, encoding, url = body, encoding or resp.charset, str(resp.url)
+
+        wp = self.webpage_parser()
+        wp.set_source(source, encoding, url)
+        if elem is not None:
+            wp._url_obj = self._page_transformer(elem)
+
+        LOGGER.action("Starting save_complete Action on url: %r", url)
+        # parsed and saved in a thread, the fetches in flight go on meanwhile
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, wp.__parse__)
+
+        for file in wp:
+            if file.tag in PAGE_TAGS:
+                if crawl and self.frontier.accept(file.url, depth + 1):
+                    self._spawn(self.save_page(file.url, elem=file, crawl=True,
+                                               depth=depth + 1))
+            else:
+                self.submit_file(file)
+
+        await loop.run_in_executor(None, wp.save_html, wp.utx.file_path)
+        return wp
+
+    async def _run(self, url, source=None, encoding=None, crawl=False):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._host_slots = {}
+        self._next_request = {}
+        self._seen = new_visited_store('async')
+        if self.frontier is None:
+            self.frontier = Frontier()
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+
+        async with aiohttp.ClientSession(connector=connector,
+                                         headers=dict(SESSION.headers)) as session:
+            self._session = session
+            try:
+                wp = await self.save_page(url, source, encoding, crawl=crawl)
+                await self._drain()
+            finally:
+                self._session = None
+                self._seen.close()
+                self.frontier.visited.close()
+                self.frontier = None
+        return wp
+
+    def run(self, url, source=None, encoding=None, crawl=False):
+        """Runs the engine on a new event loop until every file is saved."""
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._run(url, source, encoding, crawl))
+        finally:
+            loop.close()
+
+    def save_webpage(self, url, source=None, encoding=None):
+        """Saves a single web page with all its files.
+
+        :rtype: WebPage
+        :raises InvalidUrlError: if the page could not be fetched
+        """
+        wp = self.run(url, source, encoding, crawl=False)
+        if wp is None:
+            raise InvalidUrlError("Url invalid :  %s" % url)
+        return wp
+
+    def save_website(self, url, max_depth=None, max_pages=None):
+        """Saves the web page and the pages linked from it.
+
+        :param int max_depth: maximum link distance of pages from the first page
+        :param int max_pages: maximum number of pages to save
+        :rtype: WebPage
+        :raises InvalidUrlError: if the first page could not be fetched
+        """
+        self.frontier = Frontier(max_depth, max_pages)
+        self.frontier.accept(url)
+        wp = self.run(url, crawl=True)
+        if wp is None:
+            raise InvalidUrlError("Url invalid :  %s" % url)
+        return wp
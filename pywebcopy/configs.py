@@ -10,17 +10,22 @@ Modifies the behaviour of pywebcopy.
 
 
 import os
+import itertools
 import logging
-from functools import lru_cache
+import threading
+from contextlib import contextmanager
+from time import monotonic, sleep
 
 import requests
-from six.moves.urllib.parse import urlparse, urljoin
+from six.moves.urllib.parse import urlparse, urljoin, urlsplit
 
 from . import LOGGER
 from .globals import VERSION
 from .exceptions import AccessError
-from .logger import new_file_logger, new_html_logger, new_console_logger
-from .structures import CaseInsensitiveDict, RobotsTxtParser
+from .logger import new_file_logger, new_html_logger, new_console_logger, start_queue_logging
+from .metrics import METRICS, TimedHTTPAdapter
+from .robots import RobotsRegistry
+from .structures import CaseInsensitiveDict
 
 
 __all__ = ['default_config', 'config']
@@ -52,6 +57,35 @@ safe_file_exts = [
     '.pwcf',  #: Default file extension
 ]
 
+"""Types of files which are compressed already and are stored in the zip archive as is."""
+stored_file_exts = [
+    '.gif',
+    '.jpeg',
+    '.jpg',
+    '.png',
+    '.webp',
+    '.woff',
+    '.woff2',
+    '.pdf',
+    '.zip',
+    '.gz',
+    '.mp3',
+    '.mp4',
+    '.webm',
+]
+
+"""Query parameters which only track the visitor and are stripped from canonical urls."""
+tracking_query_params = [
+    'utm_*',
+    'gclid',
+    'fbclid',
+    'msclkid',
+    'yclid',
+    'mc_cid',
+    'mc_eid',
+    '_ga',
+]
+
 safe_http_headers = {
     "Accept-Language": "en-US,en;q=0.9",
     'User-Agent'     : "Mozilla/5.0 (Windows NT 10.0; Win64; x64;"
@@ -77,17 +111,64 @@ default_config = {
     'load_images'          : True,
     'download_size'        : 0,
     'robots_txt'           : None,
+    'max_workers'          : 8,
+    'max_queue_size'       : 64,
+    'engine'               : 'threads',
+    'async_concurrency'    : 100,
+    'max_connections_per_host': 4,
+    'crawl_delay'          : 0,
+    'max_depth'            : None,
+    'max_pages'            : None,
+    'max_page_workers'     : 4,
+    'visited_store'        : 'memory',
+    'chunk_size'           : 65536,
+    'max_file_size'        : None,
+    'dedupe_files'         : False,
+    'http_cache'           : False,
+    'archive_mode'         : 'folder',
+    'compression_level'    : None,
+    'compression_workers'  : None,
+    'stored_file_exts'     : stored_file_exts,
+    'output_mode'          : 'folder',
+    'warc_folder'          : None,
+    'warc_max_size'        : 1 << 30,
+    'robots_ttl'           : 24 * 60 * 60,
+    'robots_cache'         : False,
+    'canonicalize_urls'    : False,
+    'strip_query_params'   : tracking_query_params,
+    'sort_query_params'    : True,
+    'stream_html'          : False,
+    'parse_processes'      : None,
+    'metrics'              : False,
+    'log_level'            : 'DEBUG',
+    'profile'              : False,
+    'trace_memory'         : False,
 }
 
 
+#: Source of the versions of the configurations
+_versions = itertools.count()
+
+
 class ConfigHandler(CaseInsensitiveDict):
     """Provides functionality to the config instance which
     stores and provides configuration values in every module.
     """
 
     def __init__(self, *args, **kwargs):
+        #: Changes whenever a key is set or deleted, thus values derived
+        #: from the configuration can be kept until it changes
+        self.version = next(_versions)
         super(ConfigHandler, self).__init__(*args, **kwargs)
 
+    def __setitem__(self, key, value):
+        super(ConfigHandler, self).__setitem__(key, value)
+        self.version = next(_versions)
+
+    def __delitem__(self, key):
+        super(ConfigHandler, self).__delitem__(key)
+        self.version = next(_versions)
+
     def __repr__(self):
         return '<ConfigHandler: %s>' % self.get('project_name') or 'Default'
 
@@ -131,8 +212,17 @@ class ConfigHandler(CaseInsensitiveDict):
                                             self['project_name'] + '_log.log')
 
         level = (logging.DEBUG if self.get('debug', None) else logging.WARNING)
-        LOGGER.addHandler(new_console_logger(level=level))
-        LOGGER.addHandler(new_file_logger(self['log_file'], 'w'))
+        file_level = self.get('log_level') or logging.DEBUG
+        if isinstance(file_level, str):
+            file_level = logging.getLevelName(file_level.upper())
+            if not isinstance(file_level, int):
+                raise ValueError("Unknown log level %r" % self['log_level'])
+
+        #: The records are written by a background thread, and the ones
+        #: below the levels of both handlers are not even created
+        start_queue_logging(new_console_logger(level=level),
+                            new_file_logger(self['log_file'], 'w', file_level))
+        LOGGER.setLevel(min(level, file_level))
 
         # XXX: Do we need a html logger?
         # LOGGER.addHandler(new_html_logger(filename=os.path.join(
@@ -173,7 +263,7 @@ class ConfigHandler(CaseInsensitiveDict):
         # self['robots_txt'] = prepared_robots_txt  # global ease access point
 
         #: Log this new configuration to the log file for debug purposes
-        LOGGER.debug(str(dict(self)))
+        LOGGER.debug('%s', dict(self))
         return self
 
     def is_set(self):
@@ -211,6 +301,38 @@ class DefaultConfig(ConfigHandler):
         'load_javascript',
         'load_images',
         'download_size',
+        'max_workers',
+        'max_queue_size',
+        'engine',
+        'async_concurrency',
+        'max_connections_per_host',
+        'crawl_delay',
+        'max_depth',
+        'max_pages',
+        'max_page_workers',
+        'visited_store',
+        'chunk_size',
+        'max_file_size',
+        'dedupe_files',
+        'http_cache',
+        'archive_mode',
+        'compression_level',
+        'compression_workers',
+        'stored_file_exts',
+        'output_mode',
+        'warc_folder',
+        'warc_max_size',
+        'robots_ttl',
+        'robots_cache',
+        'canonicalize_urls',
+        'strip_query_params',
+        'sort_query_params',
+        'stream_html',
+        'parse_processes',
+        'metrics',
+        'log_level',
+        'profile',
+        'trace_memory',
     ]
 
     def __init__(self):
@@ -241,14 +363,37 @@ class AccessAwareSession(requests.Session):
         self.stream = True
         self.robots_txt = None
 
+        #: Connections are timed for the metrics of the crawl
+        self.mount('http://', TimedHTTPAdapter())
+        self.mount('https://', TimedHTTPAdapter())
+
+        #: Rules of the robots.txt of every host, see `set_robots_txt`
+        self.robots = None
+
+        #: Earliest time at which each host can be requested again
+        self._next_request = {}
+        self._turns_lock = threading.Lock()
+        #: Host whose turn is reserved for the calling thread, see `reserved_turn`
+        self._turns = threading.local()
+
     def set_robots_txt(self, user_agent, robot_txt_url):
+        """Starts consulting the robots.txt of every host before accessing
+        it, the robots.txt of the given url is read right away.
 
+        The rules are kept for config['robots_ttl'] seconds and stored in
+        the project folder, or at the path of config['robots_cache'] if
+        it is set, so that a later crawl does not fetch them again.
+        """
         assert user_agent and robot_txt_url, "Please pass in valid arguments!"
-        robots_parser = RobotsTxtParser(user_agent, robot_txt_url)
+
+        path = config.get('robots_cache')
+        if path and not isinstance(path, str):
+            path = os.path.join(config['project_folder'], '.robots_cache.json')
+
         #: We need the super method otherwise it will get stuck in a infinite loop
-        setattr(robots_parser, '_get', super(AccessAwareSession, self).get)
-        self.robots_txt = robots_parser
-        self.robots_txt.read()
+        self.robots = RobotsRegistry(user_agent, config.get('robots_ttl'), path or None,
+                                     super(AccessAwareSession, self).get)
+        self.robots_txt = self.robots.parser(robot_txt_url)
 
     def get(self, url, **kwargs):
         """
@@ -262,19 +407,99 @@ class AccessAwareSession(requests.Session):
         if not self._can_access(url):
             raise AccessError("Access is not allowed by the site of url %s" % url)
 
-        return super(AccessAwareSession, self).get(url, **kwargs)
+        self._wait_for_turn(url)
+        started = METRICS.request_started()
+        resp = super(AccessAwareSession, self).get(url, **kwargs)
+        METRICS.response_received(resp, started)
+
+        if config.get('output_mode') == 'warc':
+            from .warc import record_response
+            record_response(resp)
+        return resp
+
+    def request_interval(self, url):
+        """Minimum seconds between two requests to the host of the url.
+        It is the larger of config['crawl_delay'] and the delay asked for
+        in the robots.txt of the host.
+
+        :rtype: float
+        """
+        interval = float(config.get('crawl_delay') or 0)
+        if self.robots is not None:
+            interval = max(interval, self.robots.request_interval(url))
+        return interval
+
+    def next_request_time(self, host):
+        """Monotonic time at which the host can be requested again."""
+        return self._next_request.get(host, 0)
+
+    def reserve_turn(self, url):
+        """Reserves the request slot of the host of the url if it is
+        reached already, without blocking. The scheduler hands a request
+        over to a worker only after its turn is reserved, see `reserved_turn`.
+
+        The robots.txt of a host which is not read yet, or is expired, is
+        not fetched here, such a request is not reserved and waits for its
+        turn in `get`.
+
+        :rtype: tuple
+        :returns: seconds until the slot of the host is reached (0 if it is
+            reached) and whether the slot is reserved
+        """
+        host = urlsplit(url).netloc.lower()
+        known = self.robots is None or self.robots.fresh(url)
+        interval = self.request_interval(url) if known else 0
+
+        with self._turns_lock:
+            now = monotonic()
+            ready_in = self._next_request.get(host, 0) - now
+            if ready_in > 0:
+                return ready_in, False
+            if known and interval:
+                self._next_request[host] = now + interval
+        return 0, known
+
+    @contextmanager
+    def reserved_turn(self, url):
+        """Tells `get` that the turn of the next request of the calling
+        thread to the host of the url is reserved already by `reserve_turn`."""
+        self._turns.host = urlsplit(url).netloc.lower()
+        try:
+            yield
+        finally:
+            self._turns.host = None
+
+    def _wait_for_turn(self, url):
+        """Reserves the next request slot of the host of the url
+        and blocks until that slot is reached."""
+        host = urlsplit(url).netloc.lower()
+        if getattr(self._turns, 'host', None) == host:
+            # reserved when the request was handed over to the worker
+            self._turns.host = None
+            return
+
+        interval = self.request_interval(url)
+        if not interval:
+            return
+
+        with self._turns_lock:
+            now = monotonic()
+            start = max(now, self._next_request.get(host, 0))
+            self._next_request[host] = start + interval
+
+        if start > now:
+            sleep(start - now)
 
-    @lru_cache(maxsize=100)
     def _can_access(self, url):
         """ Determines if the site allows certain url to be accessed.
         """
 
-        # If the robots class is not declared or is just empty instance
+        # If the robots registry is not set up yet
         # always return true
 
-        if not self.robots_txt:
+        if self.robots is None:
             return True
-        if self.robots_txt.can_fetch(url):
+        if self.robots.can_fetch(url):
             return True
         # Website may have restricted access to the certain url and if not in bypass
         # mode access would be denied
@@ -282,10 +507,10 @@ class AccessAwareSession(requests.Session):
 
             if config.get('bypass_robots', False):
                 # if explicitly declared to bypass robots then the restriction will be ignored
-                LOGGER.warning("Forcefully Accessing restricted website part %s" % url)
+                LOGGER.warning("Forcefully Accessing restricted website part %s", url)
                 return True
             else:
-                LOGGER.error("Website doesn't allow access to the url %s" % url)
+                LOGGER.error("Website doesn't allow access to the url %s", url)
                 return False
 
 
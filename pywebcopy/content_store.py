@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.content_store
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Content addressed store which keeps a single copy of identical files.
+
+Enabled by config['dedupe_files'], every downloaded file is hashed while it
+is streamed to the disk. When a file with the same contents is already
+saved, the new file is turned into a hardlink of the first (canonical)
+copy and links which are rewritten later point at the canonical copy.
+The store is cleared when a new project is started.
+
+usage::
+    >>> from pywebcopy.content_store import CONTENT_STORE
+    >>> CONTENT_STORE.canonical_path('/downloads/site/img/sprite_v2.png')
+    '/downloads/site/img/sprite_v1.png'
+
+"""
+
+import hashlib
+import os
+import threading
+
+from . import LOGGER
+
+
+__all__ = ['ContentStore', 'CONTENT_STORE']
+
+
+class ContentStore(object):
+    """Maps the content hashes of the saved files to their canonical paths."""
+
+    def __init__(self):
+        self._paths = {}
+        self._digests = {}
+        self._aliases = {}
+        self._lock = threading.Lock()
+        #: Number of bytes which did not need their own copy on disk
+        self.saved_bytes = 0
+
+    def __repr__(self):
+        return '<ContentStore: files=%d duplicates=%d>' % (len(self._paths), len(self._aliases))
+
+    @staticmethod
+    def hasher():
+        """Returns a new hash object for the contents of a file."""
+        return hashlib.sha256()
+
+    def canonical_path(self, file_path):
+        """Returns the path of the canonical copy of the file, which is
+        the file path itself unless the file is a known duplicate.
+
+        :param str file_path: path of a file
+        :rtype: str
+        """
+        return self._aliases.get(file_path, file_path)
+
+    def aliases(self):
+        """Returns a copy of the map of the duplicate files to their canonical copies.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._aliases)
+
+    def set_aliases(self, aliases):
+        """Replaces the map of the duplicate files, like with the
+        one of another process, see `aliases`."""
+        with self._lock:
+            self._aliases = dict(aliases)
+
+    def commit(self, part, location, digest, size=0):
+        """Moves a completely written temporary file to its location,
+        or links the location to an existing file with the same digest.
+
+        :param str part: path of the written temporary file
+        :param str location: final path of the file
+        :param str digest: hex digest of the contents of the file
+        :param int size: size of the contents in bytes
+        :rtype: str
+        :returns: path of the canonical copy of the file
+        """
+        with self._lock:
+            self._forget(location, digest)
+            canonical = self._paths.get(digest)
+
+            if canonical is None or canonical == location or not os.path.exists(canonical):
+                os.replace(part, location)
+                self._paths[digest] = location
+                self._digests[location] = digest
+                return location
+
+            try:
+                if os.path.lexists(location):
+                    os.remove(location)
+                os.link(canonical, location)
+            except OSError:
+                # file system does not support hardlinks, keep the copy
+                os.replace(part, location)
+                return location
+
+            os.remove(part)
+            self._aliases[location] = canonical
+            self.saved_bytes += size
+
+        LOGGER.info("File at %s is a duplicate of the file at %s", location, canonical)
+        return canonical
+
+    def _forget(self, location, digest):
+        # a file which is saved again is no longer the copy it was
+        self._aliases.pop(location, None)
+        old = self._digests.get(location)
+        if old is None or old == digest:
+            return
+        del self._digests[location]
+        if self._paths.get(old) == location:
+            del self._paths[old]
+        # the duplicates are hardlinks of the old contents
+        for alias in [k for k, v in self._aliases.items() if v == location]:
+            del self._aliases[alias]
+
+    def clear(self):
+        """Forgets every saved file, like when a new project is started."""
+        with self._lock:
+            self._paths.clear()
+            self._digests.clear()
+            self._aliases.clear()
+            self.saved_bytes = 0
+
+
+CONTENT_STORE = ContentStore()
+"""Global store of the saved files."""
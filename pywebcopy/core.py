@@ -11,10 +11,10 @@ Core functionality of the pywebcopy engine.
 
 import os
 import shutil
-import zipfile
 from datetime import datetime
 from functools import lru_cache
-from threading import enumerate, main_thread
+from tempfile import SpooledTemporaryFile
+from time import monotonic
 
 import requests
 from requests import Response
@@ -23,9 +23,20 @@ from six import BytesIO
 
 from . import VERSION, SESSION, LOGGER
 from .globals import MARK
-from .exceptions import AccessError
+from .logger import flush_logs
+from .exceptions import AccessError, FileTooLargeError
+from .archive import ArchiveSink, archive_sink
 from .configs import config
+from .content_store import CONTENT_STORE
+from .metrics import METRICS, Transfer
 from .structures import RobotsTxtParser
+from .scheduler import SCHEDULER
+from .warc import close_warc_writer
+from .workers import POOL
+
+
+#: Files bound only for the archive are kept in memory up to this size
+SPOOL_SIZE = 1024 * 1024
 
 
 def zip_project():
@@ -34,40 +45,27 @@ def zip_project():
     :rtype: str
     :returns: location of the zipped project_folder file.
     """
-    _mainThread = main_thread()
-    # wait for the threads to finish downloading files
-
-    for thread in enumerate():
-        if not thread or thread is _mainThread:
-            continue
-        if thread.is_alive():
-            thread.join()
+    # wait for the workers to finish downloading files
+    SCHEDULER.join()
+    POOL.join()
+    close_warc_writer()
+    # the log file is archived along with the project
+    flush_logs()
 
     zipf = os.path.abspath(config['project_folder']) + '.zip'
 
-    with zipfile.ZipFile(zipf, 'w', zipfile.ZIP_DEFLATED) as archive:
-
-        #: Iterate through file tree
-        for dirn, _, fn in os.walk(config['project_folder']):
-            # only files will be added to the zip archive instead of empty
-            # folder which might have been created during process
-            for f in fn:
-                try:
-                    new_fn = os.path.join(dirn, f)
-                    archive.write(new_fn, new_fn[len(config['project_folder']):])
-                except ValueError:
-                    LOGGER.exception("Attempt to use ZIP archive that was already closed", exc_info=True)
-                except RuntimeError:
-                    LOGGER.exception("Failed to add file to archive file %s" % f, exc_info=True)
-
-    LOGGER.info('Saved the Project as ZIP archive at %s' % (config['project_folder'] + '.zip'))
+    #: Files which are saved already are in the archive if it is written
+    #: while saving, else the complete project folder is archived now
+    sink = archive_sink() or ArchiveSink(zipf, os.path.abspath(config['project_folder']))
+    sink.add_leftovers()
+    sink.close()
 
     # Project folder can be automatically deleted after making zip file from it
     # this is True by default and will delete the complete project folder
     if config['delete_project_folder']:
         shutil.rmtree(config['project_folder'])
 
-    LOGGER.info("Downloaded Contents Size :: %s KB's" % str(config['download_size'] // 1024))
+    LOGGER.info("Downloaded Contents Size :: %s KB's", config['download_size'] // 1024)
 
     return zipf
 
@@ -119,7 +117,8 @@ def get(url, *args, **kwargs):
             resp.request = err.request
 
     except ConnectionError:    # Catches any other exception raised by `requests`
-        LOGGER.error("Failed to access url at address %s" % url)
+        LOGGER.error("Failed to access url at address %s", url)
+        METRICS.failed(url)
         resp = _dummy_resp()
 
     return resp
@@ -144,6 +143,136 @@ def _watermark(file_path):
     return MARK.format(comment_start, VERSION, file_path, datetime.utcnow(), comment_end).encode()
 
 
+def iter_chunks(source, chunk_size=None):
+    """Yields the contents of a response or a file like object in chunks
+    of config['chunk_size'] bytes, thus only a single chunk is held in
+    memory at a time.
+
+    :param source: `requests.Response`, file like object or bytes
+    :param int chunk_size: overrides config['chunk_size']
+    """
+    chunk_size = chunk_size or config.get('chunk_size') or 65536
+
+    if isinstance(source, bytes):
+        yield source
+    elif isinstance(source, Response):
+        # decodes the gzip or deflate transfer encodings on the fly
+        for chunk in source.iter_content(chunk_size):
+            yield chunk
+    else:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            yield chunk
+
+
+def write_stream(location, source, trailer=b''):
+    """Streams the source to the file at location in chunks.
+
+    The data is written to a temporary `.part` file which is renamed to
+    the location only when the whole file is written, thus an interrupted
+    download never leaves a truncated file which looks complete.
+
+    If config['dedupe_files'] is set then a file with the same contents
+    as an already saved file becomes a hardlink to it.
+
+    If the project is archived while it is saved (see config['archive_mode'])
+    then the file is appended to the archive, or only written to the
+    archive in the 'direct' mode.
+
+    Nothing is written if config['output_mode'] is 'warc', the responses
+    are recorded in the WARC files when they are fetched.
+
+    :param str location: path of the file
+    :param source: `requests.Response`, file like object or bytes
+    :param bytes trailer: bytes to append after the contents
+    :rtype: int
+    :returns: number of content bytes written
+    :raises FileTooLargeError: if the contents exceed config['max_file_size']
+    """
+    if config.get('output_mode') == 'warc':
+        return 0
+
+    max_size = config.get('max_file_size')
+
+    if max_size and isinstance(source, Response):
+        length = source.headers.get('content-length')
+        if length and length.isdigit() and int(length) > max_size:
+            raise FileTooLargeError("File of %s bytes at %s exceeds the maximum "
+                                    "size of %d bytes." % (length, location, max_size))
+
+    sink = archive_sink()
+    direct = sink is not None and sink.direct
+    hasher = CONTENT_STORE.hasher() if config.get('dedupe_files') and not direct else None
+    part = location + '.part'
+    written = 0
+    started = monotonic()
+    chunks = Transfer(iter_chunks(source))
+
+    if not direct:
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+
+    # files bound for the archive only are kept in memory unless they are large
+    f = SpooledTemporaryFile(max_size=SPOOL_SIZE) if direct else open(part, 'wb')
+    try:
+        try:
+            for chunk in chunks:
+                written += len(chunk)
+                if max_size and written > max_size:
+                    raise FileTooLargeError("File at %s exceeds the maximum size "
+                                            "of %d bytes." % (location, max_size))
+                if hasher is not None:
+                    hasher.update(chunk)
+                f.write(chunk)
+            f.write(trailer)
+        finally:
+            if not direct:
+                f.close()
+
+        if direct:
+            if not sink.add_stream(location, f):
+                f.close()
+            _observe_stream(source, chunks, started)
+            return written
+
+        if hasher is not None:
+            CONTENT_STORE.commit(part, location, hasher.hexdigest(), written)
+        else:
+            os.replace(part, location)
+    except BaseException:
+        if direct:
+            f.close()
+        elif os.path.exists(part):
+            os.remove(part)
+        raise
+
+    if sink is not None:
+        sink.add_file(location)
+    _observe_stream(source, chunks, started)
+    return written
+
+
+def _observe_stream(source, chunks, started):
+    """Splits the time of `write_stream` into the transfer of the
+    body of a response and the writing of it."""
+    if isinstance(source, Response):
+        METRICS.received(source.url, chunks.size, chunks.seconds)
+        METRICS.observe('write', monotonic() - started - chunks.seconds)
+    else:
+        METRICS.observe('write', monotonic() - started)
+
+
+def file_exists(location):
+    """Whether the file is already saved, either in the project
+    folder or in the archive of the project.
+
+    :param str location: path of the file
+    :rtype: bool
+    """
+    if os.path.exists(location):
+        return True
+    sink = archive_sink()
+    return sink is not None and location in sink
+
+
 @lru_cache(maxsize=100)
 def is_allowed(ext):
     if not ext:
@@ -178,65 +307,61 @@ def new_file(location, content_url=None, content=None):
     _file_ext = '.' + location.rsplit('.', 1)[1].lower().strip()
 
     if not is_allowed(_file_ext):
-        LOGGER.critical('File ext %r is not allowed for file at %r' % (_file_ext, content_url or location))
+        LOGGER.critical('File ext %r is not allowed for file at %r', _file_ext, content_url or location)
         return
 
     # The file path provided can already be existing so only overwrite the files
     # when specifically configured to do so by config key 'over_write'
-    if os.path.exists(location):
+    if file_exists(location):
 
         if not config['over_write']:
-            LOGGER.debug('File already exists at the location %s' % location)
+            LOGGER.debug('File already exists at the location %s', location)
             return location
 
         else:
-            os.remove(location)
-            LOGGER.info('ReDownloading the file of type %s to %s' % (_file_ext, location))
+            if os.path.exists(location):
+                os.remove(location)
+            LOGGER.info('ReDownloading the file of type %s to %s', _file_ext, location)
     else:
-        LOGGER.info('Downloading a new file of type %s to %s' % (_file_ext, location))
+        LOGGER.info('Downloading a new file of type %s to %s', _file_ext, location)
 
     # Contents of the files can be supplied or filled by a content url
     # function we go online to download content from content url
     if not content and content_url is not None:
 
-        LOGGER.info('Downloading content of file %s from %s' % (location, content_url))
+        LOGGER.info('Downloading content of file %s from %s', location, content_url)
 
         req = get(content_url, stream=True)
         # The file may not be available so will raise an error which will be caught by
         # except block an will return None
         if req is None or not req.ok:
-            LOGGER.error('Failed to load the content of file %s from %s' % (location, content_url))
+            LOGGER.error('Failed to load the content of file %s from %s', location, content_url)
             return
 
     try:
         # Files can throw an IOError or similar when failed to open or write in that
-        LOGGER.debug("Making path for the file at location %s" % location)
+        LOGGER.debug("Making path for the file at location %s", location)
         if not os.path.exists(os.path.dirname(location)):
             os.makedirs(os.path.dirname(location))
 
     except OSError as e:
         LOGGER.critical(e)
-        LOGGER.critical("Failed to create path for the file of type %s to location %s" % (_file_ext, location))
+        LOGGER.critical("Failed to create path for the file of type %s to location %s", _file_ext, location)
         return
 
     try:
         # case the function will catch it and log it then return None
-        LOGGER.info("Writing file at location %s" % location)
+        LOGGER.info("Writing file at location %s", location)
 
         if isinstance(req, Response):
-            with open(location, 'wb') as f:
-                # should write in chunks to manage ram usages?
-                f.write(req.content)
-                f.write(_watermark(content_url or location))
+            write_stream(location, req, _watermark(content_url or location))
         else:
-            with open(location, 'wb') as f:
-                f.write(content)
-                f.write(_watermark(content_url or location))
+            write_stream(location, content, _watermark(content_url or location))
 
     except Exception as e:
         LOGGER.critical(e)
-        LOGGER.critical("Download failed for the file of type %s to location %s" % (_file_ext, location))
+        LOGGER.critical("Download failed for the file of type %s to location %s", _file_ext, location)
         return
     else:
-        LOGGER.success('File of type %s written successfully to %s' % (_file_ext, location))
+        LOGGER.success('File of type %s written successfully to %s', _file_ext, location)
         return location
@@ -13,18 +13,30 @@ usage::
     >>> kwargs = {'bypass_robots': True}
     >>> config.setup_config(url, project_folder, project_name, **kwargs)
     >>> crawler = Crawler(url)
-    >>> crawler.run()
+    >>> crawler.run(max_depth=3, max_pages=500)
 
 """
 
+import threading
 import warnings
 
+from six.moves.queue import Queue
+
 from . import LOGGER, parsers
+from .configs import config
 from .webpage import WebPage
 from .elements import TagBase, LinkTag, ScriptTag, ImgTag
 from .exceptions import PywebcopyError
+from .journal import CrawlJournal, journal_path
+from .parse_pool import parse_pool
+from .scheduler import SCHEDULER
+from .urls import URLCanonicalizer, canonicalize
+from .visited import new_visited_store
+from .workers import POOL
+
 
-ALL = set()
+#: Tags which link to other web pages rather than files of a page
+PAGE_TAGS = frozenset(['a', 'form'])
 
 
 class UrlAlreadyDownloaded(PywebcopyError):
@@ -33,14 +45,23 @@ class UrlAlreadyDownloaded(PywebcopyError):
 
 class AnchorTagHandler(TagBase):
     """Custom anchor tag handler.
-    This creates a WebPage objects directly and can start it.
-    Replaces the generated webpage objects tranformer by itself
-    so that the path generation depends on this instead of WebPage object.
+    Gives the linked web page the same path which the page would
+    get when it is saved by the crawler, thus the rewritten links
+    point at the saved pages.
+
+    Starting the handler hands over the url to the frontier of
+    the crawler which is bound to it, if any.
     The apis of a tag handler are still same thus it is easy
     to be handled by the parser internally.
     """
 
     parser = WebPage
+    crawler = None
+    depth = 0
+
+    #: Attributes which do not change how the links are rewritten,
+    #: the parse pool sends the handler without them
+    process_local = ('parser', 'crawler')
 
     def __init__(self, url, *args, **kwargs):
         TagBase.__init__(self, url=url, *args, **kwargs)
@@ -49,32 +70,124 @@ class AnchorTagHandler(TagBase):
         self.default_fileext = 'html'
         self.check_fileext = True
 
+    def start(self):
+        # Web pages are fetched by the page workers of the crawler
+        # and not by the shared file workers.
+        self.run()
+
     def run(self):
-        if self.url in ALL:
-            LOGGER.debug("Webpage at url %s already downloaded!" % self.url)
+        if self.crawler is None:
+            LOGGER.debug("No crawler to hand over the webpage at url %s", self.url)
             return
+        self.crawler.frontier.add(self.url, self.depth)
 
-        ALL.add(self.url)
 
-        _subpage = self.parser()
+class Frontier(object):
+    """First-in first-out queue of discovered web page urls.
 
-        #: overriding the properties of webpage object with the
-        #: properties from this transformer object
-        _subpage._url_obj = self
-        _subpage.url = self.url
-        _subpage.get(self.url)
-        _subpage.__parse__()
-        _subpage.save_complete()
+    Urls are crawled in breadth first order, each with the depth
+    at which it was discovered. Urls which are already known, deeper
+    than `max_depth` or beyond `max_pages` are refused.
 
-        del _subpage
-
-
-def _with_parser(klass, parser):
-    assert issubclass(klass, object), "First argument must be a Class!"
-    assert issubclass(parser, object), "Second argument must be a Class!"
+    :param int max_depth: maximum link distance from the first page, None for no limit
+    :param int max_pages: maximum number of pages to accept, None for no limit
+    :param visited: VisitedStore of the known urls, a new one of the
+        kind set by config['visited_store'] if None
+    """
 
-    setattr(klass, 'parser', parser)
-    return klass
+    def __init__(self, max_depth=None, max_pages=None, visited=None):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.visited = visited if visited is not None else new_visited_store('pages')
+        #: CrawlJournal which records the queued urls, if any
+        self.journal = None
+        self._queue = Queue()
+        self._accepted = 0
+        self.canonical = URLCanonicalizer(config.get('strip_query_params'),
+                                          config.get('sort_query_params', True))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._accepted
+
+    def accept(self, url, depth=0):
+        """Marks the url as seen if it is new and within the limits.
+
+        :param str url: url of the web page
+        :param int depth: link distance of the page from the first page
+        :rtype: bool
+        :returns: whether the url should be crawled
+        """
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+
+        with self._lock:
+            if self.max_pages is not None and self._accepted >= self.max_pages:
+                return False
+            if not self.visited.add(url):
+                return False
+            self._accepted += 1
+        return True
+
+    def add(self, url, depth=0):
+        """Queues the url if it is accepted.
+
+        :rtype: bool
+        :returns: whether the url was queued
+        """
+        if not self.accept(url, depth):
+            return False
+        if self.journal is not None:
+            self.journal.queued(url, depth)
+        self._queue.put((url, depth))
+        return True
+
+    def add_many(self, urls, depth=0):
+        """Queues the accepted ones of a batch of urls found at the same
+        depth, in their canonical forms (see config['canonicalize_urls']).
+
+        :param urls: iterable of web page urls
+        :rtype: int
+        :returns: number of urls queued
+        """
+        if config.get('canonicalize_urls'):
+            urls = self.canonical.many(urls)
+
+        queued = 0
+        for url in urls:
+            if self.add(url, depth):
+                queued += 1
+        return queued
+
+    def restore(self, url, depth, pending=True):
+        """Marks an url which was queued by an earlier crawl as known,
+        and queues it again if it was not completed."""
+        with self._lock:
+            if not self.visited.add(url):
+                return
+            self._accepted += 1
+        if pending:
+            self._queue.put((url, depth))
+
+    def get(self):
+        """Blocks until a queued item is available and returns it.
+
+        :returns: two-tuple of url and depth, or None if the crawl is over
+        """
+        return self._queue.get()
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def join(self):
+        """Blocks until every queued url, including the ones queued meanwhile, is done."""
+        self._queue.join()
+
+    def close(self, workers):
+        """Wakes up the idle workers so that they can stop."""
+        for _ in range(workers):
+            self._queue.put(None)
+        self.visited.close()
 
 
 class Crawler(object):
@@ -97,7 +210,8 @@ class Crawler(object):
     def __init__(self, base_page_url, webpage_parser_class=None, **kwargs):
         if 'scan_level' in kwargs:
             warnings.warn("The scan_level setting has been deprecated and"
-                          "is now not supported. Thus leave it as is.")
+                          "is now not supported. Use the max_depth argument "
+                          "of the run() method instead.")
 
         if webpage_parser_class is None:
             self.webpage_parser = WebPage
@@ -110,17 +224,114 @@ class Crawler(object):
             self.webpage_parser = webpage_parser_class
 
         self.url = base_page_url
-
-    def run(self):
-        """Starts the chain reaction."""
-
-        # parser = self.webpage_parser
-
-        # class Wrapper(AnchorTagHandler):
-        #    def __init__(self, *args, **kwargs):
-        #        super(Wrapper, self).__init__(*args, parser=parser, **kwargs)
-
-        wrapper = _with_parser(AnchorTagHandler, self.webpage_parser)
+        self.frontier = None
+        self.files = None
+        self.journal = None
+        self.file_path = None
+
+    def crawl_page(self, url, depth):
+        """Fetches, parses and saves a single web page. Files linked in the
+        page are handed over to the file workers and the linked pages to
+        the frontier.
+
+        :param str url: url of the web page
+        :param int depth: link distance of the page from the first page
+        :rtype: WebPage
+        """
+        wp = self.webpage_parser()
+        wp.get(url)
+
+        LOGGER.action("Crawling page at depth %d url: %r", depth, url)
+        pool = parse_pool()
+        streamed = pool is None and config.get('stream_html')
+        if pool is not None:
+            wp.parse_in_pool(pool)
+        elif streamed:
+            wp.save_streamed(wp.utx.file_path)
+        else:
+            wp.__parse__()
+
+        futures, pages = [], []
+        for file in wp:
+            if file.tag in PAGE_TAGS:
+                pages.append(file.url)
+            elif self.files.add(file.url):
+                # Files shared by many pages are downloaded only once
+                futures.append(file.start())
+        self.frontier.add_many(pages, depth + 1)
+
+        if not streamed:
+            wp.save_html(wp.utx.file_path)
+        self._complete_when_done(url, wp.utx.file_path, futures)
+        return wp
+
+    def _complete_when_done(self, url, file_path, futures):
+        """Records the page as completed in the journal once all
+        of its files are saved too, thus a resumed crawl saves the
+        page again if it was interrupted in between."""
+        if self.journal is None:
+            return
+        if not futures:
+            return self.journal.completed(url, file_path)
+
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self.journal.completed(url, file_path)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def _work(self):
+        while True:
+            item = self.frontier.get()
+            if item is None:
+                return
+            try:
+                self.crawl_page(*item)
+            except Exception as e:
+                LOGGER.exception("Failed to crawl the page at url %r", item[0])
+                if self.journal is not None:
+                    self.journal.failed(item[0], e)
+            finally:
+                self.frontier.task_done()
+
+    def run(self, max_depth=None, max_pages=None, max_workers=None, resume=False):
+        """Crawls the website in breadth first order.
+
+        Progress is recorded in a journal in the project folder, thus a
+        crawl which got interrupted can be continued with `resume=True`
+        without fetching the completed pages again.
+
+        :param int max_depth: maximum link distance of pages from the first page
+            (defaults to config['max_depth'], None for no limit)
+        :param int max_pages: maximum number of pages to save
+            (defaults to config['max_pages'], None for no limit)
+        :param int max_workers: number of threads which save pages
+            (defaults to config['max_page_workers'])
+        :param bool resume: whether to continue the crawl recorded in the journal
+        :raises ValueError: if resuming while the files are archived in the
+            'direct' archive mode, which keeps them nowhere but in the archive
+        """
+        if resume and config.get('zip_project_folder') and config.get('archive_mode') == 'direct':
+            raise ValueError("A crawl can not be resumed in the 'direct' archive mode, "
+                             "the files of the completed pages are kept only in the "
+                             "archive of the interrupted crawl.")
+        if max_depth is None:
+            max_depth = config.get('max_depth')
+        if max_pages is None:
+            max_pages = config.get('max_pages')
+        requested_workers = max_workers
+        max_workers = max_workers or config.get('max_page_workers') or 4
+
+        parser = self.webpage_parser
+        handler = type('AnchorTagHandler', (AnchorTagHandler,),
+                       {'parser': parser, 'crawler': self})
 
         # Recreate the element map
         parsers.element_map = {
@@ -129,19 +340,70 @@ class Crawler(object):
             'script': ScriptTag,
             'img'   : ImgTag,
 
-            'a'     : wrapper,
-            'form'  : wrapper,
+            'a'     : handler,
+            'form'  : handler,
         }
 
-        #: Prepare a fresh webpage object
-        wp = self.webpage_parser()
+        self.url = canonicalize(self.url)
 
-        #: Fill the data and start
-        wp.get(self.url)
-        wp.save_complete()
+        if config.get('engine') == 'asyncio':
+            from .async_engine import AsyncEngine
 
-        self.file_path = wp.utx.file_path
+            if resume:
+                LOGGER.warning("The asyncio engine does not keep a crawl journal, "
+                               "the website is crawled from the start.")
+            if requested_workers:
+                LOGGER.warning("The asyncio engine does not use page workers, its "
+                               "requests are capped by config['async_concurrency'].")
+            wp = AsyncEngine(self.webpage_parser).save_website(self.url, max_depth, max_pages)
+            self.file_path = wp.utx.file_path
+            return
 
-        del wp
+        pool = parse_pool()
+        if pool is not None:
+            # processes are forked before the page workers are started
+            pool.start()
+
+        self.frontier = Frontier(max_depth, max_pages)
+        self.files = new_visited_store('files')
+        self.journal = CrawlJournal(journal_path(), reset=not resume)
+
+        #: Pages queued by the interrupted crawl are known again
+        #: and the ones which were not completed are queued again
+        state = self.journal.replay() if resume else None
+        if state:
+            for url, depth in state.queued.items():
+                pending = url not in state.completed and url != self.url
+                self.frontier.restore(url, depth, pending)
+            LOGGER.info("Resuming the crawl with %d pending pages", len(state.pending))
+        self.frontier.journal = self.journal
+
+        if state and self.url in state.completed:
+            self.file_path = state.completed[self.url]
+        else:
+            #: The first page is crawled right away so that
+            #: its final url and file path are known
+            self.frontier.accept(self.url, 0)
+            self.journal.queued(self.url, 0)
+            wp = self.crawl_page(self.url, 0)
+            self.file_path = wp.utx.file_path
+            del wp
+
+        workers = [threading.Thread(target=self._work, name='pywebcopy-page-%d' % i)
+                   for i in range(max_workers)]
+        for worker in workers:
+            worker.start()
+
+        self.frontier.join()
+        self.frontier.close(len(workers))
+        for worker in workers:
+            worker.join()
+
+        #: Pages are recorded as completed once their files are saved,
+        #: the journal is closed after the last of them is
+        SCHEDULER.join()
+        POOL.join()
+        self.journal.close()
+        self.files.close()
 
     crawl = run
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.css
+~~~~~~~~~~~~~
+
+Single pass tokenizer which finds and rewrites the links of a stylesheet.
+
+Comments and strings are tokens of their own, so that an `url()` written
+inside them is left alone, and every `url()` and `@import` is resolved
+only once however many times it appears in the stylesheet.
+
+The `STYLESHEETS` graph remembers every stylesheet of the process and
+which stylesheets it imports, so that each of them is processed only
+once however many pages link it, and circular imports end.
+
+usage::
+    >>> from pywebcopy.css import rewrite_css
+    >>> rewrite_css(b'a{background:url("x.png")} b{background:url(x.png)}',
+    ...             lambda url: b'img/' + url)
+    b'a{background:url("img/x.png")} b{background:url(img/x.png)}'
+
+"""
+
+import re
+import threading
+
+from . import LOGGER
+
+
+__all__ = ['CSS_TOKENS_RE', 'iter_css_urls', 'rewrite_css', 'StylesheetGraph', 'STYLESHEETS']
+
+
+CSS_TOKENS_RE = re.compile(br'''
+    # positions which cannot start a token are skipped at once
+    (?=[/uU@"'])
+    (?: (?P<comment> /\*.*?(?:\*/|\Z) )
+  | (?P<url> url\(\s*(?:
+        "(?P<dq>[^"]*)"
+      | '(?P<sq>[^']*)'
+      | (?P<bare>[^)\s'"]*)
+    )\s*\) )
+  | (?P<import> @import\s*(?P<iq>["'])(?P<iurl>.*?)(?P=iq) )
+  | (?P<string> "(?:[^"\\\n]|\\.)*" | '(?:[^'\\\n]|\\.)*' ) )
+''', re.I | re.S | re.X)
+"""Matches the comments, strings, url() and @import declarations of a css file."""
+
+#: Tokens which are copied as they are
+_OPAQUE = frozenset(['comment', 'string'])
+
+#: Links which point to nothing which could be downloaded
+_SKIPPED = (b'data:', b'#', b'about:', b'javascript:')
+
+
+def _link(match):
+    """Url and quote character of an url() or @import token, or None
+    for the other tokens and the links which are not downloadable."""
+    kind = match.lastgroup
+    if kind == 'url':
+        if match.group('dq') is not None:
+            url, quote = match.group('dq'), b'"'
+        elif match.group('sq') is not None:
+            url, quote = match.group('sq'), b"'"
+        else:
+            url, quote = match.group('bare'), b''
+    elif kind == 'import':
+        url, quote = match.group('iurl'), match.group('iq')
+    else:
+        return None
+
+    url = url.strip()
+    if not url or url.lower().startswith(_SKIPPED):
+        return None
+    return kind, url, quote
+
+
+def iter_css_urls(contents):
+    """Yields every downloadable link of a stylesheet once, in order.
+
+    :param bytes contents: the stylesheet
+    :rtype: generator
+    """
+    seen = set()
+    for match in CSS_TOKENS_RE.finditer(contents):
+        link = _link(match)
+        if link is not None and link[1] not in seen:
+            seen.add(link[1])
+            yield link[1]
+
+
+def rewrite_css(contents, resolve):
+    """Rewrites the links of a stylesheet in a single pass.
+
+    :param bytes contents: the stylesheet
+    :param resolve: callable which gets a link and returns its replacement,
+        or None to leave the link as is; it is called once per distinct link
+    :rtype: bytes
+    """
+    resolved = {}
+
+    def repl(match):
+        if match.lastgroup in _OPAQUE:
+            return match.group(0)
+        link = _link(match)
+        if link is None:
+            return match.group(0)
+
+        kind, url, quote = link
+        try:
+            new = resolved[url]
+        except KeyError:
+            new = resolved[url] = resolve(url)
+        if new is None:
+            return match.group(0)
+
+        if kind == 'import':
+            return b'@import ' + quote + new + quote
+        return b'url(' + quote + new + quote + b')'
+
+    return CSS_TOKENS_RE.sub(repl, contents)
+
+
+class _Stylesheet(object):
+    __slots__ = ('url', 'file_path', 'imports')
+
+    def __init__(self, url, file_path):
+        self.url = url
+        self.file_path = file_path
+        self.imports = set()
+
+
+class StylesheetGraph(object):
+    """Thread safe graph of the stylesheets and their imports.
+
+    A stylesheet is claimed by the first handler which gets to it, the
+    others leave it alone since its rewritten copy is saved already or
+    is about to be.
+    """
+
+    def __init__(self):
+        self.cycles = []
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<StylesheetGraph: %d stylesheets>' % len(self._nodes)
+
+    def __contains__(self, url):
+        return url in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def claim(self, url, file_path):
+        """Claims the processing of a stylesheet.
+
+        A stylesheet is processed again only if it is saved to another
+        file, like in the project folder of a later project.
+
+        :param str url: url of the stylesheet
+        :param str file_path: path the stylesheet is saved to
+        :rtype: bool
+        :returns: True if the caller has to process the stylesheet
+        """
+        with self._lock:
+            node = self._nodes.get(url)
+            if node is not None and node.file_path == file_path:
+                return False
+            self._nodes[url] = _Stylesheet(url, file_path)
+            return True
+
+    def release(self, url, file_path):
+        """Gives up the claim of a stylesheet which could not be
+        processed, thus a later reference to it tries again.
+
+        :param str url: url of the stylesheet
+        :param str file_path: path the stylesheet was claimed for
+        """
+        with self._lock:
+            node = self._nodes.get(url)
+            if node is not None and node.file_path == file_path:
+                node.file_path = None
+
+    def add_import(self, url, imported):
+        """Records that a stylesheet imports another one.
+
+        :param str url: url of the importing stylesheet
+        :param str imported: url of the imported stylesheet
+        :rtype: bool
+        :returns: False if the import closes a cycle
+        """
+        with self._lock:
+            node = self._nodes.get(url)
+            if node is None:
+                node = self._nodes[url] = _Stylesheet(url, None)
+            node.imports.add(imported)
+            cycle = self._path(imported, url)
+
+        if cycle is None:
+            return True
+        cycle = [url] + cycle
+        LOGGER.warning("Circular stylesheet imports %s", ' -> '.join(cycle))
+        self.cycles.append(cycle)
+        return False
+
+    def _path(self, start, end):
+        """Chain of imports from one stylesheet to another, or None."""
+        stack, parents = [start], {start: None}
+        while stack:
+            url = stack.pop()
+            if url == end:
+                path = []
+                while url is not None:
+                    path.append(url)
+                    url = parents[url]
+                return path[::-1]
+            node = self._nodes.get(url)
+            for imported in (node.imports if node is not None else ()):
+                if imported not in parents:
+                    parents[imported] = url
+                    stack.append(imported)
+        return None
+
+    def imports(self, url):
+        """Urls of the stylesheets imported by a stylesheet.
+
+        :rtype: set
+        """
+        node = self._nodes.get(url)
+        return set(node.imports) if node is not None else set()
+
+    def clear(self):
+        with self._lock:
+            self._nodes.clear()
+            self.cycles = []
+
+
+STYLESHEETS = StylesheetGraph()
+"""Stylesheet graph of the process."""
@@ -12,26 +12,46 @@ import os.path
 from io import BytesIO
 from typing import IO
 from mimetypes import guess_all_extensions
-from shutil import copyfileobj
-from threading import Thread
 
 from six.moves.urllib.request import pathname2url
 
 from . import LOGGER
 from .configs import config
-from .core import get, _watermark, is_allowed
-from .globals import CSS_IMPORTS_RE, CSS_URLS_RE
+from .content_store import CONTENT_STORE
+from .css import STYLESHEETS, rewrite_css
+from .http_cache import http_cache
+from .metrics import METRICS
+from .core import get, _watermark, is_allowed, write_stream, file_exists
 from .urls import URLTransformer, relate
+from .scheduler import SCHEDULER
 
 
-class _FileMixin(URLTransformer, Thread):
+class _FileMixin(URLTransformer):
     rel_path = None     # Initialiser for a dummy use case
 
     def __init__(self, url, base_url=None, base_path=None):
         URLTransformer.__init__(self, url, base_url, base_path)
-        Thread.__init__(self)
+        self._future = None
         self.__dict__['save_file'] = self.run
 
+    def start(self):
+        """Schedules the `run` method of this file on the shared worker pool
+        behind the other files of the same host.
+
+        :rtype: concurrent.futures.Future
+        :returns: future which is done when the file is saved
+        """
+        self._future = SCHEDULER.submit(self.url, self.run)
+        return self._future
+
+    def join(self, timeout=None):
+        """Blocks until the file submitted by `start` is saved."""
+        if self._future is not None:
+            self._future.exception(timeout)
+
+    def is_alive(self):
+        return self._future is not None and not self._future.done()
+
     def run(self):
         pass
 
@@ -82,23 +102,31 @@ class FileMixin(_FileMixin):
         assert isinstance(file_path, str), "Download location must be a string!"
         assert isinstance(url, str), "File url must be a string!"
 
-        if os.path.exists(file_path):
-            if not config['over_write']:
-                LOGGER.info("File already exists at location: %r" % file_path)
+        cache = http_cache()
+        headers = {}
+
+        if file_exists(file_path):
+            if cache is not None:
+                #: Existing files are revalidated with the server
+                if cache.fresh(url):
+                    LOGGER.info("File at location %r is still fresh", file_path)
+                    return
+                headers = cache.request_headers(url)
+            elif not config['over_write']:
+                LOGGER.info("File already exists at location: %r", file_path)
                 return
-        else:
-            #: Make the directories
-            try:
-                os.makedirs(os.path.dirname(file_path))
-            except FileExistsError:
-                pass
 
-        req = get(url, stream=True)
-        req.raw.decode_content = True
+        req = get(url, stream=True, headers=headers)
 
-        if req is None or not req.ok:
+        if req is not None and req.status_code == 304 and cache is not None:
+            LOGGER.info("File at location %r is not modified", file_path)
+            cache.refresh(url, req)
+            return
+
+        #: Not modified is no content if the request was not conditional
+        if req is None or not req.ok or req.status_code == 304:
             LOGGER.error('Failed to load the content of file %s '
-                         'from %s' % (file_path, url))
+                         'from %s', file_path, url)
             return
 
         #: First check if the extension present in the url is allowed or not
@@ -119,27 +147,27 @@ class FileMixin(_FileMixin):
                     break
             else:
                 LOGGER.error("File of type %r at url %r is not allowed "
-                             "to be downloaded!" % (file_ext, url))
+                             "to be downloaded!", file_ext, url)
                 return
 
         try:
             # case the function will catch it and log it then return None
-            LOGGER.info("Writing file at location %s" % file_path)
-            with open(file_path, 'wb') as f:
-                #: Actual downloading
-                copyfileobj(req.raw, f)
-                f.write(_watermark(url))
+            LOGGER.info("Writing file at location %s", file_path)
+            #: Actual downloading, streamed to the disk in chunks
+            write_stream(file_path, req, _watermark(url))
+            if cache is not None:
+                cache.update(url, req)
         except OSError:
             # LOGGER.critical(e)
             LOGGER.critical("Download failed for the file of "
-                            "type %s to location %s" % (file_ext, file_path))
+                            "type %s to location %s", file_ext, file_path)
         except Exception as e:
             LOGGER.critical(e)
         else:
             LOGGER.success('File of type %s written successfully '
-                           'to %s' % (file_ext, file_path))
+                           'to %s', file_ext, file_path)
 
-    def write_file(self, file_like_object):
+    def write_file(self, file_like_object, overwrite=None):
         """
         Same as download file but this instead of downloading the
         content it requires you to supply the content as a file like object.
@@ -148,6 +176,8 @@ class FileMixin(_FileMixin):
         ----------
         file_like_object: IO | BytesIO
             Contents of the file to be written to disk
+        overwrite: bool
+            Whether to replace an existing file, config['over_write'] if None
 
         Returns
         -------
@@ -164,36 +194,30 @@ class FileMixin(_FileMixin):
         assert isinstance(file_path, str), "Download location must be a string!"
         assert isinstance(url, str), "File url must be a string!"
 
-        if os.path.exists(file_path):
-            if not config['over_write']:
-                LOGGER.info("File already exists at location: %r" % file_path)
+        if overwrite is None:
+            overwrite = config['over_write']
+
+        if file_exists(file_path):
+            if not overwrite:
+                LOGGER.info("File already exists at location: %r", file_path)
                 return
-        else:
-            #: Make the directories
-            try:
-                os.makedirs(os.path.dirname(file_path))
-            except FileExistsError:
-                pass
 
         if not is_allowed(file_ext):
             LOGGER.error("File of type %r at url %r is not allowed to be "
-                         "downloaded!" % (file_ext, url))
+                         "downloaded!", file_ext, url)
             return
 
         try:
             # case the function will catch it and log it then return None
-            LOGGER.info("Writing file at location %s" % file_path)
-            with open(file_path, 'wb') as f:
-                #: Actual downloading
-                copyfileobj(file_like_object, f)
-                f.write(_watermark(url))
+            LOGGER.info("Writing file at location %s", file_path)
+            write_stream(file_path, file_like_object, _watermark(url))
         except OSError:
             LOGGER.exception("Download failed for the file of type %s to "
-                             "location %s" % (file_ext, file_path), exc_info=True)
+                             "location %s", file_ext, file_path, exc_info=True)
         except Exception as e:
             LOGGER.critical(e)
         else:
-            LOGGER.success('File of type %s written successfully to %s' % (file_ext, file_path))
+            LOGGER.success('File of type %s written successfully to %s', file_ext, file_path)
 
 
 class TagBase(FileMixin):
@@ -252,20 +276,23 @@ class LinkTag(TagBase):
     contents = b''  # binary file data
     files = 0       # sub-files counter
 
-    def repl(self, match_obj):
-        """Processes an url and returns a suited replaceable string.
+    def submit_linked_file(self, element):
+        """Starts the download of a file linked from this stylesheet.
+        Can be overridden to schedule the download some other way.
 
-        :type match_obj: re.MatchObject
-        :param match_obj: regex match object to be processed
-        :rtype: str
-        :return: processed url
+        :type element: TagBase
+        :param element: handler of the linked file
         """
-        url = match_obj.group(1)
+        element.start()
 
-        # url can be base64 encoded content which is not required to be stored
-        if url[:4] == b'data':
-            return url
+    def rewrite_url(self, url):
+        """Starts the download of a file linked from this stylesheet
+        and returns the link to its local copy.
 
+        :param bytes url: link found in the stylesheet
+        :rtype: bytes
+        :return: path of the local copy relative to this stylesheet
+        """
         # a path is generated by the cssAsset object and tried to store the file
         # but file could be corrupted to open or write
         # NOTE: self.base_path property needs to be set in order to work properly
@@ -281,42 +308,33 @@ class LinkTag(TagBase):
         # needs to be scanned for urls.
         if str_url.endswith('.css'):    # if the url is of proper style sheet
             new_element = LinkTag(str_url, self.url, base_path)
+            STYLESHEETS.add_import(self.url, new_element.url)
 
         else:
             new_element = TagBase(str_url, self.url, base_path)
 
-        # Start the download of the file
-        new_element.start()
+        # Submit the download of the file to the workers
+        self.submit_linked_file(new_element)
         self.files += 1
 
         # generate a relative path for this downloaded file
-        url = pathname2url(relate(new_element.file_path, self.file_path))
-
-        return "url({})".format(url).encode()
+        return pathname2url(relate(CONTENT_STORE.canonical_path(new_element.file_path),
+                                   self.file_path)).encode()
 
     def extract_css_urls(self):
         """Extracts url() links and @imports in css.
 
         All the linked files will be saved and file path
-        would be replaced accordingly
+        would be replaced accordingly, each distinct link
+        is downloaded only once.
         """
         assert self.contents is not None, "Fetch the file content first."
 
-        # the regex matches all those with double mix-match quotes and normal ones
-        self.contents = CSS_URLS_RE.sub(self.repl, self.contents)
-        self.contents = CSS_IMPORTS_RE.sub(self.repl, self.contents)
+        with METRICS.timer('parse'):
+            self.contents = rewrite_css(self.contents, self.rewrite_url)
 
         # log amount of links found
-        LOGGER.info('%d CSS linked files are found in file %s' % (self.files, self.file_path))
-
-        # wait for the still downloading files
-        # for t in self.files:
-        #    if t is _main():
-        #        continue
-        #    t.join()
-
-        # otherwise return the rewritten bytes self.contents
-        # return self.contents
+        LOGGER.info('%d CSS linked files are found in file %s', self.files, self.file_path)
 
     def run(self):
         """
@@ -329,32 +347,59 @@ class LinkTag(TagBase):
         # LinkTags can also be specified for elements like favicon etc. Thus a check is necessary
         # to validate it is a proper css file or not.
         if not self.file_name.endswith('.css'):
-            super(LinkTag, self).run()
+            return super(LinkTag, self).run()
 
-        # Custom request object creation
-        req = get(self.url, stream=True)
-
-        # if some error occurs
-        if not req or not req.ok:
-            LOGGER.error("URL returned an unknown response %s" % self.url)
+        #: A stylesheet linked from many pages, or imported in a
+        #: circle, is fetched and rewritten only once
+        if not STYLESHEETS.claim(self.url, self.file_path):
+            LOGGER.debug("Stylesheet %s is already processed", self.url)
             return
 
-        # Send the contents for urls
-        self.contents = req.content
+        #: The stylesheet is parsed again even when it is not modified
+        #: so that its linked files are revalidated too
+        cache = http_cache()
+        cached = None
+        if file_exists(self.file_path):
+            if cache is not None:
+                cached = cache.body(self.url)
+            elif not config['over_write']:
+                LOGGER.info("File already exists at location: %r", self.file_path)
+                return
 
-        # XXX self.extract_css_urls()
+        if cached is not None and cache.fresh(self.url):
+            modified = False
+        else:
+            # Custom request object creation
+            headers = cache.request_headers(self.url) if cached is not None else {}
+            req = get(self.url, stream=True, headers=headers)
+            modified = not (cached is not None and req.status_code == 304)
+
+            if not modified:
+                cache.refresh(self.url, req)
+
+            # if some error occurs
+            elif not req or not req.ok:
+                LOGGER.error("URL returned an unknown response %s", self.url)
+                STYLESHEETS.release(self.url, self.file_path)
+                return
+
+        # Send the contents for urls
+        if modified:
+            self.contents = METRICS.read_body(req)
+            if cache is not None:
+                cache.update(self.url, req, body=self.contents)
+        else:
+            LOGGER.info("Stylesheet at location %r is not modified", self.file_path)
+            self.contents = cached[0]
 
         assert self.contents is not None, "File doesn't have any content!"
 
         # Extracts urls from `url()` and `@imports` rules in the css file.
-        # the regex matches all those with double mix-match quotes and normal ones
         # all the linked files will be saved and file paths would be replaced accordingly
+        self.extract_css_urls()
 
-        self.contents = CSS_URLS_RE.sub(self.repl, self.contents)
-        self.contents = CSS_IMPORTS_RE.sub(self.repl, self.contents)
-
-        # log amount of links found
-        LOGGER.info('%d CSS linked files are found in file %s' % (self.files, self.file_path))
-
-        # Save the content
-        self.write_file(BytesIO(self.contents))
+        # Save the content, a saved stylesheet is replaced only
+        # if it is revalidated or overwriting is asked for
+        if modified:
+            overwrite = cache is not None or bool(config['over_write'])
+            self.write_file(BytesIO(self.contents), overwrite=overwrite)
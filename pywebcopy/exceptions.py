@@ -44,5 +44,9 @@ class UrlTransformerNotSetup(PywebcopyError, UnboundLocalError):
     """UrlTransformer method is not subclass and not being made available."""
 
 
+class FileTooLargeError(PywebcopyError):
+    """File is larger than the maximum file size allowed by config."""
+
+
 class RequiredAttributesMissing(PywebcopyError):
     """You have called a class or function without setting up environment or attributes."""
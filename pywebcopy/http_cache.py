@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.http_cache
+~~~~~~~~~~~~~~~~~~~~
+
+Persistent cache of the http validators of the downloaded urls.
+
+Enabled by config['http_cache'], the ETag, Last-Modified and Cache-Control
+headers of every saved url are kept in a sqlite database, thus the next
+mirror of the same project sends conditional requests and the server can
+answer with a bodyless `304 Not Modified` for the unchanged urls.
+
+usage::
+    >>> from pywebcopy.http_cache import http_cache
+    >>> cache = http_cache()    # None if the cache is disabled
+    >>> resp = SESSION.get(url, headers=cache.request_headers(url))
+    >>> if resp.status_code == 304:
+    ...     cache.refresh(url, resp)
+
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from time import time
+
+from .configs import config
+
+
+__all__ = ['HttpCache', 'http_cache']
+
+
+_max_age_re = re.compile(r'max-age\s*=\s*(\d+)', re.I)
+
+
+def _expiry(headers, now):
+    """Returns the time until which the response is fresh according
+    to its Cache-Control header, None if it must not be stored."""
+    cc = headers.get('cache-control', '').lower()
+    if 'no-store' in cc:
+        return None
+    if 'no-cache' in cc:
+        return 0
+    m = _max_age_re.search(cc)
+    return now + int(m.group(1)) if m else 0
+
+
+class HttpCache(object):
+    """Stores the validators of urls, and the bodies of the pages and
+    stylesheets which need to be parsed again even when unchanged.
+
+    :param str path: location of the database file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                         'expires REAL, encoding TEXT, body BLOB)')
+
+    def __repr__(self):
+        return '<HttpCache: %s>' % self.path
+
+    def _entry(self, url):
+        with self._lock:
+            return self._db.execute(
+                'SELECT etag, last_modified, expires, encoding, body '
+                'FROM entries WHERE url = ?', (url,)).fetchone()
+
+    def fresh(self, url):
+        """Whether the stored response of the url has not expired yet,
+        thus it can be used without asking the server.
+
+        :rtype: bool
+        """
+        entry = self._entry(url)
+        return entry is not None and (entry[2] or 0) > time()
+
+    def request_headers(self, url):
+        """Returns the conditional request headers for the url.
+
+        :rtype: dict
+        """
+        entry = self._entry(url)
+        headers = {}
+        if entry is not None:
+            if entry[0]:
+                headers['If-None-Match'] = entry[0]
+            if entry[1]:
+                headers['If-Modified-Since'] = entry[1]
+        return headers
+
+    def body(self, url):
+        """Returns the stored body and its encoding for the url.
+
+        :returns: two-tuple of bytes and encoding, or None if no body is stored
+        """
+        entry = self._entry(url)
+        if entry is None or entry[4] is None:
+            return None
+        return entry[4], entry[3]
+
+    def update(self, url, resp, body=None):
+        """Stores the validators of a full response of the url.
+
+        :param str url: url which was requested
+        :param resp: `requests.Response` of the url
+        :param bytes body: body to store for parsing it again later
+        """
+        expires = _expiry(resp.headers, time())
+        etag = resp.headers.get('etag')
+        last_modified = resp.headers.get('last-modified')
+
+        with self._lock:
+            if expires is None or not (etag or last_modified or expires):
+                self._db.execute('DELETE FROM entries WHERE url = ?', (url,))
+                return
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                (url, etag, last_modified, expires,
+                 resp.encoding if body is not None else None, body))
+
+    def refresh(self, url, resp):
+        """Updates the entry of the url after a `304 Not Modified` response."""
+        expires = _expiry(resp.headers, time()) or 0
+        with self._lock:
+            self._db.execute(
+                'UPDATE entries SET expires = ?, '
+                'etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) '
+                'WHERE url = ?',
+                (expires, resp.headers.get('etag'), resp.headers.get('last-modified'), url))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def http_cache():
+    """Returns the cache of the current project or None if it is disabled
+    by config['http_cache']. The database is kept at the path set in
+    config['http_cache'], or in the project folder if it is just True.
+
+    :rtype: HttpCache
+    """
+    global _cache
+
+    setting = config.get('http_cache')
+    if not setting:
+        return None
+
+    if isinstance(setting, str):
+        path = setting
+    else:
+        path = os.path.join(config['project_folder'], '.http_cache.sqlite')
+
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            if _cache is not None:
+                _cache.close()
+            folder = os.path.dirname(path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            _cache = HttpCache(path)
+        return _cache
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.journal
+~~~~~~~~~~~~~~~~~
+
+Append-only journal of a crawl, from which an interrupted crawl is resumed.
+
+Every line of the journal is a json object recording an url which got
+queued, completed (with its file path) or failed. Lines are flushed as
+soon as they are written, a line cut short by a crash is ignored.
+
+usage::
+    >>> from pywebcopy.journal import CrawlJournal
+    >>> journal = CrawlJournal('/path/to/project/.crawl_journal.jsonl', reset=False)
+    >>> state = journal.replay()
+    >>> state.pending     # urls queued but not completed, with their depths
+    [('http://some-site.com/page2.html', 1)]
+
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from . import LOGGER
+from .configs import config
+
+
+__all__ = ['CrawlJournal', 'JournalState', 'journal_path']
+
+
+class JournalState(namedtuple('JournalState', 'queued completed failed')):
+    """State of a crawl rebuilt from its journal.
+
+    queued: ordered dict of every queued url to its depth
+    completed: dict of the completed urls to their file paths
+    failed: dict of the failed urls to their errors
+    """
+    __slots__ = ()
+
+    @property
+    def pending(self):
+        """Queued urls which are not completed, with their depths."""
+        return [(u, d) for u, d in self.queued.items() if u not in self.completed]
+
+
+def journal_path():
+    """Location of the journal of the current project.
+
+    :rtype: str
+    """
+    return os.path.join(config['project_folder'], '.crawl_journal.jsonl')
+
+
+class CrawlJournal(object):
+    """Thread safe append-only record of the urls of a crawl.
+
+    :param str path: location of the journal file
+    :param bool reset: whether to discard the records of a previous crawl
+    """
+
+    def __init__(self, path, reset=True):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        self._fh = open(path, 'w' if reset else 'a+', encoding='utf-8')
+
+        if not reset and self._fh.tell():
+            # end a line which was cut short by a crash
+            self._fh.seek(self._fh.tell() - 1)
+            if self._fh.read(1) != '\n':
+                self._fh.write('\n')
+
+    def __repr__(self):
+        return '<CrawlJournal: %s>' % self.path
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._fh.closed:
+                return
+            self._fh.write(line)
+            self._fh.flush()
+
+    def queued(self, url, depth):
+        self._write({'e': 'queued', 'url': url, 'depth': depth})
+
+    def completed(self, url, path):
+        self._write({'e': 'completed', 'url': url, 'path': path})
+
+    def failed(self, url, error):
+        self._write({'e': 'failed', 'url': url, 'error': str(error)})
+
+    def replay(self):
+        """Reads back the state of the crawl recorded in the journal.
+
+        :rtype: JournalState
+        """
+        queued, completed, failed = OrderedDict(), {}, {}
+
+        with self._lock:
+            self._fh.flush()
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                for line in fh:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # line cut short by a crash
+                        continue
+                    event, url = record.get('e'), record.get('url')
+                    if event == 'queued':
+                        queued.setdefault(url, record.get('depth', 0))
+                    elif event == 'completed':
+                        completed[url] = record.get('path')
+                        failed.pop(url, None)
+                    elif event == 'failed':
+                        failed[url] = record.get('error')
+
+        LOGGER.info("Journal %s has %d queued, %d completed and %d failed urls",
+                    self.path, len(queued), len(completed), len(failed))
+        return JournalState(queued, completed, failed)
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
@@ -9,8 +9,13 @@ Usage:
 - call log, debug, info etc. on the instance
 """
 
+import atexit
 import time
 import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from six.moves.queue import Queue
 
 from .globals import VERSION
 
@@ -218,20 +223,101 @@ def new_console_logger(level=logging.WARNING):
     return c_logger
 
 
-def new_file_logger(file_path, mode):
+def new_file_logger(file_path, mode, level=logging.DEBUG):
     """Creates a new file logging handler for use in logger.
 
     :param file_path: where the file will be created
     :param mode: mode in which the file will be opened. See loggings module
+    :param level: level of the records written to the file
     :rtype: logging.FileHanlder
     :return: new logging.FileHandler object
     """
     f_logger = logging.FileHandler(file_path, mode)
-    f_logger.setLevel(logging.DEBUG)
+    f_logger.setLevel(level)
     f_logger.setFormatter(logFormatter)
     return f_logger
 
 
+# ============================================================
+#   Logging in a background thread
+# ============================================================
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler which leaves the formatting of the records to the
+    handlers of the listener, thus it is done in the thread of the
+    listener instead of the thread which logs."""
+
+    def prepare(self, record):
+        return record
+
+
+_queue_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+def start_queue_logging(*handlers):
+    """Routes the records of the global logger through a queue to the
+    handlers, which format and write them in a background thread. Thus a
+    thread which logs never waits for the disk or the console.
+
+    The handlers of an earlier call are flushed and closed.
+
+    :param handlers: handlers which write the records
+    :rtype: QueueListener
+    """
+    global _queue_handler, _listener
+
+    stop_queue_logging()
+    with _queue_lock:
+        queue = Queue()
+        _queue_handler = DeferredQueueHandler(queue)
+        _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        LOGGER.addHandler(_queue_handler)
+        return _listener
+
+
+def flush_logs():
+    """Blocks until every queued record is written."""
+    with _queue_lock:
+        if _listener is not None:
+            _listener.queue.join()
+
+
+def stop_queue_logging():
+    """Writes the queued records, stops the background thread and closes
+    its handlers."""
+    global _queue_handler, _listener
+
+    with _queue_lock:
+        if _listener is None:
+            return
+        LOGGER.removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _queue_handler = _listener = None
+
+
+def log_directly():
+    """Passes the records straight to the handlers of the background
+    thread, for a forked process in which the thread does not run."""
+    global _queue_handler, _listener
+
+    with _queue_lock:
+        if _listener is None:
+            return
+        LOGGER.removeHandler(_queue_handler)
+        for handler in _listener.handlers:
+            LOGGER.addHandler(handler)
+        _queue_handler = _listener = None
+
+
+atexit.register(stop_queue_logging)
+
+
 # Example of usage
 if __name__ == "__main__":
     LOGGER.debug("A debug message")
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.metrics
+~~~~~~~~~~~~~~~~~
+
+Timings and counters of a crawl.
+
+Every request is split into the phases it spends its time in, i.e.
+waiting in the queue of the scheduler, connecting, waiting for the first
+byte of the response, transferring the body, parsing and writing to the
+disk. Along with them the status codes, the bytes received from every
+host and the retries are counted.
+
+The numbers are collected all the time, the `save_webpage` and
+`save_website` apis write them to the project folder when
+config['metrics'] is set.
+
+usage::
+    >>> from pywebcopy.metrics import METRICS
+    >>> METRICS.snapshot()['phases']['ttfb']
+    {'count': 120, 'total': 3.52, 'mean': 0.0293, 'min': 0.0041, 'max': 0.412}
+    >>> print(METRICS.to_prometheus())
+
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from time import monotonic
+
+from requests.adapters import HTTPAdapter
+from six.moves.urllib.parse import urlsplit
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+__all__ = ['PHASES', 'Metrics', 'METRICS', 'Transfer', 'TimedReader', 'TimedHTTPAdapter']
+
+
+#: Phases of a request, in the order they happen
+PHASES = ('queue_wait', 'connect', 'ttfb', 'transfer', 'parse', 'write')
+
+
+def _host(url):
+    return urlsplit(url).netloc.lower() if url else ''
+
+
+class _Phase(object):
+    __slots__ = ('count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else None,
+            'min': round(self.min, 6) if self.min is not None else None,
+            'max': round(self.max, 6),
+        }
+
+
+class Transfer(object):
+    """Iterates over the chunks of a body and times the reads of them,
+    thus the time of the transfer is told apart from the time spent on
+    the chunks in between.
+
+    :param chunks: iterable of bytes
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.seconds = 0.0
+        self.size = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = monotonic()
+        try:
+            chunk = next(self._chunks)
+        finally:
+            self.seconds += monotonic() - start
+        self.size += len(chunk)
+        return chunk
+
+    next = __next__
+
+
+class TimedReader(object):
+    """File like object which times the reads of a streamed body, the
+    parser reads the body of a page while it parses it. The transfer is
+    observed once the body is read to its end.
+
+    :param raw: file like object of the body
+    :param str url: url of the response
+    """
+
+    def __init__(self, raw, url):
+        self._raw = raw
+        self.url = url
+        self.seconds = 0.0
+        self.size = 0
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def read(self, size=-1):
+        whole = size is None or size < 0
+        start = monotonic()
+        data = self._raw.read() if whole else self._raw.read(size)
+        self.seconds += monotonic() - start
+        self.size += len(data)
+        if (whole or not data) and not self._done:
+            self._done = True
+            METRICS.received(self.url, self.size, self.seconds)
+        return data
+
+
+class Metrics(object):
+    """Thread safe collection of the timings and counters of a crawl."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def __repr__(self):
+        return '<Metrics: requests=%d>' % sum(self._status.values())
+
+    def reset(self):
+        """Forgets everything collected so far, a new crawl starts."""
+        with self._lock:
+            self._started = monotonic()
+            self._phases = dict((p, _Phase()) for p in PHASES)
+            self._status = {}
+            self._bytes = {}
+            self._requests = {}
+            self._retries = {}
+            self._errors = {}
+
+    def observe(self, phase, seconds):
+        """Adds the duration of a phase of a request.
+
+        :param str phase: one of `PHASES`
+        :param float seconds: duration of the phase
+        """
+        with self._lock:
+            self._phases[phase].add(seconds)
+
+    @contextmanager
+    def timer(self, phase):
+        """Context manager which observes the time spent in its block."""
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.observe(phase, monotonic() - start)
+
+    def _count(self, counter, key, n=1):
+        with self._lock:
+            counter[key] = counter.get(key, 0) + n
+
+    def connected(self, seconds):
+        """Observes a new connection made by the calling thread."""
+        self.observe('connect', seconds)
+        self._local.connect = getattr(self._local, 'connect', 0.0) + seconds
+
+    def request_started(self):
+        """Marks the start of a request by the calling thread.
+
+        :rtype: float
+        :returns: the start time to pass to `response_received`
+        """
+        self._local.connect = 0.0
+        return monotonic()
+
+    def response_received(self, resp, started):
+        """Observes the time to the first byte of a response, its status
+        and the retries it took, see `request_started`.
+
+        :param requests.Response resp: response of which the headers are received
+        :param float started: start time of the request
+        """
+        connect, self._local.connect = getattr(self._local, 'connect', 0.0), 0.0
+        self.observe('ttfb', max(monotonic() - started - connect, 0.0))
+
+        self.responded(resp.url, resp.status_code)
+
+        retries = getattr(getattr(resp, 'raw', None), 'retries', None)
+        history = getattr(retries, 'history', None)
+        if history:
+            self._count(self._retries, _host(resp.url), len(history))
+
+    def responded(self, url, status):
+        """Counts a response of the host of the url with the status code."""
+        self._count(self._requests, _host(url))
+        self._count(self._status, status)
+
+    def failed(self, url):
+        """Counts a request which got no response at all."""
+        self._count(self._errors, _host(url))
+
+    def received(self, url, size, seconds=None):
+        """Adds the bytes of a body and the time of its transfer.
+
+        :param str url: url of the response
+        :param int size: number of bytes of the body
+        :param float seconds: time of the transfer, if known
+        """
+        self._count(self._bytes, _host(url), size)
+        if seconds is not None:
+            self.observe('transfer', seconds)
+
+    def read_body(self, resp):
+        """Reads the whole body of a streamed response and observes its transfer.
+
+        :param requests.Response resp: the response
+        :rtype: bytes
+        """
+        start = monotonic()
+        body = resp.content
+        self.received(resp.url, len(body), monotonic() - start)
+        return body
+
+    def snapshot(self):
+        """Returns everything collected so far.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'wall_time': round(monotonic() - self._started, 6),
+                'phases': dict((p, self._phases[p].as_dict()) for p in PHASES),
+                'status': dict((str(k), v) for k, v in sorted(self._status.items())),
+                'requests': dict(self._requests),
+                'bytes': dict(self._bytes),
+                'retries': dict(self._retries),
+                'errors': dict(self._errors),
+            }
+
+    def to_json(self, snap=None):
+        """:param dict snap: snapshot to format, a new one if None
+        :rtype: str
+        """
+        return json.dumps(snap or self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, snap=None):
+        """Returns the metrics in the text exposition format of prometheus.
+
+        :param dict snap: snapshot to format, a new one if None
+        :rtype: str
+        """
+        snap = snap or self.snapshot()
+        lines = []
+
+        def metric(name, kind, doc, samples):
+            lines.append('# HELP pywebcopy_%s %s' % (name, doc))
+            lines.append('# TYPE pywebcopy_%s %s' % (name, kind))
+            for suffix, labels, value in samples:
+                label = ','.join('%s="%s"' % (k, _escape(v)) for k, v in labels)
+                lines.append('pywebcopy_%s%s%s %s' % (
+                    name, suffix, '{%s}' % label if label else '', _number(value)))
+
+        phases = sorted(snap['phases'].items(), key=lambda p: PHASES.index(p[0]))
+        metric('phase_seconds', 'summary', 'Time spent in each phase of the requests.',
+               [s for p, v in phases for s in (('_sum', [('phase', p)], v['total']),
+                                               ('_count', [('phase', p)], v['count']))])
+        metric('phase_seconds_max', 'gauge', 'Longest time spent in each phase by a request.',
+               [('', [('phase', p)], v['max']) for p, v in phases])
+        metric('responses_total', 'counter', 'Responses by status code.',
+               [('', [('code', k)], v) for k, v in snap['status'].items()])
+        for name, doc in (('requests', 'Requests sent to each host.'),
+                          ('bytes', 'Bytes received from each host.'),
+                          ('retries', 'Retried requests to each host.'),
+                          ('errors', 'Requests to each host which got no response.')):
+            metric('%s_total' % name, 'counter', doc,
+                   [('', [('host', k)], v) for k, v in sorted(snap[name].items())])
+        metric('wall_seconds', 'gauge', 'Time since the start of the crawl.',
+               [('', [], snap['wall_time'])])
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, folder):
+        """Writes the metrics to `metrics.json` and `metrics.prom` in the folder.
+
+        :param str folder: folder to write the files to
+        :rtype: tuple
+        :returns: paths of the written files
+        """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        paths = os.path.join(folder, 'metrics.json'), os.path.join(folder, 'metrics.prom')
+        snap = self.snapshot()
+        for path, text in zip(paths, (self.to_json(snap), self.to_prometheus(snap))):
+            with open(path, 'w') as fh:
+                fh.write(text)
+        return paths
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+METRICS = Metrics()
+"""Global metrics of the current crawl."""
+
+
+class _TimedConnection(object):
+    """Observes the time it takes to connect, tls included."""
+
+    def connect(self):
+        start = monotonic()
+        super(_TimedConnection, self).connect()
+        METRICS.connected(monotonic() - start)
+
+
+class _TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Adapter of `requests` whose connections are timed, see `METRICS`."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.parse_pool
+~~~~~~~~~~~~~~~~~~~~
+
+Pool of processes which parse, rewrite and serialise the html of pages.
+
+Parsing is bound by the cpu and the threads of a crawl take turns on
+it because of the GIL, while fetching is bound by the network. With
+config['parse_processes'] set, the crawler hands the fetched bytes of
+every page to these processes and gets back the rewritten html and the
+urls of the files and pages found in it, which are then downloaded and
+crawled by the threads as usual.
+
+A parser or a tag handler class which the processes cannot import by its
+name, like one defined in a function, is replaced by its nearest base
+which they can. Such a page is parsed in the calling thread instead if
+the class overrides anything of that base, see `ParsePool.can_parse`.
+
+usage::
+    >>> from pywebcopy.parse_pool import ParsePool
+    >>> pool = ParsePool(processes=4)
+    >>> html, links = pool.parse('http://some-site.com/', b'<html>...</html>', 'utf-8')
+    >>> links
+    [('img', 'http://some-site.com/logo.png'), ('a', 'http://some-site.com/about.html')]
+    >>> pool.shutdown()
+
+"""
+
+import atexit
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from . import LOGGER, parsers
+from .configs import config
+from .content_store import CONTENT_STORE
+from .logger import log_directly
+
+
+__all__ = ['ParsePool', 'parse_pool', 'close_parse_pool']
+
+
+def _portable(cls):
+    """The class itself if another process can import it by its name,
+    otherwise its nearest base which can be, like for the handlers
+    which the crawler creates on the fly."""
+    for klass in cls.__mro__:
+        module = sys.modules.get(klass.__module__)
+        if getattr(module, klass.__qualname__, None) is klass:
+            return klass
+    return object
+
+
+#: Names which every class defines for itself
+_CLASS_NAMES = frozenset(['__module__', '__qualname__', '__doc__', '__dict__', '__weakref__'])
+
+
+def _overrides(cls):
+    """Names which the class defines on top of its portable base,
+    except the ones it declares in `process_local`, which only
+    matter to the calling process.
+
+    :rtype: set
+    """
+    base = _portable(cls)
+    names = set()
+    for klass in cls.__mro__:
+        if klass is base:
+            break
+        names.update(klass.__dict__)
+    return names - _CLASS_NAMES - set(getattr(cls, 'process_local', ()))
+
+
+def _parse_page(page_class, element_map, settings, aliases, url, source, encoding):
+    """Runs in a process of the pool.
+
+    :returns: two-tuple of the rewritten html and a list of the
+        distinct (tag, url) pairs of the files it links to
+    """
+    config.update(settings)
+    parsers.element_map = element_map
+    # links point at the canonical copies of the duplicate files
+    CONTENT_STORE.set_aliases(aliases)
+
+    wp = page_class()
+    wp.set_source(BytesIO(source), encoding, url)
+
+    out = BytesIO()
+    if config.get('stream_html'):
+        wp.__stream__(out)
+    else:
+        wp.__parse__()
+        wp.root.getroottree().write(out, method='html')
+    # a page links the same files many times over, each is sent back once
+    return out.getvalue(), sorted(set((f.tag, f.url) for f in wp))
+
+
+def _ready():
+    return os.getpid()
+
+
+class ParsePool(object):
+    """Process pool for the cpu bound part of saving a web page.
+
+    The configuration, the tag handlers and the duplicate files known to
+    `CONTENT_STORE` are sent along with every page, thus the processes
+    always work with the ones of the calling process. Handler classes
+    which cannot be imported by their name are replaced by their nearest
+    importable base.
+
+    :param int processes: number of processes, the number of cpus by default
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+        self._warned = set()
+
+    def __repr__(self):
+        return '<ParsePool: %d processes>' % self.processes
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.processes, initializer=log_directly)
+            return self._executor
+
+    def start(self):
+        """Starts the processes right away.
+
+        They are forked from the calling process, thus it is best done
+        before it starts threads of its own.
+        """
+        executor = self._get_executor()
+        for future in [executor.submit(_ready) for _ in range(self.processes)]:
+            future.result()
+
+    def can_parse(self, page_class=None):
+        """Tells whether the processes parse a page like the calling
+        process would, which is not the case if the parser or a tag
+        handler can be sent only as a base class which behaves differently.
+        A warning is logged the first time a class is found to be so.
+
+        :param page_class: class of the parser of the page, `WebPage` by default
+        :rtype: bool
+        """
+        classes = list(parsers.element_map.values())
+        if page_class is not None:
+            classes.append(page_class)
+
+        portable = True
+        for cls in classes:
+            overrides = _overrides(cls)
+            if not overrides:
+                continue
+            portable = False
+            if cls not in self._warned:
+                self._warned.add(cls)
+                LOGGER.warning("Class %r cannot be sent to the parse pool and overrides %s "
+                               "of %r, the pages are parsed in the threads instead",
+                               cls, ', '.join(sorted(overrides)), _portable(cls))
+        return portable
+
+    def submit(self, url, source, encoding=None, page_class=None):
+        """Sends a page to a process of the pool.
+
+        :param str url: url of the page
+        :param bytes source: fetched contents of the page
+        :param str encoding: encoding of the contents, if known
+        :param page_class: class of the parser of the page, `WebPage` by default
+        :rtype: concurrent.futures.Future
+        """
+        if page_class is None:
+            from .webpage import WebPage
+            page_class = WebPage
+
+        element_map = {tag: _portable(cls) for tag, cls in parsers.element_map.items()}
+        aliases = CONTENT_STORE.aliases() if config.get('dedupe_files') else {}
+        return self._get_executor().submit(
+            _parse_page, _portable(page_class), element_map,
+            dict(config), aliases, url, source, encoding)
+
+    def parse(self, url, source, encoding=None, page_class=None):
+        """Parses a page in a process of the pool and waits for the result.
+
+        :rtype: tuple
+        :returns: two-tuple of the rewritten html and a list of the
+            (tag, url) pairs of the files it links to
+        """
+        return self.submit(url, source, encoding, page_class).result()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parse_pool():
+    """Returns the parse pool of the process, or None if
+    config['parse_processes'] is not set.
+
+    :rtype: ParsePool
+    """
+    global _pool
+
+    processes = config.get('parse_processes')
+    if not processes:
+        return None
+
+    with _pool_lock:
+        if _pool is None or _pool.processes != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            LOGGER.info("Parsing the pages in %d processes", processes)
+            _pool = ParsePool(processes)
+        return _pool
+
+
+@atexit.register
+def close_parse_pool():
+    """Stops the processes of the parse pool, if any."""
+    global _pool
+
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
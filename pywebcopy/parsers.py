@@ -11,6 +11,7 @@ import re
 from datetime import datetime
 from functools import lru_cache
 from threading import current_thread
+from time import monotonic
 from collections import namedtuple
 
 from bs4 import BeautifulSoup
@@ -26,8 +27,10 @@ from six.moves.urllib.request import pathname2url
 from w3lib.encoding import html_to_unicode
 
 from . import LOGGER, config as global_config, SESSION
+from .content_store import CONTENT_STORE
 from .elements import LinkTag, AnchorTag, ScriptTag, ImgTag, TagBase
 from .exceptions import UrlRefusedByTagHandlerError, UrlTransformerNotSetup
+from .metrics import METRICS
 from .globals import SINGLE_LINK_ATTRIBS, VERSION, MARK, LIST_LINK_ATTRIBS
 from .urls import relate
 
@@ -77,6 +80,135 @@ def cached_path2url_relate(target_file, start_file):
     return pathname2url(relate(target_file, start_file))
 
 
+@lru_cache(maxsize=4096)
+def _link_dispatch(tag, names, single_attrs, list_attrs):
+    """Dispatch index of the elements with a tag and a set of attribute
+    names, pairs of a place which can contain links and the kind of its value.
+
+    It is computed once for every distinct combination, an element
+    for which it is empty is skipped without looking at it any further.
+
+    :rtype: tuple
+    """
+    tag = _nons(tag)
+    if tag == 'object':
+        index = [(None, 'object')] if {'codebase', 'classid', 'data', 'archive'}.intersection(names) else []
+    else:
+        index = [(a, 'list' if a in list_attrs else 'single')
+                 for a in names if a in single_attrs or a in list_attrs]
+    if tag == 'meta' and 'http-equiv' in names:
+        index.append(('content', 'meta'))
+    elif tag == 'param' and 'valuetype' in names:
+        index.append(('value', 'param'))
+    elif tag == 'style':
+        index.append((None, 'text'))
+    if 'style' in names:
+        index.append(('style', 'style'))
+    return tuple(index)
+
+
+#: Elements which have no end tag
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+])
+
+#: Elements whose text is written as it is
+RAW_TEXT_ELEMENTS = frozenset(['script', 'style'])
+
+
+def _escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _escape_attrib(value):
+    return value.replace('&', '&amp;').replace('"', '&quot;')
+
+
+class HtmlStreamWriter(object):
+    """Writes html from the events of `lxml.etree.iterparse` as they come.
+
+    The text after an event is only complete at the next event, thus it
+    is written then. Written elements are removed from the tree, so
+    only the currently open elements are kept in memory.
+
+    :param destination: file like object opened in binary mode
+    :param int buffer_size: bytes collected before each write to the destination
+    """
+
+    def __init__(self, destination, buffer_size=64 * 1024):
+        self.destination = destination
+        self.buffer_size = buffer_size
+        self.encoding = None
+        self._last = None
+        self._buffer = []
+        self._buffered = 0
+
+    def begin(self, docinfo, encoding=None):
+        """Writes the doctype, the output has the encoding of the source."""
+        self.encoding = encoding or docinfo.encoding or 'utf-8'
+        if docinfo.doctype:
+            self.write(docinfo.doctype + '\n')
+
+    def write(self, text):
+        if not text:
+            return
+        data = text.encode(self.encoding, 'xmlcharrefreplace')
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.destination.write(b''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def flush_text(self):
+        """Writes the text following the last event and forgets
+        the element if it is written completely."""
+        if self._last is None:
+            return
+        event, node = self._last
+        self._last = None
+
+        if event == 'start':
+            if node.text:
+                raw = _nons(node.tag) in RAW_TEXT_ELEMENTS
+                self.write(node.text if raw else _escape_text(node.text))
+                node.text = None
+            return
+
+        if node.tail:
+            self.write(_escape_text(node.tail))
+        parent = node.getparent()
+        if parent is not None:
+            parent.remove(node)
+
+    def start(self, el):
+        self.flush_text()
+        attribs = ''.join(' %s="%s"' % (k, _escape_attrib(v)) for k, v in el.items())
+        self.write('<%s%s>' % (_nons(el.tag), attribs))
+        self._last = ('start', el)
+
+    def end(self, el):
+        self.flush_text()
+        tag = _nons(el.tag)
+        if tag not in VOID_ELEMENTS:
+            self.write('</%s>' % tag)
+        self._last = ('end', el)
+
+    def comment(self, text, node=None):
+        self.flush_text()
+        self.write('<!--%s-->' % text)
+        if node is not None:
+            self._last = ('end', node)
+
+    def close(self):
+        self.flush_text()
+        self.flush()
+
+
 class BaseIncrementalParser(object):
     """Base Parser which builds tree and generates file elements
     and also handles these file elements.
@@ -90,6 +222,8 @@ class BaseIncrementalParser(object):
         self.root = None
         self._source = None
         self._stack = set()
+        #: Files were collected without keeping the tree
+        self._collected = False
 
         if not global_config.is_set():
             import warnings
@@ -100,7 +234,7 @@ class BaseIncrementalParser(object):
         return '<IncrementalParser: %s>' % current_thread().name
 
     def __iter__(self):
-        if self.root is None:
+        if self.root is None and not self._collected:
             self.__parse__()
         return self._stack.__iter__()
 
@@ -108,7 +242,7 @@ class BaseIncrementalParser(object):
         return len(self._stack)
 
     def files(self, tags=None):
-        if self.root is None:
+        if self.root is None and not self._collected:
             self.__parse__()
 
         if not tags:
@@ -166,8 +300,10 @@ class BaseIncrementalParser(object):
         assert self.utx.file_path is not None, "Webpage file_path is not generated by utx!"
         assert o.file_path is not None, "File Path was not generated by the handler."
 
-        #: Calculate a path relative from the parent Webpage
-        o.rel_path = cached_path2url_relate(o.file_path, self.utx.file_path)
+        #: Calculate a path relative from the parent Webpage, files which
+        #: are known duplicates are linked to their canonical copy
+        o.rel_path = cached_path2url_relate(CONTENT_STORE.canonical_path(o.file_path),
+                                            self.utx.file_path)
 
         assert o.rel_path is not None, "Relative Path was not generated by the handler."
 
@@ -186,10 +322,10 @@ class BaseIncrementalParser(object):
         # or a simple `/` anchor
         # thus these links needs to be left as is.
         if url[:1] == u'#' or url[:4] in [u'java', u'data'] or url[1:] == '':
-            LOGGER.debug('Url was not valid : %s' % url)
+            LOGGER.debug('Url was not valid : %s', url)
             return
 
-        LOGGER.info('Handling url %s' % url)
+        LOGGER.info('Handling url %s', url)
 
         try:
             # Create a new element and handle basic pre-population internally
@@ -217,7 +353,7 @@ class BaseIncrementalParser(object):
                 new = cur[:pos] + obj.rel_path + cur[pos + len(url):]
             elem.set(attr, new)
 
-        LOGGER.info("Remapped url of the file: %s to the path: %s " % (url, obj.rel_path))
+        LOGGER.info("Remapped url of the file: %s to the path: %s ", url, obj.rel_path)
         self._stack.add(obj)
 
     def __parse__(self):
@@ -240,6 +376,7 @@ class BaseIncrementalParser(object):
         assert self.utx.base_path is not None, "Base Path is not set!"
         assert self.utx.base_url is not None, "Base url is not Set!"
 
+        started = monotonic()
         source = self.get_source()
 
         assert source is not None, "Source is not Set!"
@@ -250,6 +387,8 @@ class BaseIncrementalParser(object):
                             huge_tree=True,
                             recover=False)
         context_tree = etree_parse(source, parser=parser)
+        # a streamed body is transferred while it is parsed
+        transfer = getattr(source, 'seconds', 0.0)
 
         del source
         del parser
@@ -265,80 +404,136 @@ class BaseIncrementalParser(object):
         for el in context_tree.iter():
             self.__handle(el)
 
-    def __handle(self, el):
+        METRICS.observe('parse', monotonic() - started - transfer)
+
+    def __stream__(self, destination):
+        """Parses the source and writes the html with its links rewritten
+        to the destination while it is being parsed, without building
+        the tree of the whole document.
+
+        Memory in use stays in proportion to the nesting depth of the
+        document instead of its size, but `self.root` is not available
+        afterwards. The linked files are collected as usual.
+
+        :param destination: file like object opened in binary mode
+        """
+        assert self.utx is not None, "UrlTranformer not Implemented."  # internal error
+        assert self.utx.base_path is not None, "Base Path is not set!"
+        assert self.utx.base_url is not None, "Base url is not Set!"
+
+        started = monotonic()
+        source = self.get_source()
+
+        assert source is not None, "Source is not Set!"
+        assert hasattr(source, 'read'), "File like object is required!"
+
+        writer = HtmlStreamWriter(destination)
+        events = iterparse(source, events=('start', 'end', 'comment'), html=True,
+                           huge_tree=True, encoding=self.encoding, collect_ids=False)
+
+        for event, el in events:
+            if writer.encoding is None:
+                writer.begin(el.getroottree().docinfo, self.encoding)
+
+            if event == 'start':
+                # text of a style tag is complete only at its end
+                self.__handle(el, style_text=False)
+                writer.start(el)
+                if el.getparent() is None:
+                    # WaterMarking :)
+                    writer.comment(MARK.format('', VERSION, self.utx.url, utcnow(), ''))
+            elif event == 'end':
+                if el.text and _nons(el.tag) == 'style':
+                    self.__handle_style_text(el)
+                writer.end(el)
+            else:
+                writer.comment(el.text or '', el)
+
+        writer.close()
+        self._collected = True
+        # the html is written while it is parsed, thus it is all parse time
+        METRICS.observe('parse', monotonic() - started - getattr(source, 'seconds', 0.0))
+
+    def __handle_style_text(self, el):
+        urls = [
+                   # (start_pos, url)
+                   _unquote_match(match.group(1), match.start(1))[::-1]
+                   for match in _iter_css_urls(el.text)
+               ] + [
+                   (match.start(1), match.group(1))
+                   for match in _iter_css_imports(el.text)
+               ]
+        if urls:
+            # sort by start pos to bring both match sets back into order
+            # and reverse the list to report correct positions despite
+            # modifications
+            urls.sort(reverse=True)
+            for start, url in urls:
+                self.handle(el, None, url, start)
+
+    def __handle(self, el, style_text=True):
         """Handles a lxml element which is straight out of the parser
         and does the work of file objects building and starts the download.
         """
+        for attrib, kind in _link_dispatch(el.tag, tuple(el.keys()), link_attrs, list_link_attrs):
+            if kind == 'single':
+                self.handle(el, attrib, el.get(attrib), 0)
+            elif kind == 'list':
+                urls = list(_iter_srcset_urls(el.get(attrib)))
+                if urls:
+                    # return in reversed order to simplify in-place modifications
+                    for match in urls[::-1]:
+                        url, start = _unquote_match(match.group(1).strip(), match.start(1))
+                        self.handle(el, attrib, url, start)
+            elif kind == 'style':
+                urls = list(_iter_css_urls(el.get('style')))
+                if urls:
+                    # return in reversed order to simplify in-place modifications
+                    for match in urls[::-1]:
+                        url, start = _unquote_match(match.group(1), match.start(1))
+                        self.handle(el, 'style', url, start)
+            elif kind == 'text':
+                if el.text and style_text:
+                    self.__handle_style_text(el)
+            elif kind == 'object':
+                self.__handle_object(el)
+            elif kind == 'meta':
+                self.__handle_meta_refresh(el)
+            elif kind == 'param':
+                if el.get('valuetype').lower() == 'ref':
+                    self.handle(el, 'value', el.get('value'), 0)
+
+    def __handle_object(self, el):
         attribs = el.attrib
-        tag = _nons(el.tag)
-        if tag == 'object':
-            codebase = None
-            if 'codebase' in attribs:
-                codebase = el.get('codebase')
-                self.handle(el, 'codebase', codebase, 0)
-            for attrib in ('classid', 'data'):
-                if attrib in attribs:
-                    value = el.get(attrib)
-                    if codebase is not None:
-                        value = urljoin(codebase, value)
-                    self.handle(el, attrib, value, 0)
-            if 'archive' in attribs:
-                for match in _archive_re.finditer(el.get('archive')):
-                    value = match.group(0)
-                    if codebase is not None:
-                        value = urljoin(codebase, value)
-                    self.handle(el, 'archive', value, match.start())
-        else:
-            for attrib in link_attrs:
-                if attrib in attribs:
-                    self.handle(el, attrib, attribs[attrib], 0)
-            for attrib in list_link_attrs:
-                if attrib in attribs:
-                    urls = list(_iter_srcset_urls(attribs[attrib]))
-                    if urls:
-                        # return in reversed order to simplify in-place modifications
-                        for match in urls[::-1]:
-                            url, start = _unquote_match(match.group(1).strip(), match.start(1))
-                            self.handle(el, attrib, url, start)
-        if tag == 'meta':
-            http_equiv = attribs.get('http-equiv', '').lower()
-            if http_equiv == 'refresh':
-                content = attribs.get('content', '')
-                match = _parse_meta_refresh_url(content)
-                url = (match.group('url') if match else content).strip()
-                # unexpected content means the redirect won't work, but we might
-                # as well be permissive and return the entire string.
-                if url:
-                    url, pos = _unquote_match(
-                        url, match.start('url') if match else content.find(url))
-                    self.handle(el, 'content', url, pos)
-        elif tag == 'param':
-            valuetype = el.get('valuetype') or ''
-            if valuetype.lower() == 'ref':
-                self.handle(el, 'value', el.get('value'), 0)
-        elif tag == 'style' and el.text:
-            urls = [
-                       # (start_pos, url)
-                       _unquote_match(match.group(1), match.start(1))[::-1]
-                       for match in _iter_css_urls(el.text)
-                   ] + [
-                       (match.start(1), match.group(1))
-                       for match in _iter_css_imports(el.text)
-                   ]
-            if urls:
-                # sort by start pos to bring both match sets back into order
-                # and reverse the list to report correct positions despite
-                # modifications
-                urls.sort(reverse=True)
-                for start, url in urls:
-                    self.handle(el, None, url, start)
-        if 'style' in attribs:
-            urls = list(_iter_css_urls(attribs['style']))
-            if urls:
-                # return in reversed order to simplify in-place modifications
-                for match in urls[::-1]:
-                    url, start = _unquote_match(match.group(1), match.start(1))
-                    self.handle(el, 'style', url, start)
+        codebase = None
+        if 'codebase' in attribs:
+            codebase = el.get('codebase')
+            self.handle(el, 'codebase', codebase, 0)
+        for attrib in ('classid', 'data'):
+            if attrib in attribs:
+                value = el.get(attrib)
+                if codebase is not None:
+                    value = urljoin(codebase, value)
+                self.handle(el, attrib, value, 0)
+        if 'archive' in attribs:
+            for match in _archive_re.finditer(el.get('archive')):
+                value = match.group(0)
+                if codebase is not None:
+                    value = urljoin(codebase, value)
+                self.handle(el, 'archive', value, match.start())
+
+    def __handle_meta_refresh(self, el):
+        if el.get('http-equiv', '').lower() != 'refresh':
+            return
+        content = el.get('content', '')
+        match = _parse_meta_refresh_url(content)
+        url = (match.group('url') if match else content).strip()
+        # unexpected content means the redirect won't work, but we might
+        # as well be permissive and return the entire string.
+        if url:
+            url, pos = _unquote_match(
+                url, match.start('url') if match else content.find(url))
+            self.handle(el, 'content', url, pos)
 
 
 # HTML style and script tags cleaner
@@ -452,7 +647,7 @@ class MultiParser(object):
             except UnicodeDecodeError:
                 LOGGER.exception("Unicode decoder failed to decode html!"
                                  "Encoding tried by default enc: [%s]"
-                                 "Trying fallback..." % ','.join(tried))
+                                 "Trying fallback...", ','.join(tried))
                 raise
 
     @property
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.profiling
+~~~~~~~~~~~~~~~~~~~
+
+Opt-in profiling of a `save_webpage` or `save_website` run.
+
+With config['profile'] set, every thread of the run, i.e. the crawler,
+the scheduler and the workers, is profiled by cProfile and the merged
+stats are written to `profile.prof` (and the top functions to
+`profile.txt`). Before python 3.12 every thread needs a profiler of its
+own, thus the threads which were started before the run, like a running
+scheduler dispatcher or the log listener, are not profiled. Since 3.12
+a single profiler sees every thread of the interpreter. The processes
+of the parse pool are not profiled.
+
+With config['trace_memory'] set, the allocations are traced by
+tracemalloc and the top ones are written to `memory.txt`.
+With either set, the wall-clock time of every phase of the run is
+written to `phases.json`. The files are written to the project folder.
+
+usage::
+    >>> from pywebcopy.profiling import PROFILER
+    >>> PROFILER.start('/downloads/site', cpu=True, memory=True)
+    >>> with PROFILER.phase('crawl'):
+    ...     crawl()
+    >>> PROFILER.stop()
+    ['/downloads/site/phases.json', '/downloads/site/profile.prof', ...]
+
+    $ python -m pstats /downloads/site/profile.prof
+
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+
+from . import LOGGER
+from .workers import POOL
+
+
+__all__ = ['RunProfiler', 'PROFILER']
+
+
+#: Number of functions and allocations in the text reports
+TOP = 30
+
+#: Whether every thread is profiled by a profiler of its own, since
+#: python 3.12 a profiler sees every thread and only one can be active
+_PER_THREAD = sys.version_info < (3, 12)
+
+
+class RunProfiler(object):
+    """Profiles the threads, traces the allocations and times the
+    phases of a run. Nothing is profiled, timed or written unless it
+    is started with `cpu` or `memory` set.
+    """
+
+    def __init__(self):
+        self.folder = None
+        self.cpu = False
+        self.memory = False
+        self.phases = OrderedDict()
+        self._profiles = []
+        self._main = None
+        self._lock = threading.Lock()
+        self._started = None
+        #: False if a thread could not be profiled, like when another
+        #: profiling tool is active
+        self.threads_profiled = True
+
+    def __repr__(self):
+        return '<RunProfiler: cpu=%s memory=%s>' % (self.cpu, self.memory)
+
+    @property
+    def enabled(self):
+        """Tells whether a run is being profiled."""
+        return self._started is not None
+
+    def _profile_thread(self, frame, event, arg):
+        # called once by every new thread, it replaces itself
+        # with a profiler of the thread
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # the thread goes on without being profiled
+            self.threads_profiled = False
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+    def start(self, folder, cpu=False, memory=False):
+        """Starts profiling the calling thread and the threads started
+        after it, does nothing unless `cpu` or `memory` is set.
+
+        Before python 3.12 the threads which are already running are not
+        profiled, since 3.12 every thread is. The run is not profiled if
+        another profiling tool is active.
+
+        :param str folder: folder to write the reports to
+        :param bool cpu: whether to profile with cProfile
+        :param bool memory: whether to trace the allocations with tracemalloc
+        """
+        if self.enabled:
+            self.stop()
+        self.folder, self.cpu, self.memory = folder, bool(cpu), bool(memory)
+        self.phases = OrderedDict()
+        if not (self.cpu or self.memory):
+            return
+
+        self._started = perf_counter()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.cpu:
+            self.threads_profiled = True
+            self._main = cProfile.Profile()
+            try:
+                self._main.enable()
+            except ValueError as e:
+                LOGGER.warning("The run is not profiled: %s", e)
+                self.cpu, self._main = False, None
+        if self.cpu and _PER_THREAD:
+            # idle workers of an earlier run would not be profiled
+            POOL.shutdown()
+            threading.setprofile(self._profile_thread)
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the wall-clock time spent in the block to the phase."""
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + perf_counter() - start
+
+    def stop(self):
+        """Stops profiling and writes the reports.
+
+        The threads started during the run should be done by now, the
+        workers of the pool are stopped, others are read as they are.
+
+        :rtype: list
+        :returns: paths of the written reports
+        """
+        if not self.enabled:
+            return []
+        total = perf_counter() - self._started
+        written = []
+
+        if self.cpu:
+            POOL.shutdown()
+            if _PER_THREAD:
+                threading.setprofile(None)
+            self._main.disable()
+            if not self.threads_profiled:
+                LOGGER.warning("Some threads of the run could not be profiled, "
+                               "another profiling tool was active")
+
+        # before the stats of the profile are made, they would be in it
+        if self.memory:
+            written.append(self._write_memory())
+
+        if self.cpu:
+            written[:0] = self._write_profile()
+
+        phases = OrderedDict((k, round(v, 6)) for k, v in self.phases.items())
+        phases['other'] = round(max(total - sum(self.phases.values()), 0.0), 6)
+        phases['total'] = round(total, 6)
+        written.insert(0, self._write('phases.json', json.dumps(phases, indent=2)))
+
+        self._started = None
+        LOGGER.info("Profile of the run is written to %s", ', '.join(written))
+        return written
+
+    def _write(self, name, text):
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        path = os.path.join(self.folder, name)
+        with open(path, 'w') as fh:
+            fh.write(text)
+        return path
+
+    def _write_profile(self):
+        stats = None
+        for profile in [self._main] + self._profiles:
+            # the stats of a thread which made no calls cannot be loaded
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                stats.add(profile)
+        self._profiles, self._main = [], None
+        if stats is None:
+            return []
+
+        path = os.path.join(self.folder, 'profile.prof')
+        stats.dump_stats(path)
+
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats('cumulative').print_stats(TOP)
+        return [path, self._write('profile.txt', text.getvalue())]
+
+    def _write_memory(self):
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        lines = ['Traced memory: %.1f KB current, %.1f KB peak' % (current / 1024.0, peak / 1024.0),
+                 'Memory of C extensions like lxml is not traced', '',
+                 'Top %d allocations by line:' % TOP]
+        for i, stat in enumerate(snapshot.statistics('lineno')[:TOP], 1):
+            frame = stat.traceback[0]
+            lines.append('#%d %s:%d %.1f KB in %d blocks' % (
+                i, frame.filename, frame.lineno, stat.size / 1024.0, stat.count))
+        return self._write('memory.txt', '\n'.join(lines) + '\n')
+
+
+PROFILER = RunProfiler()
+"""Global profiler of the current run."""
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.robots
+~~~~~~~~~~~~~~~~
+
+Registry of the robots.txt rules of every host met during a crawl.
+
+The robots.txt of a host is fetched only when an url of that host is
+checked for the first time and is kept for `ttl` seconds. Decisions are
+memoised per host and per the longest rule path which matches the url,
+thus a host has at most as many decisions as its robots.txt has rules.
+
+usage::
+    >>> from pywebcopy.robots import RobotsRegistry
+    >>> robots = RobotsRegistry(user_agent='*', ttl=3600)
+    >>> robots.can_fetch('http://some-site.com/hidden/url_path')
+    False
+    >>> robots.request_interval('http://some-site.com/')
+    2.0
+
+"""
+
+import json
+import os
+import threading
+from time import time
+
+import requests
+from six.moves.urllib.parse import quote, unquote, urlparse, urlsplit, urlunparse
+
+from . import LOGGER
+from .structures import RobotsTxtParser
+
+
+__all__ = ['RobotsRegistry']
+
+
+#: Seconds after which the robots.txt of a host which answered
+#: with a server error is read again
+RETRY_UNAVAILABLE = 60
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return '%s://%s' % (parts.scheme.lower() or 'http', parts.netloc.lower())
+
+
+def _rule_target(url):
+    """Path of the url in the form the rules of `RobotFileParser` are
+    matched against."""
+    parsed = urlparse(unquote(url))
+    target = quote(urlunparse(('', '', parsed.path, parsed.params, parsed.query, parsed.fragment)))
+    return target or '/'
+
+
+class _HostRules(object):
+    """The robots.txt of a host along with its memoised decisions."""
+
+    __slots__ = ('parser', 'fetched', 'lines', 'prefixes', 'decisions', 'lock')
+
+    def __init__(self):
+        self.parser = None
+        self.fetched = 0
+        self.lines = None
+        self.prefixes = ()
+        self.decisions = {}
+        self.lock = threading.Lock()
+
+    def load(self, parser, fetched):
+        paths = set()
+        for entry in parser.entries + ([parser.default_entry] if parser.default_entry else []):
+            paths.update(r.path for r in entry.rulelines if r.path != '*')
+        # the longest matching path decides which rules apply to an url
+        self.prefixes = tuple(sorted(paths, key=len, reverse=True))
+        self.decisions = {}
+        self.parser = parser
+        self.fetched = fetched
+
+    def can_fetch(self, url):
+        target = _rule_target(url)
+        key = next((p for p in self.prefixes if target.startswith(p)), '')
+        try:
+            return self.decisions[key]
+        except KeyError:
+            allowed = self.decisions[key] = bool(self.parser.can_fetch(url))
+            return allowed
+
+
+class RobotsRegistry(object):
+    """Thread safe cache of the robots.txt rules per host.
+
+    :param str user_agent: user agent the rules are read for
+    :param float ttl: seconds after which a robots.txt is fetched again
+    :param str path: optional json file in which the fetched robots.txt are kept
+    :param fetch: callable which gets an url, `requests.get` by default
+    """
+
+    def __init__(self, user_agent='*', ttl=None, path=None, fetch=None):
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.path = path
+        self._fetch = fetch or requests.get
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._stored = self._load_stored() if path else {}
+
+    def __repr__(self):
+        return '<RobotsRegistry: %d hosts>' % len(self._hosts)
+
+    def __contains__(self, url):
+        return _origin(url) in self._hosts
+
+    def _load_stored(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return {}
+
+    def _store(self, origin, parser, fetched, lines):
+        record = {'fetched': fetched, 'lines': lines,
+                  'allow_all': parser.allow_all, 'disallow_all': parser.disallow_all}
+        with self._lock:
+            self._stored[origin] = record
+            data = dict(self._stored)
+            part = self.path + '.part'
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            with open(part, 'w', encoding='utf-8') as fh:
+                json.dump(data, fh)
+            os.replace(part, self.path)
+
+    def _expired(self, fetched):
+        return self.ttl is not None and time() - fetched > self.ttl
+
+    def _stale(self, host):
+        if host.parser is None or self._expired(host.fetched):
+            return True
+        # a server error is temporary, it is neither kept nor stored for long
+        return host.parser.unavailable and time() - host.fetched > RETRY_UNAVAILABLE
+
+    def _new_parser(self, origin):
+        parser = RobotsTxtParser(self.user_agent, origin + '/robots.txt')
+        parser._get = self._fetch
+        return parser
+
+    def _restore(self, origin):
+        record = self._stored.get(origin)
+        if not record or self._expired(record.get('fetched', 0)):
+            return None
+        if record.get('lines') is None and not (record.get('allow_all') or
+                                                record.get('disallow_all')):
+            # no rules at all, like a server error stored by an earlier version
+            return None
+        parser = self._new_parser(origin)
+        parser.allow_all = record.get('allow_all', False)
+        parser.disallow_all = record.get('disallow_all', False)
+        if record.get('lines') is not None:
+            parser.parse(record['lines'])
+        return parser, record['fetched']
+
+    def _read(self, origin):
+        parser = self._new_parser(origin)
+        try:
+            parser.read()
+        except requests.exceptions.RequestException:
+            LOGGER.warning("Failed to read robots.txt of %s, allowing every url", origin)
+            parser.allow_all = True
+        fetched = time()
+        if parser.unavailable:
+            LOGGER.warning("Server error while reading robots.txt of %s, disallowing "
+                           "every url for %d seconds", origin, RETRY_UNAVAILABLE)
+        elif self.path:
+            self._store(origin, parser, fetched, getattr(parser, 'lines', None))
+        return parser, fetched
+
+    def fresh(self, url):
+        """Whether the rules of the host of the url are read and not
+        expired, i.e. whether checking the url does not fetch anything.
+
+        :param str url: any url of the host
+        :rtype: bool
+        """
+        host = self._hosts.get(_origin(url))
+        return host is not None and not self._stale(host)
+
+    def rules(self, url):
+        """Rules of the host of the url, fetched if they are missing or expired.
+
+        :param str url: any url of the host
+        :rtype: _HostRules
+        """
+        origin = _origin(url)
+        host = self._hosts.get(origin)
+        if host is None:
+            with self._lock:
+                host = self._hosts.setdefault(origin, _HostRules())
+
+        if self._stale(host):
+            # concurrent checks of a new host wait for a single fetch
+            with host.lock:
+                if self._stale(host):
+                    loaded = None
+                    if host.parser is None:
+                        loaded = self._restore(origin)
+                    host.load(*(loaded or self._read(origin)))
+        return host
+
+    def parser(self, url):
+        """The robots.txt parser of the host of the url.
+
+        :rtype: RobotsTxtParser
+        """
+        return self.rules(url).parser
+
+    def can_fetch(self, url):
+        """Whether the robots.txt of its host allows the url.
+
+        :param str url: url to check
+        :rtype: bool
+        """
+        return self.rules(url).can_fetch(url)
+
+    def request_interval(self, url):
+        """Seconds the host of the url asks to wait between two requests.
+
+        :rtype: float
+        """
+        return self.parser(url).request_interval()
+
+    def clear(self):
+        """Forgets the rules of every host, the stored ones are kept."""
+        with self._lock:
+            self._hosts = {}
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.scheduler
+~~~~~~~~~~~~~~~~~~~
+
+Polite scheduling of downloads over multiple hosts.
+
+usage::
+    >>> from pywebcopy.scheduler import SCHEDULER
+    >>> future = SCHEDULER.submit('http://some-site.com/file.png', download, ...)
+    >>> SCHEDULER.join()    # blocks until every scheduled task is done
+
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import monotonic
+
+from six.moves.urllib.parse import urlsplit
+
+from . import LOGGER
+from .configs import config, SESSION
+from .metrics import METRICS
+from .workers import POOL
+
+
+__all__ = ['HostScheduler', 'SCHEDULER']
+
+
+class HostScheduler(object):
+    """Keeps a queue of tasks for every host and hands them over to the
+    worker pool in round-robin order over the hosts.
+
+    A host is skipped while it has config['max_connections_per_host']
+    tasks running, or while the session is waiting out the delay its
+    robots.txt (or config['crawl_delay']) asks for. The turn of a task is
+    reserved when it is handed over, thus the workers keep busy with the
+    other hosts instead of sleeping on, or hammering, any single one.
+
+    :param pool: WorkerPool which runs the tasks
+    :param int max_per_host: maximum running tasks per host, 0 for no limit
+    """
+
+    def __init__(self, pool=None, max_per_host=None):
+        self.pool = pool or POOL
+        self._max_per_host = max_per_host
+        self._queues = {}
+        self._ring = deque()
+        self._running = {}
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._dispatcher = None
+
+    def __repr__(self):
+        return '<HostScheduler: hosts=%d pending=%d>' % (len(self._queues), self._pending)
+
+    @property
+    def max_per_host(self):
+        """:rtype: int"""
+        if self._max_per_host is not None:
+            return self._max_per_host
+        return config.get('max_connections_per_host') or 0
+
+    @property
+    def pending(self):
+        """Number of scheduled tasks which have not finished yet."""
+        return self._pending
+
+    def submit(self, url, fn, *args, **kwargs):
+        """Queues `fn(*args, **kwargs)` behind the other tasks of the host of url.
+
+        :param str url: url which will be requested by the task
+        :rtype: concurrent.futures.Future
+        :returns: future representing the execution of the task
+        """
+        host = urlsplit(url).netloc.lower()
+        future = Future()
+
+        with self._cond:
+            queue = self._queues.get(host)
+            if queue is None:
+                queue = self._queues[host] = deque()
+                self._ring.append(host)
+            queue.append((future, fn, args, kwargs, monotonic(), url))
+            self._pending += 1
+
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch,
+                                                    name='pywebcopy-scheduler')
+                self._dispatcher.start()
+            self._cond.notify_all()
+
+        return future
+
+    def _next_task(self):
+        """Pops the task of the next ready host in the round and reserves
+        the request turn of the host for it.
+
+        :returns: four-tuple of host, task, whether its turn is reserved and
+            the seconds after which a waiting host gets ready (None if no
+            host is waiting on time)
+        """
+        now = monotonic()
+        limit = self.max_per_host
+        wait = None
+
+        for _ in range(len(self._ring)):
+            host = self._ring[0]
+            self._ring.rotate(-1)
+
+            if limit and self._running.get(host, 0) >= limit:
+                continue
+
+            queue = self._queues[host]
+            ready_in, reserved = SESSION.reserve_turn(queue[0][5])
+            if ready_in > 0:
+                wait = ready_in if wait is None else min(wait, ready_in)
+                continue
+
+            task = queue.popleft()
+            if not queue:
+                del self._queues[host]
+                self._ring.remove(host)
+            self._running[host] = self._running.get(host, 0) + 1
+            return host, task, reserved, None
+
+        return None, None, False, wait
+
+    def _dispatch(self):
+        # The dispatcher stops when nothing is pending and is started
+        # again by the next submit, it is not daemonic so that the queued
+        # tasks are still run if the main thread exits meanwhile.
+        while True:
+            with self._cond:
+                host, task, reserved, wait = self._next_task()
+                while task is None:
+                    if not self._pending:
+                        self._dispatcher = None
+                        return
+                    self._cond.wait(wait)
+                    host, task, reserved, wait = self._next_task()
+
+            # The bounded pool can block here which slows down
+            # the dispatch to the speed of the workers.
+            self.pool.submit(self._run, host, task, reserved)
+
+    def _run(self, host, task, reserved=False):
+        future, fn, args, kwargs, queued, url = task
+        METRICS.observe('queue_wait', monotonic() - queued)
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    if reserved:
+                        with SESSION.reserved_turn(url):
+                            future.set_result(fn(*args, **kwargs))
+                    else:
+                        future.set_result(fn(*args, **kwargs))
+                except Exception as e:
+                    LOGGER.exception("Task %r failed!", fn)
+                    future.set_exception(e)
+        finally:
+            with self._cond:
+                self._running[host] -= 1
+                if not self._running[host]:
+                    del self._running[host]
+                self._pending -= 1
+                self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Blocks until every scheduled task (and the tasks scheduled
+        by these tasks) is done.
+
+        :param float timeout: maximum seconds to wait for, or None to wait forever
+        :rtype: bool
+        :returns: True if nothing is pending, False if timed out
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pending, timeout)
+            return not self._pending
+
+
+SCHEDULER = HostScheduler()
+"""Global scheduler used by the file handlers."""
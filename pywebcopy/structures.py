@@ -84,6 +84,10 @@ class RobotsTxtParser(RobotFileParser):
     def __init__(self, user_agent, url):
         self.url = url
         self.user_agent = user_agent
+        #: lines of the robots.txt which was read
+        self.lines = None
+        #: whether the site answered with a server error, see `read`
+        self.unavailable = False
         RobotFileParser.__init__(self, self.url)
 
     @staticmethod
@@ -96,6 +100,9 @@ class RobotsTxtParser(RobotFileParser):
 
         This usually sets up a session and a cookie jar.
         Thus subsequent requests should be faster.
+
+        A site which answers with a server error is unavailable, every
+        url of it is disallowed as RFC 9309 asks for until it is read again.
         """
         try:
             f = self._get(self.url)
@@ -106,10 +113,27 @@ class RobotsTxtParser(RobotFileParser):
                 self.disallow_all = True
             elif 400 <= code < 500:
                 self.allow_all = True
+            else:
+                self.unavailable = True
+                self.disallow_all = True
         except requests.exceptions.ConnectionError:
             self.allow_all = True
         else:
-            self.parse(f.text.splitlines())
+            self.lines = f.text.splitlines()
+            self.parse(self.lines)
 
     def can_fetch(self, url, useragent=None):
-        RobotFileParser.can_fetch(self, useragent=useragent or self.user_agent, url=url)
+        return RobotFileParser.can_fetch(self, useragent=useragent or self.user_agent, url=url)
+
+    def request_interval(self, useragent=None):
+        """Minimum seconds the site asks to wait between two requests
+        through the `Crawl-delay` and `Request-rate` rules.
+
+        :rtype: float
+        """
+        useragent = useragent or self.user_agent
+        interval = float(self.crawl_delay(useragent) or 0)
+        rate = self.request_rate(useragent)
+        if rate and rate.requests:
+            interval = max(interval, float(rate.seconds) / rate.requests)
+        return interval
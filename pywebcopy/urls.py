@@ -7,21 +7,22 @@ pywebcopy.urls
 Deals with different types of urls in pywebcopy.parsers.
 
 """
-import itertools
-
 __all__ = [
-    'URLTransformer',
-    'filename_present', 'url2path', 'relate',
+    'URLTransformer', 'URLCanonicalizer',
+    'filename_present', 'url2path', 'relate', 'canonicalize',
 ]
 
 import hashlib
+import logging
 import os
 import re
+from fnmatch import fnmatchcase
 
-from six.moves.urllib.parse import urljoin, unquote, urldefrag, urlsplit
+from six.moves.urllib.parse import urljoin, unquote, urldefrag, urlsplit, urlunsplit
 from six.moves.urllib.request import url2pathname
 
 from . import LOGGER
+from .configs import config
 
 # Removes the non-fileSystem compatible letters or patterns from a file path
 FILENAME_CLEANER = re.compile(r'[*":<>|?]+?\.\.?[/|\\]+')
@@ -99,17 +100,164 @@ def url2path(url, base_url=None, base_path=None, default_filename=None):
     return path
 
 
-# Counter for generating distinguisable file names.
-counter = itertools.count().__next__
+#: Ports which are dropped from the urls of their schemes
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21, 'ws': 80, 'wss': 443}
+
+# Matches any percent encoded character
+PERCENT_ENCODED = re.compile(r'%[0-9a-fA-F]{2}')
+
+
+def _remove_dot_segments(path):
+    """Resolves the `.` and `..` segments of an url path as in RFC 3986."""
+    if '.' not in path:
+        return path
+    segments = path.split('/')
+    output = []
+    for segment in segments:
+        if segment == '..':
+            if len(output) > 1:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+    # a trailing dot segment still names a directory
+    if segments[-1] in ('.', '..'):
+        output.append('')
+    return '/'.join(output) or '/'
+
+
+class URLCanonicalizer(object):
+    """Rewrites urls which point at the same resource into a single form.
+
+    Scheme and host are lowercased, default ports dropped, dot segments
+    resolved and percent encodings uppercased. Query parameters which
+    match one of `strip_params` (shell style patterns like 'utm_*') are
+    removed and the rest are sorted. Fragments are removed.
+
+    Urls of other than hierarchical schemes, like data: and mailto:, are
+    returned as they are.
+
+    usage::
+        >>> canonical = URLCanonicalizer(strip_params=['utm_*'])
+        >>> canonical('HTTP://Host:80/a/./b/../c?utm_source=x&b=2&a=1#frag')
+        'http://host/a/c?a=1&b=2'
+
+    :param strip_params: patterns of the query parameter names to remove
+    :param bool sort_query: whether to sort the query parameters
+    :param bool keep_fragment: whether to keep the fragment
+    """
+
+    __slots__ = ('strip_params', 'sort_query', 'keep_fragment')
+
+    def __init__(self, strip_params=(), sort_query=True, keep_fragment=False):
+        self.strip_params = tuple(strip_params or ())
+        self.sort_query = sort_query
+        self.keep_fragment = keep_fragment
+
+    def _stripped(self, param):
+        name = unquote(param.split('=', 1)[0]).lower()
+        return any(fnmatchcase(name, pattern) for pattern in self.strip_params)
+
+    def __call__(self, url):
+        """Canonical form of an url.
+
+        :param str url: absolute url
+        :rtype: str
+        """
+        if not url:
+            return url
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError:
+            return url
+
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.netloc:
+            return url
+
+        netloc = (parts.hostname or '').rstrip('.')
+        if ':' in netloc:
+            netloc = '[%s]' % netloc    # ipv6 address
+        if port is not None and port != DEFAULT_PORTS[scheme]:
+            netloc = '%s:%d' % (netloc, port)
+        userinfo = parts.netloc.rpartition('@')[0]
+        if userinfo:
+            netloc = userinfo + '@' + netloc
+
+        path = PERCENT_ENCODED.sub(lambda m: m.group(0).upper(), parts.path)
+        path = _remove_dot_segments(path) or '/'
+
+        query = parts.query
+        if query:
+            params = [p for p in query.split('&') if p]
+            if self.strip_params:
+                params = [p for p in params if not self._stripped(p)]
+            if self.sort_query:
+                params.sort()
+            query = '&'.join(params)
+
+        fragment = parts.fragment if self.keep_fragment else ''
+        return urlunsplit((scheme, netloc, path, query, fragment))
+
+    def many(self, urls):
+        """Canonical forms of a batch of urls, each distinct one once and
+        in the order they first appear.
+
+        :param urls: iterable of absolute urls
+        :rtype: list
+        """
+        seen = set()
+        result = []
+        for url in urls:
+            url = self(url)
+            if url not in seen:
+                seen.add(url)
+                result.append(url)
+        return result
+
+
+#: Canonicalizer of the config and the version of the config it is made for
+_canonical = (None, None)
+
+
+def canonicalize(url):
+    """Canonical form of an url as set up by config['strip_query_params']
+    and config['sort_query_params'], or the url itself if
+    config['canonicalize_urls'] is off.
+
+    The canonicalizer is made again only after the config is changed,
+    a list of the config which is changed in place has to be set again.
+
+    :param str url: absolute url
+    :rtype: str
+    """
+    global _canonical
+
+    version, canonical = _canonical
+    current = config.version
+    if version != current:
+        canonical = None
+        if config.get('canonicalize_urls'):
+            canonical = URLCanonicalizer(config.get('strip_query_params'),
+                                         config.get('sort_query_params', True))
+        _canonical = (current, canonical)
+    return url if canonical is None else canonical(url)
 
 
 class URLTransformer(object):
     """Transforms url into various types and subsections.
 
+    Every derived value is computed once and kept until one of the
+    values it depends upon, like the url or the base url, is set again.
+    The values are kept in slots, thus plain transformers have no
+    `__dict__`; the tag handlers of `pywebcopy.elements` do have one
+    for the attributes of their own.
+
     :param str url: a url to perform transform operations on
     :param str base_url: parent url of the given url, if any.
     :param str base_path: absolute path to be added to new paths generated.
-    :param str default_fn: filename to use when there is no filename present in url
+    :param str default_fn: filename to use when there is no filename present in url,
+        by default one is made from the hash of the url
     """
 
     __attrs__ = [
@@ -120,22 +268,39 @@ class URLTransformer(object):
         'get_fileext_and_pos',
     ]
 
+    __slots__ = (
+        '_original_url', '_base_url', '_base_path',
+        '_default_filename', '_default_fileext', '_check_fileext',
+        '_url', '_parsed', '_file_name', '_file_path', '_to_path',
+        '_unique_fn_required', '__weakref__',
+    )
+
     def __init__(self, url, base_url=None, base_path=None, default_fn=None):
 
-        self.original_url = url
-        self._url = None
-        self._parsed = None
+        self._original_url = url
         self._base_url = base_url
         self._base_path = base_path
 
-        self.default_filename = default_fn or "file_%d.pwcf" % counter()
+        # special tweaks for url to path conversion
+        self._default_filename = default_fn
+        self._default_fileext = 'pwcf'
+        self._check_fileext = False
+
+        #: file names are always made unique, kept for compatibility
+        self._unique_fn_required = True
+        self._reset()
 
-        LOGGER.debug('URLTransformer {} has been set to self.base_url {} '
-                     'and self.url is {}'.format(self, self.base_url, self.url))
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('URLTransformer %s has been set to self.base_url %s '
+                         'and self.url is %s', self.url, self.base_url, self.url)
 
-        # special tweaks for url to path conversion
-        self.default_fileext = 'pwcf'
-        self.check_fileext = False
+    def _reset(self):
+        """Forgets the computed values after an input changed."""
+        self._url = None
+        self._parsed = None
+        self._file_name = None
+        self._file_path = None
+        self._to_path = None
 
     def __str__(self):
         return self.url
@@ -153,18 +318,68 @@ class URLTransformer(object):
 
         return hashlib.sha1(self.url.encode("UTF-8")).hexdigest()[:8]
 
+    @property
+    def original_url(self):
+        """Url as it was given, like a relative one found in a page.
+        :rtype: str
+        """
+        return self._original_url
+
+    @original_url.setter
+    def original_url(self, value):
+        self._original_url = value
+        self._reset()
+
     @property
     def url(self):
         """Final url generated after any base_url or original change actions.
         :rtype: str
         :return: url calculated using all the factors
         """
+        if self._url is None:
+            if self.base_url:
+                new_url = urljoin(self.base_url, self.original_url)
+            else:
+                new_url = self.original_url
+            self._url = RELATIVE_PATHS.sub('', unquote(canonicalize(new_url)))
+        return self._url
 
-        if self.base_url:
-            new_url = urljoin(self.base_url, self.original_url)
-        else:
-            new_url = self.original_url
-        return RELATIVE_PATHS.sub('', unquote(new_url))
+    @property
+    def default_filename(self):
+        """File name used when there is none in the url, the same one
+        for the same url in every element and every process.
+        :rtype: str
+        """
+        return self._default_filename or "file_%s.pwcf" % self.__hash()
+
+    @default_filename.setter
+    def default_filename(self, value):
+        self._default_filename = value
+        self._reset()
+
+    @property
+    def default_fileext(self):
+        """Extension given to a file name which has none.
+        :rtype: str
+        """
+        return self._default_fileext
+
+    @default_fileext.setter
+    def default_fileext(self, value):
+        self._default_fileext = value
+        self._reset()
+
+    @property
+    def check_fileext(self):
+        """Whether the extension of the file name is forced to the default one.
+        :rtype: bool
+        """
+        return self._check_fileext
+
+    @check_fileext.setter
+    def check_fileext(self, value):
+        self._check_fileext = value
+        self._reset()
 
     @staticmethod
     def clean_url(url):
@@ -199,7 +414,7 @@ class URLTransformer(object):
     @property
     def parsed_url(self):
         """Parses the url in six part tuple."""
-        if not self._parsed:
+        if self._parsed is None:
             self._parsed = urlsplit(self.clean_url(self.url))
         return self._parsed
 
@@ -235,9 +450,7 @@ class URLTransformer(object):
         :rtype: None
         """
         self._base_url = new_base
-        # reset
-        self._url = None
-        self._parsed = None
+        self._reset()
 
     @property
     def base_path(self):
@@ -250,6 +463,7 @@ class URLTransformer(object):
     def base_path(self, new_base_path):
         """Base file which would be prepended to the new path generated via url."""
         self._base_path = new_base_path or ''
+        self._reset()
 
     @property
     def to_path(self):
@@ -258,9 +472,12 @@ class URLTransformer(object):
         :rtype: str
         :returns: path assumed from url
         """
-        if self.base_path:
-            return os.path.join(self.base_path, self._path_from_url())
-        return self._path_from_url()
+        if self._to_path is None:
+            if self.base_path:
+                self._to_path = os.path.join(self.base_path, self._path_from_url())
+            else:
+                self._to_path = self._path_from_url()
+        return self._to_path
 
     def _path_from_url(self):
         """Returns a feasable path extracted from the url converted to disk style convention."""
@@ -274,12 +491,10 @@ class URLTransformer(object):
         :rtype: str
         :return: filename present in the url or default one
         """
-        fn, pos = self.get_filename_and_pos(self.url_path)
-
-        if not fn:
-            return self.default_filename
-        else:
-            return fn
+        if self._file_name is None:
+            fn, pos = self.get_filename_and_pos(self.url_path)
+            self._file_name = fn or self.default_filename
+        return self._file_name
 
     @staticmethod
     def insert(string, new_object, index):
@@ -377,14 +592,16 @@ class URLTransformer(object):
         :rtype: str
         :return: disk compatible path
         """
-        upath, _ = self._refactor_filename(self.url_path)
+        if self._file_path is None:
+            upath, _ = self._refactor_filename(self.url_path)
 
-        # clean the url and prepend hostname to make it complete
-        upath = url2pathname(self.hostname + upath)
+            # clean the url and prepend hostname to make it complete
+            upath = url2pathname(self.hostname + upath)
 
-        if self.base_path:
-            upath = os.path.join(self.base_path, upath)
-        return upath
+            if self.base_path:
+                upath = os.path.join(self.base_path, upath)
+            self._file_path = upath
+        return self._file_path
 
 
 def relate(target_file, start_file):
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.visited
+~~~~~~~~~~~~~~~~~
+
+Thread safe stores of the urls which are already seen by a crawl.
+
+usage::
+    >>> from pywebcopy.visited import new_visited_store
+    >>> store = new_visited_store('pages')     # kind decided by config['visited_store']
+    >>> store.add('http://some-site.com/')
+    True
+    >>> store.add('http://some-site.com/')
+    False
+    >>> 'http://some-site.com/' in store
+    True
+
+"""
+
+import os
+import sqlite3
+import threading
+from array import array
+from hashlib import blake2b
+
+from .configs import config
+
+
+__all__ = [
+    'VisitedStore', 'MemoryVisitedStore', 'FingerprintVisitedStore',
+    'SQLiteVisitedStore', 'new_visited_store', 'fingerprint',
+]
+
+
+def fingerprint(url):
+    """Returns a non zero 64 bit fingerprint of the url.
+
+    :param str url: url to fingerprint
+    :rtype: int
+    """
+    digest = blake2b(url.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class VisitedStore(object):
+    """Interface of the visited url stores.
+
+    Checking and adding an url is a single atomic `add()` call,
+    so that two threads can never both see the same url as new.
+    """
+
+    def add(self, url):
+        """Adds the url to the store.
+
+        :param str url: url to add
+        :rtype: bool
+        :returns: True if the url was not in the store before
+        """
+        raise NotImplementedError
+
+    def __contains__(self, url):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the resources held by the store."""
+
+
+class MemoryVisitedStore(VisitedStore):
+    """Stores the urls as is in a locked set."""
+
+    def __init__(self):
+        self._urls = set()
+        self._lock = threading.Lock()
+
+    def add(self, url):
+        with self._lock:
+            if url in self._urls:
+                return False
+            self._urls.add(url)
+            return True
+
+    def __contains__(self, url):
+        return url in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+
+class FingerprintVisitedStore(VisitedStore):
+    """Stores 64 bit fingerprints of the urls in an open addressed
+    hash table backed by a flat array.
+
+    An url takes 16 bytes at most instead of a python string and
+    a set entry. Two urls sharing a fingerprint is possible but
+    negligible even for billions of urls.
+
+    :param int capacity: number of urls to allocate space for upfront
+    """
+
+    def __init__(self, capacity=1024):
+        size = 8
+        while size < capacity * 2:
+            size <<= 1
+        self._table = array('Q', bytes(8 * size))
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _slot(self, fp):
+        table = self._table
+        mask = len(table) - 1
+        i = fp & mask
+        while table[i] and table[i] != fp:
+            i = (i + 1) & mask
+        return i
+
+    def _grow(self):
+        old = self._table
+        self._table = array('Q', bytes(16 * len(old)))
+        for fp in old:
+            if fp:
+                self._table[self._slot(fp)] = fp
+
+    def add(self, url):
+        fp = fingerprint(url)
+        with self._lock:
+            i = self._slot(fp)
+            if self._table[i]:
+                return False
+            self._table[i] = fp
+            self._count += 1
+            if self._count * 2 > len(self._table):
+                self._grow()
+            return True
+
+    def __contains__(self, url):
+        fp = fingerprint(url)
+        with self._lock:
+            return bool(self._table[self._slot(fp)])
+
+    def __len__(self):
+        return self._count
+
+
+class SQLiteVisitedStore(VisitedStore):
+    """Stores fingerprints of the urls in a sqlite database on disk,
+    thus the memory used stays flat however big the crawl grows.
+
+    :param str path: location of the database file
+    :param bool reset: whether to forget the urls stored by a previous crawl
+    :param bool delete_on_close: whether to remove the database file on close
+    """
+
+    def __init__(self, path, reset=True, delete_on_close=True):
+        self.path = path
+        self.delete_on_close = delete_on_close
+
+        if reset and os.path.exists(path):
+            os.remove(path)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute('CREATE TABLE IF NOT EXISTS visited (fp INTEGER PRIMARY KEY)')
+        self._count = self._db.execute('SELECT COUNT(*) FROM visited').fetchone()[0]
+
+    @staticmethod
+    def _key(url):
+        # sqlite integers are signed 64 bit
+        fp = fingerprint(url)
+        return fp - (1 << 64) if fp >= (1 << 63) else fp
+
+    def add(self, url):
+        key = self._key(url)
+        with self._lock:
+            cur = self._db.execute('INSERT OR IGNORE INTO visited (fp) VALUES (?)', (key,))
+            if cur.rowcount != 1:
+                return False
+            self._count += 1
+            return True
+
+    def __contains__(self, url):
+        with self._lock:
+            cur = self._db.execute('SELECT 1 FROM visited WHERE fp = ?', (self._key(url),))
+            return cur.fetchone() is not None
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+        if self.delete_on_close:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+
+
+def new_visited_store(name='visited', kind=None):
+    """Creates a new store of the kind configured by config['visited_store'].
+
+    :param str name: name which distinguishes the stores of a crawl on disk
+    :param str kind: 'memory', 'fingerprint' or 'sqlite'
+    :rtype: VisitedStore
+    """
+    kind = kind or config.get('visited_store') or 'memory'
+
+    if kind == 'memory':
+        return MemoryVisitedStore()
+    if kind == 'fingerprint':
+        return FingerprintVisitedStore()
+    if kind == 'sqlite':
+        folder = config.get('project_folder') or os.getcwd()
+        return SQLiteVisitedStore(os.path.join(folder, '.%s_visited.sqlite' % name))
+
+    raise ValueError("Unknown visited store %r! Use 'memory', "
+                     "'fingerprint' or 'sqlite'." % kind)
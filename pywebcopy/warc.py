@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.warc
+~~~~~~~~~~~~~~
+
+Writes the http exchanges of a crawl into rolling gzip compressed WARC files.
+
+Enabled by setting config['output_mode'] to 'warc', every response fetched
+by the session is recorded as a request and a response record instead
+of the files being saved in the project folder. A WARC file is closed
+and a new one started once it reaches config['warc_max_size'] bytes.
+
+Every WARC file has a CDX index file next to it, with the offset and
+length of the gzip member of each response, thus a record is read back
+without decompressing anything else. The CDX files are read into memory
+by `lookup` once, and then only the lines added to them since.
+
+usage::
+    >>> from pywebcopy.warc import lookup
+    >>> record = lookup('/path/to/project/warc', 'http://some-site.com/')
+    >>> record[:9]
+    b'WARC/1.0\\r\\n'
+
+"""
+
+import atexit
+import gzip
+import os
+import threading
+import uuid
+import zlib
+from base64 import b32encode
+from datetime import datetime
+from hashlib import sha1
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
+
+from six.moves.urllib.parse import urlsplit
+
+from . import LOGGER, VERSION
+from .configs import config
+
+
+__all__ = ['WarcWriter', 'warc_writer', 'close_warc_writer', 'record_response', 'surt', 'lookup', 'read_record']
+
+
+#: Parts of the records which are kept in memory up to this size
+SPOOL_SIZE = 1024 * 1024
+
+CDX_HEADER = ' CDX N b a m s k r M S V g\n'
+
+#: Headers which are no longer true for the decoded body which is recorded
+_HOP_HEADERS = frozenset(['content-encoding', 'transfer-encoding', 'content-length'])
+
+
+def surt(url):
+    """Sort-friendly form of the url used as the key of the index.
+
+    >>> surt('https://www.Example.com/a/b?x=1')
+    'com,example)/a/b?x=1'
+
+    :param str url: url to convert
+    :rtype: str
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    key = ','.join(reversed(host.split('.'))) + ')' + (parts.path or '/')
+    if parts.query:
+        key += '?' + parts.query
+    return key.lower()
+
+
+def _cdx_url(url):
+    return url.replace(' ', '%20')
+
+
+def _digest(hasher):
+    return 'sha1:' + b32encode(hasher.digest()).decode('ascii')
+
+
+def _http_head(start_line, headers):
+    lines = [start_line]
+    lines.extend('%s: %s' % (k, v) for k, v in headers)
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', 'replace')
+
+
+class WarcWriter(object):
+    """Appends records to rolling WARC files from any thread.
+
+    Records are compressed in the calling thread, each into its own
+    gzip member, only the copy of the finished member into the WARC
+    file happens under a lock.
+
+    :param str folder: folder which keeps the WARC and CDX files
+    :param str prefix: prefix of the file names
+    :param int max_size: size in bytes after which a new WARC file is started
+    """
+
+    def __init__(self, folder, prefix='pywebcopy', max_size=None):
+        self.folder = folder
+        self.prefix = prefix
+        self.max_size = max_size or config.get('warc_max_size') or 1 << 30
+        self.closed = False
+
+        self._serial = 0
+        self._fh = None
+        self._cdx = None
+        self._lock = threading.Lock()
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def __repr__(self):
+        return '<WarcWriter: %s>' % self.folder
+
+    @property
+    def path(self):
+        """Location of the current WARC file."""
+        return self._fh.name if self._fh is not None else None
+
+    @staticmethod
+    def _member(warc_type, url, block, content_type, extra=()):
+        """Compresses a record into a gzip member.
+
+        :param block: file like object with the block of the record
+        :returns: two-tuple of the spooled member and the record id
+        """
+        record_id = '<urn:uuid:%s>' % uuid.uuid4()
+
+        block.seek(0, os.SEEK_END)
+        length = block.tell()
+        block.seek(0)
+        hasher = sha1()
+        for chunk in iter(lambda: block.read(65536), b''):
+            hasher.update(chunk)
+        block.seek(0)
+
+        headers = [
+            ('WARC-Type', warc_type),
+            ('WARC-Record-ID', record_id),
+            ('WARC-Date', datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')),
+        ]
+        if url:
+            headers.append(('WARC-Target-URI', url))
+        headers.extend(extra)
+        headers.extend([
+            ('WARC-Block-Digest', _digest(hasher)),
+            ('Content-Type', content_type),
+            ('Content-Length', length),
+        ])
+
+        member = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        with gzip.GzipFile(fileobj=member, mode='wb') as gz:
+            gz.write(_http_head('WARC/1.0', headers))
+            copyfileobj(block, gz)
+            gz.write(b'\r\n\r\n')
+        return member, record_id
+
+    def _open(self):
+        self._serial += 1
+        name = '%s-%s-%05d.warc.gz' % (self.prefix, datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+                                        self._serial)
+        path = os.path.join(self.folder, name)
+        self._fh = open(path, 'wb')
+        self._cdx = open(path + '.cdx', 'w', encoding='utf-8')
+        self._cdx.write(CDX_HEADER)
+
+        info = ('software: pywebcopy/%s\r\nformat: WARC File Format 1.0\r\n' % VERSION).encode()
+        member, _ = self._member('warcinfo', None, _bytes_io(info), 'application/warc-fields',
+                                 [('WARC-Filename', name)])
+        self._append(member)
+        LOGGER.info("Writing the WARC file %s", path)
+
+    def _append(self, member):
+        """Copies a member to the current file.
+
+        :returns: two-tuple of its offset and length in the file
+        """
+        offset = self._fh.tell()
+        member.seek(0)
+        copyfileobj(member, self._fh)
+        member.close()
+        return offset, self._fh.tell() - offset
+
+    def write_exchange(self, url, status, reason, headers, body, request_headers=(),
+                       method='GET', truncated=None):
+        """Records a request and its response.
+
+        :param str url: url which was fetched
+        :param int status: http status code of the response
+        :param str reason: http reason phrase of the response
+        :param headers: iterable of the (name, value) response headers
+        :param body: file like object with the decoded body of the response
+        :param request_headers: iterable of the (name, value) request headers
+        :param str method: http method of the request
+        :param str truncated: reason why the body is cut short, e.g. 'length', if it is
+        """
+        body.seek(0, os.SEEK_END)
+        length = body.tell()
+        body.seek(0)
+
+        payload = sha1()
+        for chunk in iter(lambda: body.read(65536), b''):
+            payload.update(chunk)
+        body.seek(0)
+
+        headers = [(k, v) for k, v in headers if k.lower() not in _HOP_HEADERS]
+        headers.append(('Content-Length', length))
+        mime = dict((k.lower(), v) for k, v in headers).get('content-type', '-')
+
+        extra = [('WARC-Payload-Digest', _digest(payload))]
+        if truncated:
+            extra.append(('WARC-Truncated', truncated))
+
+        block = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        block.write(_http_head('HTTP/1.1 %d %s' % (status, reason or ''), headers))
+        copyfileobj(body, block)
+        response, response_id = self._member(
+            'response', url, block, 'application/http; msgtype=response', extra)
+        block.close()
+
+        # urls are written with no spaces, which separate the fields of the index
+        cdx_url = _cdx_url(url)
+
+        parts = urlsplit(url)
+        target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        request_headers = [('Host', parts.netloc)] + [
+            (k, v) for k, v in request_headers if k.lower() != 'host']
+        request, _ = self._member(
+            'request', url, _bytes_io(_http_head('%s %s HTTP/1.1' % (method, target),
+                                                 request_headers)),
+            'application/http; msgtype=request', [('WARC-Concurrent-To', response_id)])
+
+        with self._lock:
+            if self.closed:
+                raise ValueError("WARC writer of %s is already closed!" % self.folder)
+
+            if self._fh is None or self._fh.tell() >= self.max_size:
+                self._roll()
+
+            offset, size = self._append(response)
+            self._append(request)
+
+            self._cdx.write(' '.join([
+                surt(cdx_url),
+                datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+                cdx_url,
+                mime.split(';', 1)[0].strip().replace(' ', '') or '-',
+                str(status),
+                b32encode(payload.digest()).decode('ascii'),
+                '-', '-',
+                str(size), str(offset),
+                os.path.basename(self._fh.name),
+            ]) + '\n')
+            self._fh.flush()
+            self._cdx.flush()
+
+    def _roll(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._cdx.close()
+        self._open()
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self._fh is not None:
+                self._fh.close()
+                self._cdx.close()
+
+
+def _bytes_io(data):
+    f = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    f.write(data)
+    return f
+
+
+def record_response(resp):
+    """Records a `requests.Response` with the WARC writer of the project.
+
+    The body is read into a spooled file which then replaces the raw
+    stream of the response, thus the response can still be read as if
+    it was never touched.
+
+    A body larger than config['max_file_size'] is not downloaded beyond
+    that size, the record of it is marked as truncated. Nothing of it is
+    downloaded if its content-length tells it is too large.
+
+    :param resp: response to record
+    """
+    writer = warc_writer()
+    if writer is None:
+        return
+
+    max_size = config.get('max_file_size')
+    length = resp.headers.get('content-length')
+    truncated = None
+    body = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+    if max_size and length and length.isdigit() and int(length) > max_size:
+        truncated = 'length'
+    else:
+        written = 0
+        for chunk in resp.iter_content(65536):
+            written += len(chunk)
+            if max_size and written > max_size:
+                body.write(chunk[:len(chunk) - (written - max_size)])
+                truncated = 'length'
+                break
+            body.write(chunk)
+
+    if truncated:
+        LOGGER.error("File at %s exceeds the maximum size of %d bytes, "
+                     "its record is truncated.", resp.url, max_size)
+        resp.close()
+
+    try:
+        writer.write_exchange(resp.url, resp.status_code, resp.reason,
+                              resp.headers.items(), body, resp.request.headers.items(),
+                              resp.request.method, truncated)
+    except Exception:
+        LOGGER.exception("Failed to record the response of %s", resp.url)
+
+    # the body is decoded already
+    for header in ('content-encoding', 'transfer-encoding'):
+        resp.headers.pop(header, None)
+    body.seek(0)
+    resp.raw = body
+    resp._content = False
+    resp._content_consumed = False
+
+
+def read_record(path, offset):
+    """Reads a single record from a WARC file.
+
+    :param str path: location of the WARC file
+    :param int offset: offset of the gzip member of the record
+    :rtype: bytes
+    """
+    with open(path, 'rb') as fh:
+        fh.seek(offset)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = []
+        while not decompressor.eof:
+            chunk = fh.read(65536)
+            if not chunk:
+                break
+            data.append(decompressor.decompress(chunk))
+    return b''.join(data)
+
+
+def lookup(folder, url):
+    """Finds the latest response record of the url in the CDX indexes
+    of the WARC files in the folder.
+
+    :param str folder: folder which keeps the WARC and CDX files
+    :param str url: url to look up
+    :rtype: bytes
+    :returns: the record or None if the url is not recorded
+    """
+    url = _cdx_url(url)
+    found = None
+    # the names of the files sort in the order they were written
+    for name in sorted(os.listdir(folder)):
+        if name.endswith('.cdx'):
+            found = _cdx_index(os.path.join(folder, name)).get(url, found)
+    if found is None:
+        return None
+    offset, name = found
+    return read_record(os.path.join(folder, name), offset)
+
+
+#: Urls of the CDX files read by `lookup`, by the paths of the files
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _cdx_index(path):
+    """Map of the urls in a CDX file to the offset and the WARC file of
+    their latest response, only the lines added since the last call are read.
+
+    :param str path: location of the CDX file
+    :rtype: dict
+    """
+    with _indexes_lock:
+        read, index = _indexes.get(path, (0, {}))
+        if os.path.getsize(path) < read:
+            # a new file of the same name
+            read, index = 0, {}
+        with open(path, 'rb') as fh:
+            fh.seek(read)
+            for line in fh:
+                if not line.endswith(b'\n'):
+                    break   # the line is not completely written yet
+                read += len(line)
+                fields = line.decode('utf-8').split(' ')
+                if len(fields) == 11:
+                    index[fields[2]] = (int(fields[9]), fields[10].strip())
+        _indexes[path] = (read, index)
+        return index
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def warc_writer():
+    """Returns the WARC writer of the current project, or None if
+    config['output_mode'] is not 'warc'. The files are written to
+    config['warc_folder'] or a `warc` folder in the project folder.
+
+    :rtype: WarcWriter
+    """
+    global _writer
+
+    if config.get('output_mode') != 'warc':
+        return None
+
+    folder = config.get('warc_folder') or os.path.join(config['project_folder'], 'warc')
+
+    with _writer_lock:
+        if _writer is None or _writer.folder != folder or _writer.closed:
+            if _writer is not None:
+                _writer.close()
+            _writer = WarcWriter(folder)
+        return _writer
+
+
+@atexit.register
+def close_warc_writer():
+    """Finishes the WARC files of the current project, if any."""
+    if _writer is not None:
+        _writer.close()
@@ -31,13 +31,18 @@ Usage::
 """
 
 import os
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
 
 import requests
 import six
 
 from . import LOGGER, SESSION
+from .archive import archive_sink
 from .configs import config
-from .exceptions import InvalidUrlError, ParseError
+from .exceptions import InvalidUrlError, ParseError, UrlRefusedByTagHandlerError
+from .http_cache import http_cache
+from .metrics import METRICS, TimedReader
 from .parsers import BaseIncrementalParser
 from .urls import URLTransformer
 
@@ -53,6 +58,8 @@ class BaseWebPage(BaseIncrementalParser):
 
         self._url = None
         self._url_obj = None
+        #: Html rewritten in a process of the parse pool
+        self._rewritten = None
 
     @property
     def url(self):
@@ -116,21 +123,23 @@ class BaseWebPage(BaseIncrementalParser):
 
         :param str base_path: folder in which to store the files.
         """
-        if self.root is None:
+        if self.root is None and not self._collected:
             self.__parse__()
             if not self.root:
                 raise ParseError("Tree is not being generated by parser!")
 
-        LOGGER.action("Starting save_assets Action on url: {!r}".format(self.utx.url))
+        LOGGER.action("Starting save_assets Action on url: %r", self.utx.url)
 
         if base_path:
             if not os.path.isdir(base_path):
                 raise ValueError("Provided path is not a valid directory! %s" % base_path)
             self.utx.base_path = base_path
 
+        # Files are submitted to the shared bounded worker pool, this returns
+        # as soon as every file is queued. Use `POOL.join()` to wait for them.
         for file in self:
             if not hasattr(file, 'start'):
-                LOGGER.error("Downloading for file %r cannot be started!" % file)
+                LOGGER.error("Downloading for file %r cannot be started!", file)
                 continue
             file.start()
 
@@ -140,24 +149,109 @@ class BaseWebPage(BaseIncrementalParser):
         :param str file_name: path of the file to write the contents to
         :param bool raw_html: whether write the unmodified html or the rewritten html
         """
-        if self.root is None:
+        if self.root is None and self._rewritten is None:
             self.__parse__()  # call in the action
 
-        LOGGER.action("Starting save_html Action on url: {!r}".format(self.utx.url))
+        LOGGER.action("Starting save_html Action on url: %r", self.utx.url)
+
+        if not raw_html and self.root is None and self._rewritten is None:
+            self.__parse__()
+            if not self.root:
+                raise ParseError("Tree is not being generated by parser!")
+
+        if not raw_html and self.root is None:
+            # the page was parsed in a process of the parse pool
+            raw_html, source = True, BytesIO(self._rewritten)
+        else:
+            source = None
+
+        if config.get('output_mode') == 'warc':
+            # the page is recorded in the WARC files as it was fetched
+            return
+
+        sink = archive_sink()
+        if sink is not None and sink.direct:
+            # the page is only written to the archive of the project
+            buf = BytesIO()
+            if raw_html:
+                buf.write((source or self.get_source()).read())
+            else:
+                self.root.getroottree().write(buf, method="html")
+            sink.add_stream(file_name, buf)
+            return
 
         # Create directories if neccessary
         if not os.path.exists(os.path.dirname(file_name)):
             os.makedirs(os.path.dirname(file_name))
 
-        if raw_html:
-            with open(file_name, 'wb') as fh:
-                fh.write(self.get_source().read())
-        else:
-            if self.root is None:
-                self.__parse__()
-                if not self.root:
-                    raise ParseError("Tree is not being generated by parser!")
-            self.root.getroottree().write(file_name, method="html")
+        with METRICS.timer('write'):
+            if raw_html:
+                with open(file_name, 'wb') as fh:
+                    fh.write((source or self.get_source()).read())
+            else:
+                self.root.getroottree().write(file_name, method="html")
+
+        if sink is not None:
+            sink.add_file(file_name)
+
+    def parse_in_pool(self, pool):
+        """Parses and rewrites the page in a process of the parse pool,
+        the files it links to are collected as usual while the rewritten
+        html is kept for `save_html`.
+
+        :param ParsePool pool: the pool, see `pywebcopy.parse_pool`
+        """
+        if not pool.can_parse(type(self)):
+            return self.__parse__()
+
+        LOGGER.action("Parsing the page in the parse pool, url: %r", self.utx.url)
+
+        source = self.get_source().read()
+        with METRICS.timer('parse'):
+            self._rewritten, links = pool.parse(self.utx.url, source, self.encoding, type(self))
+        for tag, url in links:
+            try:
+                self._stack.add(self.__create_element__(tag, url))
+            except (AssertionError, UrlRefusedByTagHandlerError) as e:
+                LOGGER.exception(e)
+        self._collected = True
+
+    def save_streamed(self, file_name):
+        """Parses the page and writes its rewritten html to the file while
+        it is being parsed, see `BaseIncrementalParser.__stream__`.
+
+        The linked files are collected but not saved, use `save_assets`
+        afterwards to start their downloads.
+
+        :param str file_name: path of the file to write the contents to
+        """
+        LOGGER.action("Starting save_streamed Action on url: %r", self.utx.url)
+
+        if config.get('output_mode') == 'warc':
+            # the page is recorded in the WARC files as it was fetched
+            with open(os.devnull, 'wb') as fh:
+                self.__stream__(fh)
+            return
+
+        sink = archive_sink()
+        if sink is not None and sink.direct:
+            # the page is only written to the archive of the project
+            with SpooledTemporaryFile(max_size=config.get('chunk_size') or 65536) as fh:
+                self.__stream__(fh)
+                fh.seek(0)
+                sink.add_stream(file_name, fh)
+            return
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+
+        # the file is complete or missing, never half written
+        part = file_name + '.part'
+        with open(part, 'wb') as fh:
+            self.__stream__(fh)
+        os.replace(part, file_name)
+
+        if sink is not None:
+            sink.add_file(file_name)
 
     def save_complete(self):
         """Saves the complete html+assets on page to a file and
@@ -170,7 +264,12 @@ class BaseWebPage(BaseIncrementalParser):
         assert self.url is not None, "Url is not setup."
         assert self.get_source() is not None, "Source is not setup."
 
-        LOGGER.action("Starting save_complete Action on url: {!r}".format(self.url))
+        LOGGER.action("Starting save_complete Action on url: %r", self.url)
+
+        if config.get('stream_html'):
+            self.save_streamed(self.utx.file_path)
+            self.save_assets()
+            return
 
         if self.root is None:
             self.__parse__()  # call in the action
@@ -244,13 +343,38 @@ class WebPage(BaseWebPage):
             only single http request to follow these configuration set it to 'False'.
         :param \*\*requestskwargs: keyword arguments which `requests` module may accept.
         """
+        #: A page is parsed again even when it is not modified,
+        #: thus its body is kept in the http cache
+        cache = http_cache() if use_global_session else None
+        cached = cache.body(url) if cache is not None else None
+
+        if cached is not None:
+            if cache.fresh(url):
+                LOGGER.info("Using the cached page of url %s", url)
+                return self.set_source(BytesIO(cached[0]), cached[1], url)
+
+            headers = dict(requestskwargs.pop('headers', None) or {})
+            headers.update(cache.request_headers(url))
+            requestskwargs['headers'] = headers
+
         if use_global_session:
             req = SESSION.get(url, stream=True, **requestskwargs)
         else:
             req = requests.get(url, stream=True, **requestskwargs)
+
+        if cached is not None and req.status_code == 304:
+            LOGGER.info("Page at url %s is not modified", url)
+            cache.refresh(url, req)
+            return self.set_source(BytesIO(cached[0]), cached[1], url)
+
         if not req.ok:
             raise InvalidUrlError("Url invalid :  %s" % url)
 
+        if cache is not None:
+            body = METRICS.read_body(req)
+            cache.update(url, req, body=body)
+            return self.set_source(BytesIO(body), req.encoding, req.url)
+
         # Set some information about the content being loaded so
         # that the parser has a better idea about
         self._url, self.encoding = req.url, req.encoding
@@ -259,4 +383,4 @@ class WebPage(BaseWebPage):
         # present on the source, thus we need to pass the raw stream
         # io object which serves the purpose
         req.raw.decode_content = True
-        self.set_source(req.raw)
+        self.set_source(TimedReader(req.raw, req.url))
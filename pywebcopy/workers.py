@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""
+pywebcopy.workers
+~~~~~~~~~~~~~~~~~
+
+Bounded pool of worker threads shared by every file handler.
+
+usage::
+    >>> from pywebcopy.workers import POOL
+    >>> future = POOL.submit(print, 'Hello from a worker!')
+    >>> POOL.join()     # blocks until every submitted task is done
+
+"""
+
+import threading
+from concurrent.futures import Future
+
+from six.moves.queue import Queue, Empty
+
+from . import LOGGER
+from .configs import config
+
+
+__all__ = ['WorkerPool', 'POOL']
+
+
+class WorkerPool(object):
+    """Fixed number of worker threads fed through a bounded queue.
+
+    Submitting a task while the queue is full blocks the caller until
+    a worker frees up a slot. Tasks submitted from inside a worker of
+    this pool never block; if the queue is full they are run inline by
+    the submitting worker, otherwise a pool filled with workers waiting
+    on their own pool would deadlock.
+
+    Workers are started on demand and stop after being idle for
+    `idle_timeout` seconds. They are not daemonic, so like the threads
+    they replace, pending downloads finish before the interpreter exits.
+
+    :param int max_workers: number of worker threads
+        (defaults to config['max_workers'])
+    :param int max_queue_size: number of tasks which can be waiting for a worker
+        (defaults to config['max_queue_size'])
+    :param float idle_timeout: seconds after which an idle worker stops
+    """
+
+    def __init__(self, max_workers=None, max_queue_size=None, idle_timeout=1.0):
+        self._max_workers = max_workers
+        self._max_queue_size = max_queue_size
+        self.idle_timeout = idle_timeout
+        self._tasks = Queue()
+        self._workers = set()
+        self._idle = 0
+        self._slots = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._all_done = threading.Condition(self._lock)
+        self._local = threading.local()
+
+    def __repr__(self):
+        return '<WorkerPool: workers=%d pending=%d>' % (len(self._workers), self._pending)
+
+    @property
+    def max_workers(self):
+        """:rtype: int"""
+        return self._max_workers or config.get('max_workers') or 8
+
+    @property
+    def max_queue_size(self):
+        """:rtype: int"""
+        if self._max_queue_size is not None:
+            return self._max_queue_size
+        return config.get('max_queue_size') or 0
+
+    @property
+    def pending(self):
+        """Number of submitted tasks which have not finished yet."""
+        return self._pending
+
+    def _get_slots(self):
+        with self._lock:
+            if self._slots is None:
+                self._slots = threading.BoundedSemaphore(
+                    self.max_workers + self.max_queue_size
+                )
+            return self._slots
+
+    def in_worker(self):
+        """Tells whether the calling thread is a worker of this pool."""
+        return getattr(self._local, 'is_worker', False)
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules `fn(*args, **kwargs)` to be run by a worker.
+
+        :rtype: concurrent.futures.Future
+        :returns: future representing the execution of the task
+        """
+        slots = self._get_slots()
+        future = Future()
+
+        if self.in_worker():
+            if not slots.acquire(False):
+                self._run(future, fn, args, kwargs)
+                return future
+        else:
+            slots.acquire()
+
+        with self._lock:
+            self._pending += 1
+            # Queued under the lock so that an idle worker never
+            # stops while a task is on its way to the queue.
+            self._tasks.put((future, fn, args, kwargs))
+            if not self._idle and len(self._workers) < self.max_workers:
+                self._start_worker()
+        return future
+
+    def _start_worker(self):
+        worker = threading.Thread(target=self._work,
+                                  name='pywebcopy-worker-%d' % len(self._workers))
+        self._workers.add(worker)
+        worker.start()
+
+    def _work(self):
+        self._local.is_worker = True
+
+        while True:
+            with self._lock:
+                self._idle += 1
+            try:
+                task = self._tasks.get(timeout=self.idle_timeout)
+            except Empty:
+                with self._lock:
+                    self._idle -= 1
+                    if self._tasks.empty():
+                        self._workers.discard(threading.current_thread())
+                        return
+                continue
+            with self._lock:
+                self._idle -= 1
+
+            if task is None:    # shutdown
+                with self._lock:
+                    self._workers.discard(threading.current_thread())
+                return
+
+            future, fn, args, kwargs = task
+            try:
+                self._run(future, fn, args, kwargs)
+            finally:
+                self._task_done()
+
+    @staticmethod
+    def _run(future, fn, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            LOGGER.exception("Task %r failed!", fn)
+            future.set_exception(e)
+
+    def _task_done(self):
+        self._slots.release()
+        with self._lock:
+            self._pending -= 1
+            if not self._pending:
+                self._all_done.notify_all()
+
+    def join(self, timeout=None):
+        """Blocks until every submitted task (and the tasks submitted
+        by these tasks) is done.
+
+        :param float timeout: maximum seconds to wait for, or None to wait forever
+        :rtype: bool
+        :returns: True if the pool is idle, False if timed out
+        """
+        with self._lock:
+            if self._pending:
+                self._all_done.wait_for(lambda: not self._pending, timeout)
+            return not self._pending
+
+    def shutdown(self, wait=True):
+        """Stops the worker threads after the queued tasks are done.
+        Workers are started again on the next submit, with the sizes
+        present in the config at that time."""
+        self.join()
+        with self._lock:
+            workers = list(self._workers)
+            for _ in workers:
+                self._tasks.put(None)
+            self._slots = None
+        if wait:
+            for worker in workers:
+                worker.join()
+
+
+POOL = WorkerPool()
+"""Global pool used by the file handlers."""
@@ -24,6 +24,11 @@ REQUIRED = [
     'requests', 'lxml', 'pyquery', 'parse', 'w3lib', 'bs4', 'six'
 ]
 
+# What packages are optional?
+EXTRAS = {
+    'async': ['aiohttp'],
+}
+
 
 # If you do change the License, remember to change the Trove Classifier for that!
 
@@ -93,6 +98,7 @@ setup(
     packages=['pywebcopy'],
 
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     include_package_data=True,
     license='Apache License 2.0',
     classifiers=[
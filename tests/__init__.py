@@ -10,6 +10,23 @@ Tests for pywebcopy components.
 from tests.structures_test import *
 from tests.config_test import *
 from tests.parsers_test import *
+from tests.workers_test import *
+from tests.async_engine_test import *
+from tests.scheduler_test import *
+from tests.crawler_test import *
+from tests.visited_test import *
+from tests.content_store_test import *
+from tests.http_cache_test import *
+from tests.journal_test import *
+from tests.archive_test import *
+from tests.warc_test import *
+from tests.robots_test import *
+from tests.css_test import *
+from tests.parse_pool_test import *
+from tests.benchmarks_test import *
+from tests.metrics_test import *
+from tests.logger_test import *
+from tests.profiling_test import *
 
 
 def main():
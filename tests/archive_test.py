@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from io import BytesIO
+from unittest import mock
+
+import pywebcopy.archive as archive
+import pywebcopy.core as core
+from pywebcopy.archive import ArchiveSink, archive_sink
+from pywebcopy.configs import config
+
+
+class TestArchiveSink(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.root = os.path.join(self.folder, 'project')
+        os.makedirs(os.path.join(self.root, 'site'))
+
+    def tearDown(self):
+        config.reset_config()
+        shutil.rmtree(self.folder)
+
+    def read_archive(self, path=None):
+        with zipfile.ZipFile(path or self.root + '.zip') as zf:
+            return {n: zf.read(n) for n in zf.namelist()}
+
+    def test_add(self):
+        path = os.path.join(self.root, 'site', 'a.txt')
+        with open(path, 'wb') as fh:
+            fh.write(b'saved')
+
+        sink = ArchiveSink(self.root + '.zip', self.root)
+        self.assertTrue(sink.add_file(path))
+        self.assertFalse(sink.add_file(path))
+        self.assertTrue(sink.add_stream(os.path.join(self.root, 'site', 'b.txt'), BytesIO(b'direct')))
+        self.assertIn(path, sink)
+        sink.close()
+
+        self.assertEqual(self.read_archive(), {'site/a.txt': b'saved', 'site/b.txt': b'direct'})
+
+    def test_stream_mode(self):
+        config['project_folder'] = self.root
+        config['archive_mode'] = 'stream'
+
+        path = os.path.join(self.root, 'site', 'a.txt')
+        core.write_stream(path, BytesIO(b'saved'))
+        with open(os.path.join(self.root, 'log.txt'), 'wb') as fh:
+            fh.write(b'log')
+        self.assertTrue(os.path.exists(path))
+
+        core.zip_project()
+        self.assertEqual(self.read_archive(), {'site/a.txt': b'saved', 'log.txt': b'log'})
+
+    def test_direct_mode(self):
+        config['project_folder'] = self.root
+        config['archive_mode'] = 'direct'
+
+        path = os.path.join(self.root, 'site', 'a.txt')
+        core.write_stream(path, BytesIO(b'saved'))
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(core.file_exists(path))
+
+        core.zip_project()
+        self.assertEqual(self.read_archive(), {'site/a.txt': b'saved'})
+
+    def test_compression_policy(self):
+        config['compression_workers'] = 2
+        names = ['site/%d.%s' % (i, ext) for i in range(20) for ext in ('css', 'png')]
+        data = b'body { margin: 0; }' * 100
+
+        sink = ArchiveSink(self.root + '.zip', self.root)
+        for name in names:
+            sink.add_stream(os.path.join(self.root, name), BytesIO(data))
+        sink.close()
+
+        with zipfile.ZipFile(self.root + '.zip') as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(), names)
+            for info in zf.infolist():
+                expected = zipfile.ZIP_STORED if info.filename.endswith('.png') else zipfile.ZIP_DEFLATED
+                self.assertEqual(info.compress_type, expected)
+                self.assertEqual(zf.read(info), data)
+
+    def test_zipfile_internals(self):
+        # fails loudly once a release of python changes the internals
+        # which the parallel compression writes its members with
+        with zipfile.ZipFile(self.root + '.zip', 'w') as zf:
+            self.assertTrue(archive.raw_members_supported(zf))
+
+    def test_without_parallel_compression(self):
+        data = b'body { margin: 0; }' * 100
+        with mock.patch.object(archive, 'raw_members_supported', return_value=False), \
+                mock.patch.object(archive, '_compress', side_effect=AssertionError):
+            sink = ArchiveSink(self.root + '.zip', self.root)
+            for name in ('site/a.css', 'site/b.png'):
+                sink.add_stream(os.path.join(self.root, name), BytesIO(data))
+            sink.close()
+
+        with zipfile.ZipFile(self.root + '.zip') as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.getinfo('site/a.css').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(self.read_archive(), {'site/a.css': data, 'site/b.png': data})
+
+    def test_state_files_are_left_out(self):
+        config['robots_cache'] = os.path.join(self.root, 'robots.json')
+        names = ['.crawl_journal.jsonl', '.pages_visited.sqlite', '.http_cache.sqlite',
+                 '.http_cache.sqlite-journal', '.robots_cache.json', 'robots.json',
+                 'site/a.txt.part', 'site/a.txt', 'test.log']
+        for name in names:
+            with open(os.path.join(self.root, name), 'wb') as fh:
+                fh.write(b'data')
+
+        sink = ArchiveSink(self.root + '.zip', self.root)
+        sink.add_leftovers()
+        sink.close()
+        self.assertEqual(sorted(self.read_archive()), ['site/a.txt', 'test.log'])
+
+    def test_folder_mode(self):
+        config['project_folder'] = self.root
+        self.assertIsNone(archive_sink())
+
+
+if __name__ == '__main__':
+    unittest.main()
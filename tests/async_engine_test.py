@@ -0,0 +1,193 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from pywebcopy.configs import config
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+SITE = {
+    '/index.html': (b'text/html', b'<html><head><link rel="stylesheet" href="style.css"></head>'
+                                  b'<body><a href="page.html">page</a>'
+                                  b'<img src="one.png"><img src="two.png"></body></html>'),
+    '/page.html': (b'text/html', b'<html><body><a href="index.html">back</a>'
+                                 b'<img src="one.png"></body></html>'),
+    '/style.css': (b'text/css', b'body { background: url(three.png); }'),
+    '/one.png': (b'image/png', b'one'),
+    '/two.png': (b'image/png', b'two'),
+    '/three.png': (b'image/png', b'three'),
+    '/large.html': (b'text/html', b'<img src="big.png"><img src="unsized.png">'),
+    '/big.png': (b'image/png', b'x' * 100),
+    '/unsized.png': (b'image/png', b'x' * 100),
+}
+
+#: Paths which are served without a content-length
+UNSIZED = {'/unsized.png'}
+
+
+async def _handle(reader, writer):
+    """Minimal http server which serves the files of the SITE map."""
+    request_line = await reader.readline()
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    path = request_line.split()[1].decode()
+    if path in SITE:
+        ctype, body = SITE[path]
+        head = b'HTTP/1.1 200 OK\r\nContent-Type: ' + ctype + b'\r\n'
+    else:
+        body = b'Not Found'
+        head = b'HTTP/1.1 404 Not Found\r\n'
+    if path not in UNSIZED:
+        head += b'Content-Length: %d\r\n' % len(body)
+    writer.write(head + b'Connection: close\r\n\r\n' + body)
+    await writer.drain()
+    writer.close()
+
+
+class LocalServer(threading.Thread):
+    def __init__(self):
+        super(LocalServer, self).__init__(daemon=True)
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.port = None
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(_handle, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+        server.close()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncEngine(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer()
+        self.server.start()
+        self.server.ready.wait(5)
+        self.url = 'http://127.0.0.1:%d/index.html' % self.server.port
+        self.folder = tempfile.mkdtemp()
+        config['project_name'] = 'test'
+        config['project_folder'] = self.folder
+        config['log_file'] = os.path.join(self.folder, 'test.log')
+
+    def tearDown(self):
+        self.server.stop()
+        config.reset_config()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def saved_files(self):
+        return sorted(
+            f.split('__')[-1]
+            for _, _, files in os.walk(self.folder)
+            for f in files
+        )
+
+    def test_save_webpage(self):
+        from pywebcopy.async_engine import AsyncEngine
+
+        wp = AsyncEngine(concurrency=2).save_webpage(self.url)
+        self.assertTrue(os.path.exists(wp.utx.file_path))
+        self.assertEqual(self.saved_files(),
+                         ['index.html', 'one.png', 'style.css', 'three.png', 'two.png'])
+
+        with open(wp.utx.file_path, 'rb') as fh:
+            html = fh.read()
+        self.assertNotIn(b'src="one.png"', html)
+
+    def test_save_website(self):
+        from pywebcopy.async_engine import AsyncEngine
+
+        AsyncEngine().save_website(self.url)
+        self.assertEqual(self.saved_files(),
+                         ['index.html', 'one.png', 'page.html', 'style.css',
+                          'three.png', 'two.png'])
+
+    def test_robots_read_off_the_loop(self):
+        from pywebcopy import SESSION
+        from pywebcopy.async_engine import AsyncEngine
+        from pywebcopy.robots import RobotsRegistry
+
+        threads = []
+
+        def fetch(url, **kwargs):
+            threads.append(threading.current_thread())
+            return requests.get(url, **kwargs)
+
+        self.addCleanup(setattr, SESSION, 'robots', SESSION.robots)
+        SESSION.robots = RobotsRegistry('*', fetch=fetch)
+        AsyncEngine().save_webpage(self.url)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_too_large(self):
+        from pywebcopy.async_engine import AsyncEngine
+
+        config['max_file_size'] = 60
+        AsyncEngine().save_webpage(self.url.replace('index', 'large'))
+        self.assertEqual(self.saved_files(), ['large.html'])
+
+    def test_too_large_recorded_truncated(self):
+        from pywebcopy.async_engine import AsyncEngine
+        from pywebcopy.warc import close_warc_writer, lookup
+
+        config['max_file_size'] = 60
+        config['output_mode'] = 'warc'
+        url = self.url.replace('index', 'large')
+        AsyncEngine().save_webpage(url)
+        close_warc_writer()
+
+        folder = os.path.join(self.folder, 'warc')
+        record = lookup(folder, url.replace('large.html', 'big.png'))
+        self.assertIn(b'WARC-Truncated: length\r\n', record)
+        self.assertTrue(record.endswith(b'Content-Length: 0\r\n\r\n\r\n\r\n'))
+        record = lookup(folder, url.replace('large.html', 'unsized.png'))
+        self.assertIn(b'WARC-Truncated: length\r\n', record)
+        self.assertTrue(record.endswith(b'\r\n\r\n' + b'x' * 60 + b'\r\n\r\n'))
+
+    def test_files_written_off_the_loop(self):
+        from pywebcopy.async_engine import AsyncEngine
+        from pywebcopy.elements import FileMixin
+
+        threads = []
+        write_file = FileMixin.write_file
+
+        def record(elem, *args, **kwargs):
+            threads.append(threading.current_thread())
+            return write_file(elem, *args, **kwargs)
+
+        with mock.patch.object(FileMixin, 'write_file', record):
+            AsyncEngine().save_webpage(self.url)
+        # the file linked from the stylesheet is saved too
+        self.assertEqual(self.saved_files(),
+                         ['index.html', 'one.png', 'style.css', 'three.png', 'two.png'])
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_missing_page(self):
+        from pywebcopy.async_engine import AsyncEngine
+        from pywebcopy.exceptions import InvalidUrlError
+
+        url = 'http://127.0.0.1:%d/missing.html' % self.server.port
+        with self.assertRaises(InvalidUrlError):
+            AsyncEngine().save_webpage(url)
+        with self.assertRaises(InvalidUrlError):
+            AsyncEngine().save_website(url)
+
+
+if __name__ == '__main__':
+    unittest.main()
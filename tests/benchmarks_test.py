@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from six.moves.urllib.request import urlopen
+
+from benchmarks import micro
+from benchmarks.run import compare
+from benchmarks.server import SiteServer
+from benchmarks.site import SiteShape, generate_site
+
+
+class TestSite(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def test_generated(self):
+        shape = SiteShape(pages=5, assets=3, css_depth=2, page_size=4096, asset_size=128)
+        manifest = generate_site(self.folder, shape)
+        self.assertEqual(manifest['pages'], 5)
+        self.assertEqual(manifest['files'], 5 * (3 + 2))
+
+        with open(os.path.join(self.folder, 'index.html'), 'rb') as fh:
+            index = fh.read()
+        self.assertGreaterEqual(len(index), 4096)
+        self.assertIn(b'href="page1.html"', index)
+        self.assertIn(b'href="css/p0-0.css"', index)
+        with open(os.path.join(self.folder, 'css', 'p0-0.css'), 'rb') as fh:
+            self.assertIn(b'@import "p0-1.css";', fh.read())
+
+    def test_same_site_for_same_shape(self):
+        shape = SiteShape(pages=3, assets=2, page_size=2048, asset_size=64, seed=7)
+        generate_site(self.folder, shape)
+        with open(os.path.join(self.folder, 'page2.html'), 'rb') as fh:
+            first = fh.read()
+
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        generate_site(other, shape)
+        with open(os.path.join(other, 'page2.html'), 'rb') as fh:
+            self.assertEqual(fh.read(), first)
+
+    def test_served(self):
+        generate_site(self.folder, SiteShape(pages=1, assets=0, css_depth=0, page_size=100))
+        with SiteServer(self.folder) as server:
+            with open(os.path.join(self.folder, 'manifest.json'), 'rb') as fh:
+                self.assertEqual(urlopen(server.url + 'manifest.json').read(), fh.read())
+
+
+class TestCompare(unittest.TestCase):
+    def test_regressions(self):
+        old = {'shape': {}, 'results': {'page': {'wall_time': 1.0, 'peak_rss_mb': 50.0}}}
+        new = json.loads(json.dumps(old))
+        new['results']['page']['wall_time'] = 1.05
+        self.assertFalse(compare(old, new, threshold=0.1)[1])
+
+        new['results']['page']['peak_rss_mb'] = 80.0
+        lines, regressed = compare(old, new, threshold=0.1)
+        self.assertTrue(regressed)
+        self.assertIn('REGRESSION', lines[-1])
+
+
+class TestMicro(unittest.TestCase):
+    def test_fixtures(self):
+        self.assertEqual(len(micro.fixture_urls()), 1000)
+        for name in ('page_small.html', 'page_medium.html', 'page_large.html', 'stylesheet_large.css'):
+            self.assertTrue(os.path.isfile(os.path.join(micro.FIXTURES, name)), name)
+
+    def test_every_benchmark_runs(self):
+        for name, setup in micro.BENCHMARKS.items():
+            func, ops = setup()
+            self.assertGreater(ops, 0, name)
+            func()
+
+    def test_per_op_timing(self):
+        result = micro.time_benchmark('urls.relate', repeat=1, min_time=0)
+        self.assertEqual(result['ops'], 1000)
+        self.assertEqual(result['calls'], 1)
+        self.assertGreater(result['per_op_us'], 0)
+
+    def test_compare(self):
+        old = {'results': {'urls.relate': {'per_op_us': 10.0}}}
+        self.assertFalse(micro.compare(old, {'results': {'urls.relate': {'per_op_us': 10.5}}})[1])
+        lines, regressed = micro.compare(old, {'results': {'urls.relate': {'per_op_us': 12.0}}})
+        self.assertTrue(regressed)
+        self.assertIn('REGRESSION', lines[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+
+import pywebcopy.core as core
+from pywebcopy import api
+from pywebcopy.configs import SESSION, config
+from pywebcopy.content_store import CONTENT_STORE
+
+
+class TestContentStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        config['dedupe_files'] = True
+
+    def tearDown(self):
+        config.reset_config()
+        CONTENT_STORE.clear()
+        shutil.rmtree(self.folder)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def test_duplicates_are_linked(self):
+        core.write_stream(self.path('a.png'), BytesIO(b'sprite'))
+        core.write_stream(self.path('b.png'), BytesIO(b'sprite'))
+        core.write_stream(self.path('c.png'), BytesIO(b'other'))
+
+        self.assertTrue(os.path.samefile(self.path('a.png'), self.path('b.png')))
+        self.assertFalse(os.path.samefile(self.path('a.png'), self.path('c.png')))
+        self.assertEqual(sorted(os.listdir(self.folder)), ['a.png', 'b.png', 'c.png'])
+        self.assertEqual(CONTENT_STORE.saved_bytes, 6)
+
+    def test_canonical_path(self):
+        core.write_stream(self.path('a.png'), BytesIO(b'sprite'))
+        core.write_stream(self.path('b.png'), BytesIO(b'sprite'))
+
+        self.assertEqual(CONTENT_STORE.canonical_path(self.path('b.png')), self.path('a.png'))
+        self.assertEqual(CONTENT_STORE.canonical_path(self.path('a.png')), self.path('a.png'))
+        self.assertEqual(CONTENT_STORE.canonical_path(self.path('x.png')), self.path('x.png'))
+
+    def test_overwritten(self):
+        core.write_stream(self.path('a.png'), BytesIO(b'sprite'))
+        core.write_stream(self.path('b.png'), BytesIO(b'sprite'))
+        config['over_write'] = True
+        core.write_stream(self.path('a.png'), BytesIO(b'changed'))
+
+        # the old contents are neither linked to nor pointed at anymore
+        self.assertEqual(CONTENT_STORE.canonical_path(self.path('b.png')), self.path('b.png'))
+        core.write_stream(self.path('c.png'), BytesIO(b'sprite'))
+        self.assertFalse(os.path.samefile(self.path('a.png'), self.path('c.png')))
+        with open(self.path('c.png'), 'rb') as fh:
+            self.assertTrue(fh.read().startswith(b'sprite'))
+
+    def test_cleared_per_project(self):
+        core.write_stream(self.path('a.png'), BytesIO(b'sprite'))
+        # the project folder becomes the working directory
+        self.addCleanup(os.chdir, os.getcwd())
+        self.addCleanup(setattr, SESSION, 'robots', SESSION.robots)
+        self.addCleanup(setattr, SESSION, 'robots_txt', SESSION.robots_txt)
+        with mock.patch.object(api, 'start_profile', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                api.save_webpage('http://127.0.0.1:9/', self.path('project'))
+        core.write_stream(self.path('b.png'), BytesIO(b'sprite'))
+        self.assertNotEqual(CONTENT_STORE.canonical_path(self.path('b.png')), self.path('a.png'))
+
+    def test_disabled(self):
+        config['dedupe_files'] = False
+        core.write_stream(self.path('a.png'), BytesIO(b'sprite'))
+        core.write_stream(self.path('b.png'), BytesIO(b'sprite'))
+        self.assertFalse(os.path.samefile(self.path('a.png'), self.path('b.png')))
+
+
+if __name__ == '__main__':
+    unittest.main()
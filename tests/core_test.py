@@ -1,6 +1,12 @@
 import os.path
+import shutil
+import tempfile
 import unittest
+from io import BytesIO
+
 import pywebcopy.core as core
+from pywebcopy.configs import config
+from pywebcopy.exceptions import FileTooLargeError
 
 
 class TestCore(unittest.TestCase):
@@ -21,5 +27,33 @@ class TestCore(unittest.TestCase):
         self.assertTrue(os.path.exists(saved), "File didn't get saved.")
 
 
+class TestWriteStream(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.location = os.path.join(self.folder, 'file.bin')
+
+    def tearDown(self):
+        config.reset_config()
+        shutil.rmtree(self.folder)
+
+    def test_chunks(self):
+        config['chunk_size'] = 3
+        self.assertEqual(list(core.iter_chunks(BytesIO(b'abcdefg'))), [b'abc', b'def', b'g'])
+
+    def test_write(self):
+        config['chunk_size'] = 4
+        written = core.write_stream(self.location, BytesIO(b'x' * 10), b'!')
+        self.assertEqual(written, 10)
+        with open(self.location, 'rb') as fh:
+            self.assertEqual(fh.read(), b'x' * 10 + b'!')
+
+    def test_max_file_size(self):
+        config['chunk_size'] = 4
+        config['max_file_size'] = 8
+        with self.assertRaises(FileTooLargeError):
+            core.write_stream(self.location, BytesIO(b'x' * 10))
+        self.assertEqual(os.listdir(self.folder), [])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,194 @@
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from six.moves.BaseHTTPServer import HTTPServer
+from six.moves.SimpleHTTPServer import SimpleHTTPRequestHandler
+from six.moves.socketserver import ThreadingMixIn
+
+from pywebcopy.configs import config
+from pywebcopy.crawler import Crawler, Frontier
+from pywebcopy.journal import journal_path
+from pywebcopy.scheduler import SCHEDULER
+from pywebcopy.workers import POOL
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class TestFrontier(unittest.TestCase):
+    def test_breadth_first_order(self):
+        frontier = Frontier()
+        for url, depth in (('a', 0), ('b', 1), ('c', 1), ('d', 2)):
+            self.assertTrue(frontier.add(url, depth))
+        self.assertEqual([frontier.get() for _ in range(4)],
+                         [('a', 0), ('b', 1), ('c', 1), ('d', 2)])
+
+    def test_duplicates_are_refused(self):
+        frontier = Frontier()
+        self.assertTrue(frontier.add('a'))
+        self.assertFalse(frontier.add('a', 3))
+        self.assertEqual(len(frontier), 1)
+
+    def test_canonical_batches(self):
+        config['canonicalize_urls'] = True
+        self.addCleanup(config.reset_config)
+
+        frontier = Frontier()
+        self.assertEqual(frontier.add_many(['http://A.com:80/x/./p?utm_source=n#top',
+                                            'http://a.com/x/p', 'http://a.com/y'], 1), 2)
+        self.assertEqual([frontier.get() for _ in range(2)],
+                         [('http://a.com/x/p', 1), ('http://a.com/y', 1)])
+
+    def test_limits(self):
+        frontier = Frontier(max_depth=1, max_pages=2)
+        self.assertTrue(frontier.add('a', 0))
+        self.assertFalse(frontier.add('b', 2))
+        self.assertTrue(frontier.add('c', 1))
+        self.assertFalse(frontier.add('d', 1))
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        SimpleHTTPRequestHandler.do_GET(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCrawler(unittest.TestCase):
+    def setUp(self):
+        _Handler.paths = []
+        self.site = tempfile.mkdtemp()
+        # a chain of pages each linking to the next one
+        for i in range(4):
+            with open(os.path.join(self.site, 'page%d.html' % i), 'w') as fh:
+                fh.write('<html><body><a href="page%d.html">next</a>'
+                         '<img src="img%d.png"></body></html>' % (i + 1, i))
+            with open(os.path.join(self.site, 'img%d.png' % i), 'wb') as fh:
+                fh.write(b'png')
+
+        handler = functools.partial(_Handler, directory=self.site)
+        self.server = _Server(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/page0.html' % self.server.server_address[1]
+
+        self.folder = tempfile.mkdtemp()
+        config['project_name'] = 'test'
+        config['project_folder'] = self.folder
+        config['log_file'] = os.path.join(self.folder, 'test.log')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        config.reset_config()
+        shutil.rmtree(self.site, ignore_errors=True)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def saved_files(self):
+        SCHEDULER.join()
+        POOL.join()
+        return sorted(
+            f.split('__')[-1]
+            for _, _, files in os.walk(self.folder)
+            for f in files
+            if not f.startswith('.')
+        )
+
+    def test_max_depth(self):
+        crawler = Crawler(self.url)
+        crawler.run(max_depth=1, max_workers=2)
+        self.assertTrue(os.path.exists(crawler.file_path))
+        self.assertEqual(self.saved_files(),
+                         ['img0.png', 'img1.png', 'page0.html', 'page1.html'])
+
+    def test_max_pages(self):
+        Crawler(self.url).run(max_pages=3)
+        self.assertEqual(self.saved_files(),
+                         ['img0.png', 'img1.png', 'img2.png',
+                          'page0.html', 'page1.html', 'page2.html'])
+
+    def test_shared_file_without_file_name(self):
+        os.mkdir(os.path.join(self.site, 'avatar'))
+        with open(os.path.join(self.site, 'avatar', 'index.html'), 'wb') as fh:
+            fh.write(b'png')
+        for i in range(2):
+            with open(os.path.join(self.site, 'page%d.html' % i), 'w') as fh:
+                fh.write('<html><body><a href="page%d.html">next</a>'
+                         '<img src="avatar/"></body></html>' % (i + 1))
+
+        Crawler(self.url).run(max_pages=2)
+        SCHEDULER.join()
+        POOL.join()
+        saved = {}
+        for root, _, files in os.walk(self.folder):
+            for f in files:
+                if f.startswith('file_') or f.endswith('.html'):
+                    with open(os.path.join(root, f), 'rb') as fh:
+                        saved[f] = fh.read()
+
+        avatars = [f for f in saved if f.startswith('file_')]
+        self.assertEqual(len(avatars), 1)
+        # every page links to the single downloaded copy
+        pages = [v for f, v in saved.items() if f.endswith('.html')]
+        self.assertEqual(len(pages), 2)
+        for html in pages:
+            self.assertIn(avatars[0].encode(), html)
+
+    def test_journal_closed_after_downloads(self):
+        crawler = Crawler(self.url)
+        crawler.run(max_pages=2)
+        self.assertTrue(crawler.journal._fh.closed)
+        with open(journal_path()) as fh:
+            completed = [l for l in fh if '"completed"' in l]
+        self.assertEqual(len(completed), 2)
+
+    def test_resume(self):
+        crawler = Crawler(self.url)
+        crawler.run(max_pages=3)
+        self.saved_files()
+
+        # the crawl was interrupted while saving the third page
+        with open(journal_path()) as fh:
+            lines = [l for l in fh if not ('completed' in l and 'page2' in l)]
+        with open(journal_path(), 'w') as fh:
+            fh.writelines(lines)
+
+        _Handler.paths = []
+        crawler.run(resume=True)
+        self.assertEqual(self.saved_files(),
+                         ['img0.png', 'img1.png', 'img2.png', 'img3.png',
+                          'page0.html', 'page1.html', 'page2.html', 'page3.html'])
+        # completed pages are not fetched again
+        self.assertEqual(sorted(p for p in _Handler.paths if p.endswith('.html')),
+                         ['/page2.html', '/page3.html', '/page4.html'])
+
+    def test_resume_refused_in_direct_archive_mode(self):
+        config['zip_project_folder'] = True
+        config['archive_mode'] = 'direct'
+        with self.assertRaises(ValueError):
+            Crawler(self.url).run(resume=True)
+        self.assertEqual(_Handler.paths, [])
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_resume_not_supported_by_asyncio_engine(self):
+        config['engine'] = 'asyncio'
+        with self.assertLogs('pywebcopy', 'WARNING') as logs:
+            Crawler(self.url).run(max_pages=1, resume=True)
+        self.assertTrue(any('crawled from the start' in m for m in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from pywebcopy.configs import config
+from pywebcopy.css import STYLESHEETS, StylesheetGraph, iter_css_urls, rewrite_css
+from pywebcopy.elements import LinkTag
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    """Fails the first request of the stylesheet and serves it afterwards."""
+    requests = 0
+
+    def do_GET(self):
+        _FlakyHandler.requests += 1
+        body = b'a { color: red }'
+        self.send_response(503 if _FlakyHandler.requests == 1 else 200)
+        self.send_header('Content-Type', 'text/css')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRewriteCss(unittest.TestCase):
+    def test_quotes_are_kept(self):
+        css = b'a{background:url( "a.png" )}b{background:url(\'b.png\')}c{background:URL(c.png)}'
+        self.assertEqual(rewrite_css(css, lambda url: b'x/' + url),
+                         b'a{background:url("x/a.png")}b{background:url(\'x/b.png\')}'
+                         b'c{background:url(x/c.png)}')
+
+    def test_imports(self):
+        css = b'@import "a.css";\n@import url(b.css) screen;\n@import\'c.css\';'
+        self.assertEqual(rewrite_css(css, lambda url: b'x/' + url),
+                         b'@import "x/a.css";\n@import url(x/b.css) screen;\n@import \'x/c.css\';')
+
+    def test_comments_strings_and_data_are_skipped(self):
+        css = (b'/* url(a.png) */ a{content:"url(b.png)"} '
+               b'b{background:url(data:image/png;base64,AAAA)} c{filter:url(#f)}')
+        calls = []
+        self.assertEqual(rewrite_css(css, calls.append), css)
+        self.assertEqual(calls, [])
+
+    def test_resolved_once(self):
+        css = b''.join(b'.i%d{background:url(a.png)}' % i for i in range(50)) + b'p{background:url(b.png)}'
+        calls = []
+
+        def resolve(url):
+            calls.append(url)
+            return url.upper()
+
+        out = rewrite_css(css, resolve)
+        self.assertEqual(calls, [b'a.png', b'b.png'])
+        self.assertEqual(out.count(b'url(A.PNG)'), 50)
+        self.assertEqual(list(iter_css_urls(css)), [b'a.png', b'b.png'])
+
+    def test_unchanged_when_resolve_refuses(self):
+        css = b'a{background:url(a.png)}'
+        self.assertEqual(rewrite_css(css, lambda url: None), css)
+
+
+class TestStylesheetGraph(unittest.TestCase):
+    def test_claimed_once(self):
+        graph = StylesheetGraph()
+        self.assertTrue(graph.claim('http://a.com/a.css', '/p/a.css'))
+        self.assertFalse(graph.claim('http://a.com/a.css', '/p/a.css'))
+        # saved to another project
+        self.assertTrue(graph.claim('http://a.com/a.css', '/q/a.css'))
+
+        graph.release('http://a.com/a.css', '/q/a.css')
+        self.assertTrue(graph.claim('http://a.com/a.css', '/q/a.css'))
+        self.assertIn('http://a.com/a.css', graph)
+
+    def test_cycles(self):
+        graph = StylesheetGraph()
+        self.assertTrue(graph.add_import('a.css', 'b.css'))
+        self.assertTrue(graph.add_import('b.css', 'c.css'))
+        self.assertFalse(graph.add_import('c.css', 'a.css'))
+        self.assertEqual(graph.cycles, [['c.css', 'a.css', 'b.css', 'c.css']])
+        self.assertFalse(graph.add_import('d.css', 'd.css'))
+        self.assertTrue(graph.add_import('a.css', 'e.css'))
+        self.assertEqual(graph.imports('a.css'), {'b.css', 'e.css'})
+
+
+class TestLinkTag(unittest.TestCase):
+    def tearDown(self):
+        STYLESHEETS.clear()
+
+    def test_processed_once(self):
+        tag = LinkTag('http://a.com/css/style.css', base_path='/tmp/project')
+        self.assertTrue(STYLESHEETS.claim(tag.url, tag.file_path))
+        # an already claimed stylesheet is not fetched again
+        self.assertIsNone(tag.run())
+
+    def test_retried_after_failure(self):
+        _FlakyHandler.requests = 0
+        server = HTTPServer(('127.0.0.1', 0), _FlakyHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        self.addCleanup(config.reset_config)
+        config['project_folder'] = folder
+
+        url = 'http://127.0.0.1:%d/style.css' % server.server_port
+        LinkTag(url, base_path=folder).run()
+        tag = LinkTag(url, base_path=folder)
+        self.assertFalse(os.path.exists(tag.file_path))
+
+        # a later reference saves the stylesheet which failed before
+        tag.run()
+        self.assertEqual(_FlakyHandler.requests, 2)
+        with open(tag.file_path, 'rb') as fh:
+            self.assertTrue(fh.read().startswith(b'a { color: red }'))
+
+    def test_saved_stylesheet_is_not_fetched(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        tag = LinkTag('http://127.0.0.1:9/style.css', base_path=folder)
+        os.makedirs(os.path.dirname(tag.file_path))
+        with open(tag.file_path, 'wb') as fh:
+            fh.write(b'a { color: red }')
+
+        # a later run of the project finds it on disk
+        with mock.patch('pywebcopy.elements.get') as get:
+            tag.run()
+        get.assert_not_called()
+
+    def test_linked_files_are_submitted_once(self):
+        submitted = []
+        tag = LinkTag('http://a.com/css/style.css', base_path='/tmp/project')
+        tag.submit_linked_file = submitted.append
+        tag.contents = (b'@import "other.css"; a{background:url(../img/a.png)} '
+                        b'b{background:url("../img/a.png")}')
+        tag.extract_css_urls()
+
+        self.assertEqual([e.url for e in submitted],
+                         ['http://a.com/css/other.css', 'http://a.com/img/a.png'])
+        self.assertIsInstance(submitted[0], LinkTag)
+        self.assertEqual(tag.files, 2)
+        self.assertEqual(tag.contents.count(b'a.png'), 2)
+        self.assertNotIn(b'../img/a.png', tag.contents)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from pywebcopy.configs import config
+from pywebcopy.elements import TagBase
+from pywebcopy.http_cache import HttpCache, http_cache
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves a single image with an ETag and counts the responses."""
+    body = b'png'
+    etag = '"v1"'
+    statuses = []
+    always_not_modified = False
+
+    def do_GET(self):
+        if self.always_not_modified or self.headers.get('If-None-Match') == self.etag:
+            self.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.statuses.append(200)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Response(object):
+    def __init__(self, headers):
+        self.headers = headers
+        self.encoding = 'utf-8'
+
+
+class TestHttpCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = HttpCache(os.path.join(self.folder, 'cache.sqlite'))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.folder)
+
+    def test_validators(self):
+        self.cache.update('http://a/', _Response({'etag': '"x"', 'last-modified': 'Mon'}))
+        self.assertEqual(self.cache.request_headers('http://a/'),
+                         {'If-None-Match': '"x"', 'If-Modified-Since': 'Mon'})
+        self.assertEqual(self.cache.request_headers('http://b/'), {})
+        self.assertFalse(self.cache.fresh('http://a/'))
+
+    def test_max_age_and_no_store(self):
+        self.cache.update('http://a/', _Response({'cache-control': 'public, max-age=60'}), b'body')
+        self.assertTrue(self.cache.fresh('http://a/'))
+        self.assertEqual(self.cache.body('http://a/'), (b'body', 'utf-8'))
+
+        self.cache.update('http://a/', _Response({'cache-control': 'no-store', 'etag': '"x"'}))
+        self.assertIsNone(self.cache.body('http://a/'))
+        self.assertEqual(self.cache.request_headers('http://a/'), {})
+
+
+class TestConditionalDownload(unittest.TestCase):
+    def setUp(self):
+        _Handler.statuses = []
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/img.png' % self.server.server_address[1]
+
+        self.folder = tempfile.mkdtemp()
+        config['project_folder'] = self.folder
+        config['http_cache'] = True
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        http_cache().close()
+        config.reset_config()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_not_modified_file_is_not_transferred(self):
+        TagBase(self.url, base_path=self.folder).download_file()
+        file_path = TagBase(self.url, base_path=self.folder).file_path
+        self.assertTrue(os.path.exists(file_path))
+        mtime = os.stat(file_path).st_mtime_ns
+
+        TagBase(self.url, base_path=self.folder).download_file()
+        self.assertEqual(_Handler.statuses, [200, 304])
+        self.assertEqual(os.stat(file_path).st_mtime_ns, mtime)
+
+
+class TestUnconditionalNotModified(unittest.TestCase):
+    def setUp(self):
+        _Handler.statuses = []
+        _Handler.always_not_modified = True
+        self.addCleanup(setattr, _Handler, 'always_not_modified', False)
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/img.png' % self.server.server_address[1]
+
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, True)
+        self.addCleanup(config.reset_config)
+        config['project_folder'] = self.folder
+        config['http_cache'] = False
+
+    def test_not_modified_without_cache(self):
+        elem = TagBase(self.url, base_path=self.folder)
+        elem.download_file()
+        self.assertEqual(_Handler.statuses, [304])
+        self.assertFalse(os.path.exists(elem.file_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pywebcopy.journal import CrawlJournal
+
+
+class TestCrawlJournal(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_replay(self):
+        journal = CrawlJournal(self.path)
+        journal.queued('a', 0)
+        journal.queued('b', 1)
+        journal.queued('c', 1)
+        journal.completed('a', '/a.html')
+        journal.failed('b', ValueError('oops'))
+        state = journal.replay()
+        journal.close()
+
+        self.assertEqual(list(state.queued.items()), [('a', 0), ('b', 1), ('c', 1)])
+        self.assertEqual(state.completed, {'a': '/a.html'})
+        self.assertEqual(state.failed, {'b': 'oops'})
+        self.assertEqual(state.pending, [('b', 1), ('c', 1)])
+
+    def test_line_cut_short_by_a_crash(self):
+        journal = CrawlJournal(self.path)
+        journal.queued('a', 0)
+        journal.close()
+        with open(self.path, 'a') as fh:
+            fh.write('{"e":"completed","url":"a"')
+
+        journal = CrawlJournal(self.path, reset=False)
+        journal.queued('b', 1)
+        state = journal.replay()
+        journal.close()
+
+        self.assertEqual(state.pending, [('a', 0), ('b', 1)])
+
+    def test_reset(self):
+        CrawlJournal(self.path).queued('a', 0)
+        journal = CrawlJournal(self.path)
+        self.assertEqual(journal.replay().pending, [])
+        journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pywebcopy.configs import config
+from pywebcopy.logger import LOGGER, flush_logs, new_file_logger, start_queue_logging, stop_queue_logging
+
+
+class _Lazy(object):
+    """Remembers the threads it is formatted in."""
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread())
+        return 'lazy'
+
+
+class TestQueueLogging(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.addCleanup(LOGGER.setLevel, LOGGER.level)
+        self.addCleanup(stop_queue_logging)
+
+    def _read(self, name):
+        with open(os.path.join(self.folder, name)) as fh:
+            return fh.read()
+
+    def test_formatted_in_background(self):
+        start_queue_logging(new_file_logger(os.path.join(self.folder, 'a.log'), 'w'))
+        lazy = _Lazy()
+        LOGGER.info('Handling url %s', lazy)
+        flush_logs()
+        self.assertIn('Handling url lazy', self._read('a.log'))
+        # other handlers of the test runner may format it here too
+        self.assertTrue([t for t in lazy.threads if t is not threading.current_thread()])
+
+    def test_restart_closes_handlers(self):
+        first = new_file_logger(os.path.join(self.folder, 'a.log'), 'w')
+        start_queue_logging(first)
+        LOGGER.warning('first')
+        start_queue_logging(new_file_logger(os.path.join(self.folder, 'b.log'), 'w'))
+        LOGGER.warning('second')
+        flush_logs()
+
+        self.assertIsNone(first.stream)
+        self.assertIn('first', self._read('a.log'))
+        self.assertNotIn('second', self._read('a.log'))
+        self.assertIn('second', self._read('b.log'))
+        queued = [h for h in LOGGER.handlers if type(h).__name__ == 'DeferredQueueHandler']
+        self.assertEqual(len(queued), 1)
+
+    def test_log_level(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        self.addCleanup(config.reset_config)
+        config['log_level'] = 'info'
+        config.setup_paths(self.folder, 'project')
+        self.assertEqual(LOGGER.level, logging.INFO)
+        self.assertFalse(LOGGER.isEnabledFor(logging.DEBUG))
+
+        LOGGER.debug('not written')
+        LOGGER.info('written')
+        flush_logs()
+        with open(config['log_file']) as fh:
+            log = fh.read()
+        self.assertIn('written', log)
+        self.assertNotIn('not written', log)
+
+    def test_unknown_log_level(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        self.addCleanup(config.reset_config)
+        config['log_level'] = 'loud'
+        with self.assertRaises(ValueError):
+            config.setup_paths(self.folder, 'project')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+
+from pywebcopy.configs import SESSION, config
+from pywebcopy.core import write_stream
+from pywebcopy.metrics import Metrics, METRICS, PHASES, TimedReader, Transfer
+from pywebcopy.scheduler import HostScheduler
+from pywebcopy.workers import WorkerPool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'x' * 1000
+        self.send_response(200 if self.path != '/missing' else 404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestMetrics(unittest.TestCase):
+    def test_phases(self):
+        m = Metrics()
+        m.observe('ttfb', 0.5)
+        m.observe('ttfb', 0.25)
+        with m.timer('parse'):
+            pass
+        snap = m.snapshot()
+        self.assertEqual(sorted(snap['phases']), sorted(PHASES))
+        self.assertEqual(snap['phases']['ttfb'], {'count': 2, 'total': 0.75, 'mean': 0.375,
+                                                  'min': 0.25, 'max': 0.5})
+        self.assertEqual(snap['phases']['parse']['count'], 1)
+        self.assertIsNone(snap['phases']['write']['mean'])
+
+        m.reset()
+        self.assertEqual(m.snapshot()['phases']['ttfb']['count'], 0)
+
+    def test_counters(self):
+        m = Metrics()
+        m.responded('http://a.com/x.png', 200)
+        m.responded('http://A.com/y.png', 404)
+        m.received('http://a.com/x.png', 100, 0.1)
+        m.failed('http://b.com/')
+        snap = m.snapshot()
+        self.assertEqual(snap['status'], {'200': 1, '404': 1})
+        self.assertEqual(snap['requests'], {'a.com': 2})
+        self.assertEqual(snap['bytes'], {'a.com': 100})
+        self.assertEqual(snap['errors'], {'b.com': 1})
+        self.assertEqual(snap['phases']['transfer']['count'], 1)
+
+    def test_transfer(self):
+        chunks = Transfer([b'ab', b'cde'])
+        self.assertEqual(b''.join(chunks), b'abcde')
+        self.assertEqual(chunks.size, 5)
+        self.assertGreaterEqual(chunks.seconds, 0)
+
+    def test_timed_reader(self):
+        METRICS.reset()
+        reader = TimedReader(BytesIO(b'x' * 10), 'http://a.com/page.html')
+        self.assertEqual(reader.read(4), b'xxxx')
+        self.assertEqual(METRICS.snapshot()['bytes'], {})
+        self.assertEqual(reader.read(), b'x' * 6)
+        self.assertEqual(reader.read(4), b'')
+        snap = METRICS.snapshot()
+        self.assertEqual(snap['bytes'], {'a.com': 10})
+        self.assertEqual(snap['phases']['transfer']['count'], 1)
+
+    def test_prometheus(self):
+        m = Metrics()
+        m.observe('connect', 0.5)
+        m.responded('http://a.com/', 200)
+        m.received('http://a"b.com/', 10)
+        text = m.to_prometheus()
+        self.assertIn('# TYPE pywebcopy_phase_seconds summary\n', text)
+        self.assertIn('pywebcopy_phase_seconds_sum{phase="connect"} 0.5\n', text)
+        self.assertIn('pywebcopy_phase_seconds_count{phase="connect"} 1\n', text)
+        self.assertIn('pywebcopy_responses_total{code="200"} 1\n', text)
+        self.assertIn('pywebcopy_bytes_total{host="a\\"b.com"} 10\n', text)
+
+    def test_dump(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        m = Metrics()
+        m.responded('http://a.com/', 200)
+        json_path, prom_path = m.dump(folder)
+        with open(json_path) as fh:
+            self.assertEqual(json.load(fh)['status'], {'200': 1})
+        with open(prom_path) as fh:
+            self.assertIn('pywebcopy_requests_total{host="a.com"} 1', fh.read())
+
+
+class TestCollected(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_port
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        METRICS.reset()
+
+    def tearDown(self):
+        SESSION.close()
+        config.reset_config()
+
+    def test_request(self):
+        resp = SESSION.get(self.url + 'file.png')
+        write_stream(os.path.join(self.folder, 'file.png'), resp)
+        SESSION.get(self.url + 'missing').close()
+
+        snap = METRICS.snapshot()
+        host = '127.0.0.1:%d' % self.server.server_port
+        self.assertEqual(snap['status'], {'200': 1, '404': 1})
+        self.assertEqual(snap['requests'], {host: 2})
+        self.assertEqual(snap['bytes'], {host: 1000})
+        for phase in ('connect', 'ttfb'):
+            self.assertGreaterEqual(snap['phases'][phase]['count'], 1, phase)
+        for phase in ('transfer', 'write'):
+            self.assertEqual(snap['phases'][phase]['count'], 1, phase)
+
+    def test_queue_wait(self):
+        pool = WorkerPool(max_workers=1, max_queue_size=1, idle_timeout=0.1)
+        scheduler = HostScheduler(pool, max_per_host=1)
+        for _ in range(3):
+            scheduler.submit(self.url, lambda: None)
+        scheduler.join()
+        pool.shutdown()
+        self.assertEqual(METRICS.snapshot()['phases']['queue_wait']['count'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+
+from pywebcopy.configs import config
+from pywebcopy.content_store import CONTENT_STORE
+from pywebcopy.crawler import AnchorTagHandler
+from pywebcopy.elements import ImgTag
+from pywebcopy.parse_pool import ParsePool, _overrides, _portable, parse_pool
+from pywebcopy.urls import relate
+from pywebcopy.webpage import WebPage
+
+
+HTML = (b'<html><head><link rel="stylesheet" href="css/style.css"></head>'
+        b'<body><a href="about.html">about</a><img src="img/logo.png"></body></html>')
+
+
+class TestParsePool(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        # the project folder becomes the working directory
+        self.addCleanup(os.chdir, os.getcwd())
+        config.setup_config('http://a.com/index.html', self.folder, 'project', bypass_robots=True)
+        self.pool = ParsePool(2)
+        self.addCleanup(self.pool.shutdown)
+
+    def tearDown(self):
+        config.reset_config()
+
+    def test_portable(self):
+        handler = type('AnchorTagHandler', (AnchorTagHandler,), {'crawler': object()})
+        self.assertIs(_portable(handler), AnchorTagHandler)
+        self.assertIs(_portable(ImgTag), ImgTag)
+
+    def test_overrides(self):
+        handler = type('AnchorTagHandler', (AnchorTagHandler,), {'crawler': object()})
+        self.assertEqual(_overrides(handler), set())
+        self.assertEqual(_overrides(ImgTag), set())
+
+        class Page(WebPage):
+            def __parse__(self):
+                pass
+
+        self.assertEqual(_overrides(Page), {'__parse__'})
+
+    def test_parsed_in_thread_if_not_portable(self):
+        class Page(WebPage):
+            parsed_here = False
+
+            def __parse__(self):
+                Page.parsed_here = True
+                return super(Page, self).__parse__()
+
+        self.assertTrue(self.pool.can_parse(WebPage))
+        self.assertFalse(self.pool.can_parse(Page))
+
+        wp = Page()
+        wp.set_source(BytesIO(HTML), 'utf-8', 'http://a.com/index.html')
+        with mock.patch.object(self.pool, 'submit', side_effect=AssertionError):
+            wp.parse_in_pool(self.pool)
+        self.assertTrue(Page.parsed_here)
+        self.assertEqual(len(list(wp)), 3)
+
+    def test_canonical_copies(self):
+        config['dedupe_files'] = True
+        wp = WebPage()
+        wp.set_source(BytesIO(HTML), 'utf-8', 'http://a.com/index.html')
+        wp.__parse__()
+        logo = [f for f in wp if f.tag == 'img'][0].file_path
+
+        # duplicates found after the processes are forked are linked too
+        self.pool.start()
+        CONTENT_STORE.set_aliases({logo: os.path.join(os.path.dirname(logo), 'sprite.png')})
+        self.addCleanup(CONTENT_STORE.clear)
+        html, _ = self.pool.parse('http://a.com/index.html', HTML, 'utf-8')
+        self.assertIn(b'sprite.png', html)
+
+    def test_same_as_in_thread(self):
+        wp = WebPage()
+        wp.set_source(BytesIO(HTML), 'utf-8', 'http://a.com/index.html')
+        wp.__parse__()
+        out = BytesIO()
+        wp.root.getroottree().write(out, method='html')
+
+        html, links = self.pool.parse('http://a.com/index.html', HTML, 'utf-8')
+        self.assertEqual(html[html.index(b'<head>'):], out.getvalue()[out.getvalue().index(b'<head>'):])
+        self.assertEqual(links, sorted(set((f.tag, f.url) for f in wp)))
+
+    def test_save_html(self):
+        wp = WebPage()
+        wp.set_source(BytesIO(HTML), 'utf-8', 'http://a.com/index.html')
+        wp.parse_in_pool(self.pool)
+
+        self.assertIsNone(wp.root)
+        self.assertEqual(sorted(f.url for f in wp), ['http://a.com/about.html',
+                                                     'http://a.com/css/style.css',
+                                                     'http://a.com/img/logo.png'])
+        wp.save_html(wp.utx.file_path)
+        with open(wp.utx.file_path, 'rb') as fh:
+            saved = fh.read()
+        self.assertIn(b'AerWebCopy', saved)
+        self.assertNotIn(b'"img/logo.png"', saved)
+        self.assertIn(b'__logo.png"', saved)
+
+    def test_links_without_file_names(self):
+        html = b''.join(b'<img src="/avatar%d/">' % i for i in range(3))
+        # the calling process names other files after the processes are forked
+        self.pool.start()
+        ImgTag('/avatar/', 'http://a.com/').file_path
+        wp = WebPage()
+        wp.set_source(BytesIO(html), 'utf-8', 'http://a.com/index.html')
+        wp.parse_in_pool(self.pool)
+        wp.save_html(wp.utx.file_path)
+        with open(wp.utx.file_path, 'rb') as fh:
+            saved = fh.read()
+
+        files = [f for f in wp if f.tag == 'img']
+        self.assertEqual(len(files), 3)
+        for f in files:
+            # the html links to the very files which are downloaded
+            self.assertIn(relate(f.file_path, wp.utx.file_path).encode(), saved)
+
+    def test_configured(self):
+        self.assertIsNone(parse_pool())
+        config['parse_processes'] = 1
+        pool = parse_pool()
+        self.assertEqual(pool.processes, 1)
+        self.assertIs(parse_pool(), pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,139 @@
+import os
+import re
+import tempfile
 import unittest
+from io import BytesIO
+from unittest import mock
+
 import pywebcopy.parsers as pkg
 import pywebcopy.exceptions as exc
+from pywebcopy.urls import URLTransformer
+
+
+TEST_HTML = os.path.join(os.path.dirname(__file__), 'test.html')
+
+
+class _Parser(pkg.BaseIncrementalParser):
+    """Parser of an in memory source."""
+    utx = None
+
+    def get_source(self):
+        return self._source
+
+    def set_source(self, source, encoding=None, base_url=None):
+        self._source = source
+        self.encoding = encoding
+
+
+def _parser(html, url='http://a.com/dir/page.html'):
+    p = _Parser()
+    p.set_source(BytesIO(html), 'utf-8')
+    p.utx = URLTransformer(url, base_url=url, base_path=os.path.join(tempfile.gettempdir(), 'project'))
+    return p
+
+
+def _without_mark(html):
+    return re.sub(br'<!--\s+\* AerWebCopy.*?-->', b'', html, flags=re.S)
 
 
 class TestParser(unittest.TestCase):
-    pass
+    def _handled(self, html):
+        calls = []
+        p = _parser(html)
+        p.handle = lambda el, attr, url, pos: calls.append((el.tag, attr, url, pos))
+        p.__parse__()
+        return calls
+
+    def test_link_dispatch(self):
+        dispatch = pkg._link_dispatch
+        self.assertEqual(dispatch('div', ('class', 'id'), pkg.link_attrs, pkg.list_link_attrs), ())
+        self.assertEqual(dispatch('img', ('src', 'alt', 'srcset', 'style'), pkg.link_attrs, pkg.list_link_attrs),
+                         (('src', 'single'), ('srcset', 'list'), ('style', 'style')))
+        self.assertEqual(dispatch('object', ('data', 'src'), pkg.link_attrs, pkg.list_link_attrs),
+                         ((None, 'object'),))
+        self.assertEqual(dispatch('style', (), pkg.link_attrs, pkg.list_link_attrs), ((None, 'text'),))
+
+    def test_links_of_every_kind(self):
+        calls = self._handled(
+            b'<html><head><meta http-equiv="Refresh" content="5; url=r.html">'
+            b'<meta name="x" content="y.html"><style>a{background:url(y.png)}</style></head>'
+            b'<body><div class="a"><p>text</p></div><!-- c -->'
+            b'<object codebase="http://c.com/" data="o.swf" archive="a.jar"></object>'
+            b'<param valuetype="REF" value="v.bin"><param valuetype="data" value="w.bin">'
+            b'<p style="background:url(z.png)">s</p><form action="f.php"></form>'
+            b'<img src="i.png" data-srcset="d1.png 1x, d2.png 2x"></body></html>')
+        self.assertEqual(sorted(calls, key=repr), sorted([
+            ('meta', 'content', 'r.html', 7),
+            ('style', None, 'y.png', 17),
+            ('object', 'codebase', 'http://c.com/', 0),
+            ('object', 'data', 'http://c.com/o.swf', 0),
+            ('object', 'archive', 'http://c.com/a.jar', 0),
+            ('param', 'value', 'v.bin', 0),
+            ('p', 'style', 'z.png', 15),
+            ('form', 'action', 'f.php', 0),
+            ('img', 'src', 'i.png', 0),
+            ('img', 'data-srcset', 'd2.png', 11),
+            ('img', 'data-srcset', 'd1.png', 0),
+        ], key=repr))
+
+
+class TestStreamingParse(unittest.TestCase):
+    def setUp(self):
+        with open(TEST_HTML, 'rb') as fh:
+            self.html = fh.read()
+
+    def _tree(self, html):
+        p = _parser(html)
+        p.__parse__()
+        out = BytesIO()
+        p.root.getroottree().write(out, method='html')
+        return p, out.getvalue()
+
+    def _streamed(self, html):
+        p = _parser(html)
+        out = BytesIO()
+        p.__stream__(out)
+        return p, out.getvalue()
+
+    def test_same_output_as_tree(self):
+        tree, expected = self._tree(self.html)
+        streamed, out = self._streamed(self.html)
+
+        self.assertEqual(_without_mark(out), _without_mark(expected))
+        self.assertIn(b'AerWebCopy', out)
+        self.assertIn(b'@import "css/', out)
+        self.assertNotIn(b'img/img1.png', out)
+        self.assertIsNone(streamed.root)
+
+        self.assertEqual(sorted(f.url for f in streamed), sorted(f.url for f in tree))
+        # no second parse happens for the collected files
+        self.assertEqual(len(list(streamed.files())), len(list(tree.files())))
+
+    def test_escaping(self):
+        html = (b'<html><head><script>if (a < b && c) {}</script></head>'
+                b'<body><p title="&quot;x&amp;y&quot;">a &lt; b &amp; c<br>'
+                b'<!-- note --> tail &#169;</p></body></html>')
+        out = _without_mark(self._streamed(html)[1])
+        self.assertTrue(out.endswith(b'<html><head><script>if (a < b && c) {}</script></head>'
+                              b'<body><p title="&quot;x&amp;y&quot;">a &lt; b &amp; c<br>'
+                              b'<!-- note --> tail \xc2\xa9</p></body></html>'))
+
+    def test_elements_are_released(self):
+        html = b'<html><body>' + b'<div><p>text <b>bold</b></p></div>' * 5000 + b'</body></html>'
+        siblings = []
+        end = pkg.HtmlStreamWriter.end
+
+        def count(writer, el):
+            if el.tag == 'div':
+                siblings.append(len(el.getparent()))
+            end(writer, el)
+
+        # written elements are removed from the tree as the parse goes,
+        # only the ones of the chunk being parsed are kept
+        with mock.patch.object(pkg.HtmlStreamWriter, 'end', count):
+            self._streamed(html)
+        self.assertEqual(len(siblings), 5000)
+        self.assertLess(max(siblings), 1000)
 
 
 def main():
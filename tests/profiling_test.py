@@ -0,0 +1,131 @@
+import cProfile
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from benchmarks.server import SiteServer
+from benchmarks.site import SiteShape, generate_site
+from pywebcopy import api, profiling
+from pywebcopy.configs import config
+from pywebcopy.profiling import RunProfiler
+from pywebcopy.workers import POOL
+
+
+def _busy():
+    return sum(i * i for i in range(1000))
+
+
+class TestRunProfiler(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def test_disabled(self):
+        profiler = RunProfiler()
+        profiler.start(self.folder)
+        self.assertFalse(profiler.enabled)
+        with profiler.phase('crawl'):
+            pass
+        self.assertEqual(profiler.stop(), [])
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_threads_profiled(self):
+        profiler = RunProfiler()
+        profiler.start(self.folder, cpu=True)
+        self.addCleanup(threading.setprofile, None)
+        with profiler.phase('crawl'):
+            thread = threading.Thread(target=_busy)
+            thread.start()
+            thread.join()
+            POOL.submit(_busy)
+        written = profiler.stop()
+
+        self.assertEqual([os.path.basename(p) for p in written],
+                         ['phases.json', 'profile.prof', 'profile.txt'])
+        stats = pstats.Stats(os.path.join(self.folder, 'profile.prof'))
+        calls = [v[1] for k, v in stats.stats.items() if k[2] == '_busy']
+        self.assertEqual(calls, [2])
+
+        with open(os.path.join(self.folder, 'phases.json')) as fh:
+            phases = json.load(fh)
+        self.assertEqual(list(phases), ['crawl', 'other', 'total'])
+        self.assertGreaterEqual(phases['total'], phases['crawl'])
+
+    def test_thread_profiler_unavailable(self):
+        # a profiler of a thread can not be enabled while another tool is active
+        main = threading.current_thread()
+
+        class Profile(cProfile.Profile):
+            def enable(self, *args, **kwargs):
+                if threading.current_thread() is not main:
+                    raise ValueError('Another profiling tool is already active')
+                return super(Profile, self).enable(*args, **kwargs)
+
+        results = []
+        profiler = RunProfiler()
+        with mock.patch.object(profiling, '_PER_THREAD', True), \
+                mock.patch.object(profiling.cProfile, 'Profile', Profile):
+            profiler.start(self.folder, cpu=True)
+            self.addCleanup(threading.setprofile, None)
+            thread = threading.Thread(target=lambda: results.append(_busy()))
+            thread.start()
+            thread.join()
+            written = profiler.stop()
+
+        self.assertEqual(results, [_busy()])
+        self.assertFalse(profiler.threads_profiled)
+        self.assertEqual([os.path.basename(p) for p in written],
+                         ['phases.json', 'profile.prof', 'profile.txt'])
+
+    def test_single_profiler(self):
+        profiler = RunProfiler()
+        with mock.patch.object(profiling, '_PER_THREAD', False):
+            profiler.start(self.folder, cpu=True)
+            self.addCleanup(threading.setprofile, None)
+            self.assertIsNone(getattr(threading, '_profile_hook', None))
+            written = profiler.stop()
+        self.assertEqual([os.path.basename(p) for p in written][0], 'phases.json')
+
+    def test_memory(self):
+        profiler = RunProfiler()
+        profiler.start(self.folder, memory=True)
+        kept = [bytearray(1024) for _ in range(100)]
+        written = profiler.stop()
+
+        self.assertEqual([os.path.basename(p) for p in written], ['phases.json', 'memory.txt'])
+        with open(written[1]) as fh:
+            report = fh.read()
+        self.assertIn('peak', report)
+        self.assertIn('profiling_test.py', report)
+        del kept
+
+
+class TestProfiledRun(unittest.TestCase):
+    def setUp(self):
+        self.site = tempfile.mkdtemp()
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.site)
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.addCleanup(os.chdir, os.getcwd())
+        self.addCleanup(config.reset_config)
+        generate_site(self.site, SiteShape(pages=3, assets=2, css_depth=1, page_size=2048))
+
+    def test_save_website(self):
+        with SiteServer(self.site) as server, mock.patch.object(api, 'open_new_tab'):
+            api.save_website(server.url, self.folder, 'proj', bypass_robots=True,
+                             zip_project_folder=False, profile=True, trace_memory=True)
+
+        project = os.path.join(self.folder, 'proj')
+        for name in ('phases.json', 'profile.prof', 'profile.txt', 'memory.txt'):
+            self.assertTrue(os.path.isfile(os.path.join(project, name)), name)
+        with open(os.path.join(project, 'phases.json')) as fh:
+            self.assertEqual(list(json.load(fh)), ['crawl', 'downloads', 'other', 'total'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+import pywebcopy.robots as robots_module
+from pywebcopy.robots import RobotsRegistry
+
+
+class _Response(object):
+    def __init__(self, url, text, status=200):
+        self.url = url
+        self.text = text
+        self.status_code = status
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+
+class _Fetcher(object):
+    """Serves a robots.txt per host and records the fetched urls."""
+
+    sites = {
+        'http://a.com/robots.txt': 'User-agent: *\nCrawl-delay: 2\nDisallow: /private/\n'
+                                   'Allow: /private/open/',
+        'http://b.com/robots.txt': 'User-agent: *\nDisallow: /',
+    }
+
+    def __init__(self):
+        self.fetched = []
+        self.errors = {}
+
+    def __call__(self, url):
+        self.fetched.append(url)
+        if url in self.errors:
+            return _Response(url, '', self.errors[url])
+        if url not in self.sites:
+            return _Response(url, '', 404)
+        return _Response(url, self.sites[url])
+
+
+class TestRobotsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.fetch = _Fetcher()
+        self.robots = RobotsRegistry('*', fetch=self.fetch)
+
+    def test_rules_per_host(self):
+        self.assertTrue(self.robots.can_fetch('http://a.com/page.html'))
+        self.assertFalse(self.robots.can_fetch('http://a.com/private/page.html'))
+        self.assertFalse(self.robots.can_fetch('http://b.com/page.html'))
+        self.assertTrue(self.robots.can_fetch('http://c.com/private/page.html'))
+
+        self.assertEqual(self.robots.request_interval('http://a.com/'), 2.0)
+        self.assertEqual(self.robots.request_interval('http://b.com/'), 0.0)
+
+    def test_fetched_once_per_host(self):
+        for i in range(10):
+            self.robots.can_fetch('http://a.com/page%d.html' % i)
+            self.robots.can_fetch('http://A.com/private/%d' % i)
+        self.assertEqual(self.fetch.fetched, ['http://a.com/robots.txt'])
+
+    def test_fresh(self):
+        self.assertFalse(self.robots.fresh('http://a.com/page.html'))
+        self.robots.can_fetch('http://a.com/page.html')
+        self.assertTrue(self.robots.fresh('http://a.com/other.html'))
+        self.robots.ttl = -1
+        self.assertFalse(self.robots.fresh('http://a.com/page.html'))
+
+    def test_decisions_per_rule_prefix(self):
+        self.assertFalse(self.robots.can_fetch('http://a.com/private/a'))
+        self.assertFalse(self.robots.can_fetch('http://a.com/private/b'))
+        # the first matching rule wins, like in the standard library parser
+        self.assertFalse(self.robots.can_fetch('http://a.com/private/open/c'))
+        self.assertTrue(self.robots.can_fetch('http://a.com/public/d'))
+        self.assertTrue(self.robots.can_fetch('http://a.com/e'))
+
+        decisions = self.robots.rules('http://a.com/').decisions
+        self.assertEqual(decisions, {'/private/open/': False, '/private/': False, '': True})
+
+    def test_ttl(self):
+        robots = RobotsRegistry('*', ttl=-1, fetch=self.fetch)
+        robots.can_fetch('http://a.com/')
+        robots.can_fetch('http://a.com/')
+        self.assertEqual(len(self.fetch.fetched), 2)
+
+    def test_stored_rules(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        path = os.path.join(folder, 'robots.json')
+
+        robots = RobotsRegistry('*', ttl=60, path=path, fetch=self.fetch)
+        self.assertFalse(robots.can_fetch('http://b.com/'))
+        self.assertTrue(robots.can_fetch('http://missing.com/'))
+        self.assertTrue(os.path.exists(path))
+
+        fetch = _Fetcher()
+        robots = RobotsRegistry('*', ttl=60, path=path, fetch=fetch)
+        self.assertFalse(robots.can_fetch('http://b.com/'))
+        self.assertTrue(robots.can_fetch('http://missing.com/'))
+        self.assertEqual(fetch.fetched, [])
+
+        # expired rules are fetched again
+        robots = RobotsRegistry('*', ttl=-1, path=path, fetch=fetch)
+        robots.can_fetch('http://b.com/')
+        self.assertEqual(fetch.fetched, ['http://b.com/robots.txt'])
+
+    def test_server_error(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        path = os.path.join(folder, 'robots.json')
+        self.fetch.errors['http://a.com/robots.txt'] = 503
+
+        robots = RobotsRegistry('*', ttl=3600, path=path, fetch=self.fetch)
+        self.assertFalse(robots.can_fetch('http://a.com/page.html'))
+        self.assertFalse(robots.can_fetch('http://a.com/other.html'))
+        self.assertEqual(self.fetch.fetched, ['http://a.com/robots.txt'])
+        # a temporary failure is not stored for the later crawls
+        self.assertFalse(os.path.exists(path))
+
+        # and it is read again soon, unlike the rules which are kept for the ttl
+        del self.fetch.errors['http://a.com/robots.txt']
+        with mock.patch.object(robots_module, 'RETRY_UNAVAILABLE', -1):
+            self.assertTrue(robots.can_fetch('http://a.com/page.html'))
+        self.assertEqual(len(self.fetch.fetched), 2)
+        self.assertTrue(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import threading
+import time
+import unittest
+
+import requests
+from six.moves.urllib.parse import urlsplit
+
+from pywebcopy.configs import SESSION
+from pywebcopy.robots import RobotsRegistry
+from pywebcopy.scheduler import HostScheduler
+from pywebcopy.structures import RobotsTxtParser
+from pywebcopy.workers import WorkerPool
+
+
+class _Delays(object):
+    """Robots registry which asks for a delay between requests per host."""
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    def fresh(self, url):
+        return True
+
+    def request_interval(self, url):
+        return self.delays.get(urlsplit(url).netloc, 0)
+
+
+class TestHostScheduler(unittest.TestCase):
+    def test_round_robin_over_hosts(self):
+        pool = WorkerPool(max_workers=1, max_queue_size=10)
+        scheduler = HostScheduler(pool=pool, max_per_host=0)
+        order = []
+
+        # hold the dispatcher back until every task is queued
+        with scheduler._cond:
+            for url in ('http://a.com/1', 'http://a.com/2', 'http://a.com/3',
+                        'http://b.com/1', 'http://b.com/2', 'http://c.com/1'):
+                scheduler.submit(url, order.append, url)
+
+        self.assertTrue(scheduler.join(timeout=10))
+        self.assertEqual(order, ['http://a.com/1', 'http://b.com/1', 'http://c.com/1',
+                                 'http://a.com/2', 'http://b.com/2', 'http://a.com/3'])
+        pool.shutdown()
+
+    def test_running_tasks_per_host_are_capped(self):
+        pool = WorkerPool(max_workers=6, max_queue_size=10)
+        scheduler = HostScheduler(pool=pool, max_per_host=2)
+        lock = threading.Lock()
+        running = {}
+        peak = {}
+
+        def task(host):
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), running[host])
+            time.sleep(0.01)
+            with lock:
+                running[host] -= 1
+
+        for i in range(10):
+            for host in ('a.com', 'b.com'):
+                scheduler.submit('http://%s/%d' % (host, i), task, host)
+
+        self.assertTrue(scheduler.join(timeout=10))
+        self.assertEqual(peak, {'a.com': 2, 'b.com': 2})
+        pool.shutdown()
+
+    def test_future_result(self):
+        pool = WorkerPool(max_workers=1, max_queue_size=1)
+        scheduler = HostScheduler(pool=pool)
+        future = scheduler.submit('http://a.com/', sum, [1, 2])
+        self.assertEqual(future.result(timeout=5), 3)
+        pool.shutdown()
+
+    def test_delayed_host_does_not_hold_workers(self):
+        self.addCleanup(setattr, SESSION, 'robots', SESSION.robots)
+        self.addCleanup(SESSION._next_request.clear)
+        SESSION.robots = _Delays({'slow.com': 0.3})
+
+        pool = WorkerPool(max_workers=1, max_queue_size=1)
+        scheduler = HostScheduler(pool=pool, max_per_host=0)
+        start = time.monotonic()
+        done = {}
+
+        def task(url):
+            # the turn is reserved already, thus the session does not sleep
+            SESSION._wait_for_turn(url)
+            done[url] = time.monotonic() - start
+
+        with scheduler._cond:
+            for i in range(3):
+                for host in ('slow.com', 'fast.com'):
+                    url = 'http://%s/%d' % (host, i)
+                    scheduler.submit(url, task, url)
+
+        self.assertTrue(scheduler.join(timeout=10))
+        pool.shutdown()
+        fast = [done['http://fast.com/%d' % i] for i in range(3)]
+        slow = [done['http://slow.com/%d' % i] for i in range(3)]
+        self.assertLess(max(fast), 0.2)
+        self.assertGreaterEqual(slow[1] - slow[0], 0.25)
+        self.assertGreaterEqual(slow[2] - slow[1], 0.25)
+        self.assertLess(slow[2], 1.0)
+
+    def test_reserved_turn_is_not_waited_for(self):
+        self.addCleanup(setattr, SESSION, 'robots', SESSION.robots)
+        self.addCleanup(SESSION._next_request.clear)
+        SESSION.robots = _Delays({'slow.com': 5})
+
+        self.assertEqual(SESSION.reserve_turn('http://slow.com/1'), (0, True))
+        ready_in, reserved = SESSION.reserve_turn('http://slow.com/2')
+        self.assertFalse(reserved)
+        self.assertGreater(ready_in, 4)
+
+        start = time.monotonic()
+        with SESSION.reserved_turn('http://slow.com/1'):
+            SESSION._wait_for_turn('http://slow.com/1')
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_expired_robots_are_not_read_while_reserving(self):
+        self.addCleanup(setattr, SESSION, 'robots', SESSION.robots)
+        self.addCleanup(SESSION._next_request.clear)
+        fetched = []
+
+        def fetch(url, **kwargs):
+            fetched.append(url)
+            raise requests.exceptions.ConnectionError(url)
+
+        SESSION.robots = RobotsRegistry('*', ttl=-1, fetch=fetch)
+        SESSION.robots.can_fetch('http://a.com/1')
+        # the scheduler reserves turns while holding its lock
+        self.assertEqual(SESSION.reserve_turn('http://a.com/2'), (0, False))
+        self.assertEqual(fetched, ['http://a.com/robots.txt'])
+
+
+class TestRobotsRequestInterval(unittest.TestCase):
+    def parser(self, *lines):
+        robots = RobotsTxtParser('*', 'http://a.com/robots.txt')
+        robots.parse(list(lines))
+        return robots
+
+    def test_crawl_delay(self):
+        robots = self.parser('User-agent: *', 'Crawl-delay: 2', 'Disallow: /private/')
+        self.assertEqual(robots.request_interval(), 2.0)
+
+    def test_request_rate(self):
+        robots = self.parser('User-agent: *', 'Request-rate: 1/5', 'Crawl-delay: 1')
+        self.assertEqual(robots.request_interval(), 5.0)
+
+    def test_no_rules(self):
+        robots = self.parser('User-agent: *', 'Disallow: /private/')
+        self.assertEqual(robots.request_interval(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,13 @@
+import os
 import unittest
+from unittest import mock
 
 from six.moves.urllib import parse as urlparse
 from six.moves.urllib.request import url2pathname
 
 import pywebcopy.structures as structures
 import pywebcopy.urls as urls
+from pywebcopy.configs import config
 
 
 class TestCaseInsensitiveDict(unittest.TestCase):
@@ -65,11 +68,84 @@ class TestUrl(unittest.TestCase):
         self.assertEqual(obj.to_path, 'e:\\tests\\some-site.com\\some\\rel\\path\\')
         self.assertEqual(obj.file_path, url2pathname('e://tests/some-site.com/some/rel/path/index.html').lower())
 
+    def test_derived_values_follow_inputs(self):
+        obj = urls.URLTransformer('img/a.png', base_url='http://some-site.com/x/', base_path='p')
+        self.assertFalse(hasattr(obj, '__dict__'))
+        path = obj.file_path
+        self.assertIs(obj.file_path, path)
+        self.assertEqual(obj.url, 'http://some-site.com/x/img/a.png')
+
+        obj.base_url = 'http://other-site.com/'
+        self.assertEqual(obj.url, 'http://other-site.com/img/a.png')
+        self.assertTrue(obj.file_path.startswith(os.path.join('p', 'other-site.com')))
+
+        obj.default_fileext = 'jpg'
+        obj.check_fileext = True
+        self.assertTrue(obj.file_path.endswith('a.jpg'))
+
+        obj.original_url = 'img/b.png'
+        self.assertEqual(obj.url, 'http://other-site.com/img/b.png')
+        self.assertTrue(obj.file_path.endswith('b.jpg'))
+
+    def test_default_filename(self):
+        first = urls.URLTransformer('/avatar/', base_url='http://some-site.com/')
+        second = urls.URLTransformer('/avatar/', base_url='http://some-site.com/')
+        other = urls.URLTransformer('/avatar2/', base_url='http://some-site.com/')
+        self.assertTrue(first.file_name.startswith('file_'))
+        self.assertEqual(first.file_path, second.file_path)
+        self.assertNotEqual(first.file_name, other.file_name)
+
+    def test_canonical_url(self):
+        config['canonicalize_urls'] = True
+        self.addCleanup(config.reset_config)
+        obj = urls.URLTransformer('./b/../c?utm_source=x&z=1&a=2#frag', base_url='HTTP://Host:80/a/')
+        self.assertEqual(obj.url, 'http://host/a/c?a=2&z=1')
+
+    def test_canonicalizer_follows_config(self):
+        config['canonicalize_urls'] = True
+        self.addCleanup(config.reset_config)
+        with mock.patch.object(urls, 'URLCanonicalizer', wraps=urls.URLCanonicalizer) as made:
+            self.assertEqual(urls.canonicalize('http://a.com/?b=1&a=2'), 'http://a.com/?a=2&b=1')
+            urls.canonicalize('http://a.com/x')
+            self.assertEqual(made.call_count, 1)
+
+            config['strip_query_params'] = ['b']
+            self.assertEqual(urls.canonicalize('http://a.com/?b=1&a=2'), 'http://a.com/?a=2')
+            self.assertEqual(made.call_count, 2)
+
+        config['canonicalize_urls'] = False
+        self.assertEqual(urls.canonicalize('http://A.com/?b=1'), 'http://A.com/?b=1')
+
     def test_clean_url(self):
         pass
 
     def test_clean_fn(self):
         pass
 
+class TestURLCanonicalizer(unittest.TestCase):
+    def setUp(self):
+        self.canonical = urls.URLCanonicalizer(['utm_*', 'fbclid'])
+
+    def test_same_resource(self):
+        self.assertEqual(self.canonical('http://Host:80/a/./b?utm_source=x#frag'), 'http://host/a/b')
+        self.assertEqual(self.canonical('https://host:443'), 'https://host/')
+        self.assertEqual(self.canonical('https://host:8443/a/b/../c/.'), 'https://host:8443/a/c/')
+        self.assertEqual(self.canonical('http://host/../../a/%7ex'), 'http://host/a/%7Ex')
+
+    def test_query(self):
+        self.assertEqual(self.canonical('http://h/p?b=2&fbclid=1&a=1&UTM_medium=m'), 'http://h/p?a=1&b=2')
+        unsorted = urls.URLCanonicalizer(sort_query=False, keep_fragment=True)
+        self.assertEqual(unsorted('http://h/p?b=2&a=1#f'), 'http://h/p?b=2&a=1#f')
+
+    def test_other_schemes(self):
+        for url in ('mailto:a@b.com', 'data:image/png;base64,AAAA', 'javascript:void(0)', ''):
+            self.assertEqual(self.canonical(url), url)
+
+    def test_many(self):
+        self.assertEqual(self.canonical.many(['http://a.com/x?b=1&a=2', 'http://A.com/x?a=2&b=1',
+                                              'http://a.com/y']),
+                         ['http://a.com/x?a=2&b=1', 'http://a.com/y'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pywebcopy.visited import (
+    MemoryVisitedStore, FingerprintVisitedStore, SQLiteVisitedStore, new_visited_store
+)
+
+
+class _StoreTests(object):
+    def new_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.new_store()
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_add_once(self):
+        self.assertTrue(self.store.add('http://example.com/'))
+        self.assertFalse(self.store.add('http://example.com/'))
+        self.assertIn('http://example.com/', self.store)
+        self.assertNotIn('http://example.com/other', self.store)
+        self.assertEqual(len(self.store), 1)
+
+    def test_many_urls(self):
+        urls = ['http://example.com/%d' % i for i in range(5000)]
+        self.assertTrue(all(self.store.add(u) for u in urls))
+        self.assertFalse(any(self.store.add(u) for u in urls))
+        self.assertEqual(len(self.store), 5000)
+
+    def test_threads_add_each_url_once(self):
+        urls = ['http://example.com/%d' % i for i in range(500)]
+        added = []
+
+        def work():
+            added.extend(u for u in urls if self.store.add(u))
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(added), sorted(urls))
+
+
+class TestMemoryVisitedStore(_StoreTests, unittest.TestCase):
+    def new_store(self):
+        return MemoryVisitedStore()
+
+
+class TestFingerprintVisitedStore(_StoreTests, unittest.TestCase):
+    def new_store(self):
+        return FingerprintVisitedStore(capacity=4)
+
+
+class TestSQLiteVisitedStore(_StoreTests, unittest.TestCase):
+    def new_store(self):
+        self.folder = tempfile.mkdtemp()
+        return SQLiteVisitedStore(os.path.join(self.folder, 'visited.sqlite'))
+
+    def tearDown(self):
+        super(TestSQLiteVisitedStore, self).tearDown()
+        self.assertEqual(os.listdir(self.folder), [])
+        shutil.rmtree(self.folder)
+
+
+class TestNewVisitedStore(unittest.TestCase):
+    def test_kinds(self):
+        self.assertIsInstance(new_visited_store(kind='memory'), MemoryVisitedStore)
+        self.assertIsInstance(new_visited_store(kind='fingerprint'), FingerprintVisitedStore)
+        with self.assertRaises(ValueError):
+            new_visited_store(kind='unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
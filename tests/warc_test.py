@@ -0,0 +1,173 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from io import BytesIO
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import pywebcopy.core as core
+from pywebcopy.configs import AccessAwareSession, config
+from pywebcopy.warc import WarcWriter, close_warc_writer, lookup, read_record, surt
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves a gzip encoded stylesheet."""
+    body = b'body { color: red }'
+
+    def do_GET(self):
+        data = gzip.compress(self.body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/css; charset=utf-8')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _UnsizedHandler(BaseHTTPRequestHandler):
+    """Serves a body without a content-length."""
+    body = b'x' * 100000
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWarcWriter(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        config.reset_config()
+        shutil.rmtree(self.folder)
+
+    def test_surt(self):
+        self.assertEqual(surt('https://www.Example.com/a/b?x=1'), 'com,example)/a/b?x=1')
+        self.assertEqual(surt('http://sub.example.com'), 'com,example,sub)/')
+
+    def test_records_and_index(self):
+        writer = WarcWriter(self.folder)
+        writer.write_exchange('http://example.com/a.png', 200, 'OK',
+                              [('Content-Type', 'image/png'), ('Content-Encoding', 'gzip')],
+                              BytesIO(b'png data'), [('User-Agent', 'test')])
+        writer.close()
+
+        names = sorted(os.listdir(self.folder))
+        self.assertEqual(len(names), 2)
+        self.assertTrue(names[0].endswith('.warc.gz'))
+        self.assertEqual(names[1], names[0] + '.cdx')
+
+        # every record is a gzip member of its own
+        with gzip.open(os.path.join(self.folder, names[0])) as fh:
+            data = fh.read()
+        self.assertEqual(data.count(b'WARC/1.0\r\n'), 3)
+        self.assertIn(b'WARC-Type: warcinfo', data)
+        self.assertIn(b'GET /a.png HTTP/1.1\r\nHost: example.com\r\nUser-Agent: test', data)
+
+        record = lookup(self.folder, 'http://example.com/a.png')
+        self.assertTrue(record.startswith(b'WARC/1.0\r\nWARC-Type: response'))
+        self.assertIn(b'HTTP/1.1 200 OK\r\n', record)
+        self.assertNotIn(b'Content-Encoding', record)
+        self.assertTrue(record.endswith(b'Content-Length: 8\r\n\r\npng data\r\n\r\n'))
+        self.assertIsNone(lookup(self.folder, 'http://example.com/b.png'))
+
+        with open(os.path.join(self.folder, names[1])) as fh:
+            fields = fh.readlines()[1].split()
+        self.assertEqual(fields[0], 'com,example)/a.png')
+        self.assertEqual(fields[3:5], ['image/png', '200'])
+        self.assertEqual(read_record(os.path.join(self.folder, names[0]), int(fields[9])), record)
+
+    def test_rolling(self):
+        writer = WarcWriter(self.folder, max_size=1)
+        for i in range(3):
+            writer.write_exchange('http://example.com/%d' % i, 200, 'OK', [],
+                                  BytesIO(os.urandom(64)))
+        writer.close()
+
+        warcs = [n for n in os.listdir(self.folder) if n.endswith('.warc.gz')]
+        self.assertEqual(len(warcs), 3)
+        for i in range(3):
+            self.assertIsNotNone(lookup(self.folder, 'http://example.com/%d' % i))
+
+    def test_lookup_while_written(self):
+        writer = WarcWriter(self.folder)
+        self.addCleanup(writer.close)
+        writer.write_exchange('http://example.com/a b.png', 200, 'OK', [], BytesIO(b'first'))
+        record = lookup(self.folder, 'http://example.com/a b.png')
+        self.assertTrue(record.endswith(b'first\r\n\r\n'))
+        self.assertEqual(lookup(self.folder, 'http://example.com/a%20b.png'), record)
+
+        # the lines added since are read too, the latest record wins
+        writer.write_exchange('http://example.com/a b.png', 200, 'OK', [], BytesIO(b'second'))
+        record = lookup(self.folder, 'http://example.com/a b.png')
+        self.assertTrue(record.endswith(b'second\r\n\r\n'))
+
+    def test_session_records_responses(self):
+        server = HTTPServer(('127.0.0.1', 0), _Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        config['project_folder'] = self.folder
+        config['output_mode'] = 'warc'
+        config['bypass_robots'] = True
+        url = 'http://127.0.0.1:%d/style.css' % server.server_port
+
+        session = AccessAwareSession()
+        resp = session.get(url, stream=True)
+        # the response is still readable after it is recorded
+        self.assertEqual(resp.content, _Handler.body)
+
+        path = os.path.join(self.folder, 'style.css')
+        self.assertEqual(core.write_stream(path, resp), 0)
+        self.assertFalse(os.path.exists(path))
+        close_warc_writer()
+
+        record = lookup(os.path.join(self.folder, 'warc'), url)
+        self.assertIn(b'Content-Type: text/css; charset=utf-8\r\n', record)
+        self.assertTrue(record.endswith(_Handler.body + b'\r\n\r\n'))
+
+    def record(self, handler, path):
+        server = HTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        config['project_folder'] = self.folder
+        config['output_mode'] = 'warc'
+        config['bypass_robots'] = True
+        url = 'http://127.0.0.1:%d/%s' % (server.server_port, path)
+        AccessAwareSession().get(url, stream=True)
+        close_warc_writer()
+        return lookup(os.path.join(self.folder, 'warc'), url)
+
+    def test_too_large_by_content_length(self):
+        config['max_file_size'] = 10
+        record = self.record(_Handler, 'style.css')
+        self.assertIn(b'WARC-Truncated: length\r\n', record)
+        self.assertTrue(record.endswith(b'Content-Length: 0\r\n\r\n\r\n\r\n'))
+
+    def test_too_large_while_drained(self):
+        config['max_file_size'] = 1000
+        record = self.record(_UnsizedHandler, 'file.bin')
+        self.assertIn(b'WARC-Truncated: length\r\n', record)
+        self.assertTrue(record.endswith(b'\r\n\r\n' + b'x' * 1000 + b'\r\n\r\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+
+from pywebcopy.workers import WorkerPool
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_submit_returns_future(self):
+        pool = WorkerPool(max_workers=2, max_queue_size=2)
+        future = pool.submit(sum, [1, 2, 3])
+        self.assertEqual(future.result(timeout=5), 6)
+        pool.shutdown()
+
+    def test_worker_count_is_bounded(self):
+        pool = WorkerPool(max_workers=3, max_queue_size=100)
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def task():
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+
+        for _ in range(30):
+            pool.submit(task)
+        self.assertTrue(pool.join(timeout=10))
+        self.assertLessEqual(state['peak'], 3)
+        self.assertEqual(pool.pending, 0)
+        pool.shutdown()
+
+    def test_nested_submit_does_not_deadlock(self):
+        pool = WorkerPool(max_workers=1, max_queue_size=0)
+        results = []
+
+        def child(i):
+            results.append(i)
+
+        def parent():
+            for i in range(5):
+                pool.submit(child, i)
+
+        pool.submit(parent)
+        self.assertTrue(pool.join(timeout=10))
+        self.assertEqual(sorted(results), [0, 1, 2, 3, 4])
+        pool.shutdown()
+
+    def test_failed_task_is_reported_on_future(self):
+        pool = WorkerPool(max_workers=1, max_queue_size=1)
+        future = pool.submit(int, 'not a number')
+        self.assertIsInstance(future.exception(timeout=5), ValueError)
+        self.assertTrue(pool.join(timeout=5))
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()